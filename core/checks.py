@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+# cache backends whose entries are only seen by the process that wrote them
+LOCAL_CACHE_BACKENDS = {
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+}
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """
+    the response cache versions, the authentication cache, the jwt revocations and the replica pins
+    must reach every worker process, so a deployment needs a cache they share
+    """
+    if settings.CACHES['default']['BACKEND'] in LOCAL_CACHE_BACKENDS:
+        return [Error(
+            'The default cache is local to each process, writes, logouts and revocations made by one '
+            'worker are not seen by the others.',
+            hint='Set CACHE_URL to a redis or memcached server shared by every worker.',
+            id='core.E001',
+        )]
+    return []
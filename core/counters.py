@@ -0,0 +1,47 @@
+from collections import Counter
+
+from django.db.models import Case, Count, F, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce
+
+from .models import Ingredient, Recipe, Tag
+
+# the recipe relation of the models with a recipe_count
+RELATIONS = {Tag: 'tags', Ingredient: 'ingredients'}
+
+
+def _link_field(model):
+    """ the through model of the recipes of the model, and its column pointing to the model """
+    field = Recipe._meta.get_field(RELATIONS[model])
+    return field.remote_field.through, f'{field.m2m_reverse_field_name()}_id'
+
+
+def adjust_recipe_counts(model, deltas):
+    """ add the {id: delta} to the recipe_count of the objects in one UPDATE, with a case per distinct delta """
+    ids_by_delta = {}
+    for pk, delta in deltas.items():
+        if delta:
+            ids_by_delta.setdefault(delta, []).append(pk)
+    if not ids_by_delta:
+        return
+    delta = Case(*(When(id__in=ids, then=Value(delta)) for delta, ids in ids_by_delta.items()), default=Value(0))
+    model.objects.filter(id__in=[pk for ids in ids_by_delta.values() for pk in ids]).update(
+        recipe_count=F('recipe_count') + delta,
+    )
+
+
+def linked_counts(model, recipe_ids):
+    """ the number of the recipes of recipe_ids each object of the model is linked to """
+    through, column = _link_field(model)
+    return Counter(through.objects.filter(recipe_id__in=recipe_ids).values_list(column, flat=True))
+
+
+def uncount_links(model, recipe_ids):
+    """ take the links of the recipes off the recipe_count of the objects, before they are removed """
+    adjust_recipe_counts(model, {pk: -count for pk, count in linked_counts(model, recipe_ids).items()})
+
+
+def actual_recipe_count(model):
+    """ the number of recipes linked to the outer object, as an expression """
+    through, column = _link_field(model)
+    links = through.objects.filter(**{column: OuterRef('pk')}).order_by().values(column).annotate(count=Count('*'))
+    return Coalesce(Subquery(links.values('count')), 0)
@@ -0,0 +1,85 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.permissions import SAFE_METHODS
+
+# whether the queries of the current request may read from a replica
+_replica_reads = ContextVar('replica_reads', default=False)
+
+
+def _pinned_key(user_id):
+    return f'db-pinned:{user_id}'
+
+
+class ReplicaRouter:
+    """
+    send the reads of the code running under replica_reads to a random replica of DATABASE_REPLICAS,
+    and everything else, writes and migrations included, to the primary
+    """
+    def db_for_read(self, model, **hints):
+        if _replica_reads.get() and settings.DATABASE_REPLICAS:
+            return random.choice(settings.DATABASE_REPLICAS)
+        return None
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
+
+
+@contextmanager
+def replica_reads():
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def pin_to_primary(user_id):
+    """
+    read the data of a user from the primary for a while after they wrote, so they read their
+    writes; the pin is kept in the cache, which the workers must share for it to hold on all of
+    them (CACHE_URL, required by check --deploy)
+    """
+    if settings.DATABASE_REPLICAS:
+        cache.set(_pinned_key(user_id), 1, settings.DATABASE_PIN_SECONDS)
+
+
+def reads_from_replica(request):
+    """ whether a request of an authenticated user may read from a replica """
+    return (
+        bool(settings.DATABASE_REPLICAS) and request.method in SAFE_METHODS
+        and cache.get(_pinned_key(request.user.id)) is None
+    )
+
+
+async def areads_from_replica(request):
+    """ reads_from_replica for async views """
+    return (
+        bool(settings.DATABASE_REPLICAS) and request.method in SAFE_METHODS
+        and await cache.aget(_pinned_key(request.user.id)) is None
+    )
+
+
+class ReplicaReadMixin:
+    """ run the safe requests of users who did not write lately on a replica, see ReplicaRouter """
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if reads_from_replica(request):
+            self._replica_reads = _replica_reads.set(True)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        # the thread of a sync request serves the next requests too
+        token = self.__dict__.pop('_replica_reads', None)
+        if token is not None:
+            _replica_reads.reset(token)
+        return super().finalize_response(request, response, *args, **kwargs)
@@ -0,0 +1,30 @@
+import io
+
+from PIL import Image, ImageOps
+
+# modes keeping their transparency in webp, the others are written as rgb
+ALPHA_MODES = {'RGBA', 'LA', 'PA', 'RGBa', 'La'}
+
+
+def render_variants(source, sizes, quality):
+    """
+    the {name: webp bytes} of the image in the source, a path or a file, resized to fit in each
+    {name: box side}, never enlarged; run in the worker processes of the image pool, so it only
+    needs Pillow
+    """
+    with Image.open(source) as image:
+        # decode jpegs at the smallest scale still larger than the biggest variant
+        largest = max(sizes.values())
+        image.draft(None, (largest, largest))
+        image = ImageOps.exif_transpose(image)
+        alpha = image.mode in ALPHA_MODES or (image.mode == 'P' and 'transparency' in image.info)
+        image = image.convert('RGBA' if alpha else 'RGB')
+
+        variants = {}
+        for name, side in sorted(sizes.items(), key=lambda item: -item[1]):
+            # each variant is resized from the previous, larger one
+            image.thumbnail((side, side), Image.Resampling.LANCZOS)
+            buffer = io.BytesIO()
+            image.save(buffer, 'WEBP', quality=quality, method=4)
+            variants[name] = buffer.getvalue()
+        return variants
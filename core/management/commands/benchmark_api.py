@@ -0,0 +1,316 @@
+import io
+import json
+import shutil
+import statistics
+import tempfile
+import time
+from datetime import datetime, timezone
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.client import MULTIPART_CONTENT
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import URLPattern, URLResolver, get_resolver, reverse
+from PIL import Image
+from rest_framework.authtoken.models import Token
+
+from core.models import Ingredient, Recipe, Tag
+
+# the url configurations whose routes are all measured
+URLCONFS = ['recipe_app.urls', 'user.urls']
+PASSWORD = 'benchmarkpassword'
+# the cache the requests are sent with, so nothing the rolled back writes cached is left in the real one
+BENCHMARK_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'benchmark'}}
+
+
+def route_names(urlconf):
+    """ return the names of the routes of an url configuration """
+    names = set()
+    patterns = list(get_resolver(urlconf).url_patterns)
+    while patterns:
+        pattern = patterns.pop()
+        if isinstance(pattern, URLResolver):
+            patterns.extend(pattern.url_patterns)
+        elif isinstance(pattern, URLPattern) and pattern.name:
+            names.add(pattern.name)
+    return names
+
+
+def percentile(timings, percent):
+    if len(timings) == 1:
+        return timings[0]
+    return statistics.quantiles(timings, n=100, method='inclusive')[percent - 1]
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure every route of the recipe and user apps through the test client, on the data of a user '
+        '(see seed_data), and write the latency percentiles, queries per request and throughput to json. '
+        'Writes are rolled back at the end, so the cost of committing them is not measured, and the '
+        'requests use a cache of their own, emptied at the end.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', required=True, help='email of the user whose recipes are requested')
+        parser.add_argument('--requests', type=int, default=50, help='measured requests per route')
+        parser.add_argument('--warmup', type=int, default=3, help='requests per route before measuring')
+        parser.add_argument('--clear-cache', action='store_true', help='empty the cache before every request')
+        parser.add_argument('--output', help='json file for the results, benchmark-<time>.json by default')
+        parser.add_argument('--compare', help='json file of an earlier run to compare the p50 latency with')
+
+    def handle(self, *args, **options):
+        try:
+            self.user = get_user_model().objects.get(email=options['user'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f'User "{options["user"]}" does not exist.')
+        if options['requests'] < 1:
+            raise CommandError('--requests must be positive.')
+        self.options = options
+        started = datetime.now(timezone.utc)
+
+        # the uploaded images go to a directory removed afterwards, and their variants are rendered
+        # in the request, the image pool would store them outside of the rolled back transaction
+        media_root = tempfile.mkdtemp()
+        try:
+            with override_settings(
+                ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'], MEDIA_ROOT=media_root, IMAGE_WORKERS=0,
+                CACHES=BENCHMARK_CACHES,
+            ), transaction.atomic():
+                try:
+                    results = self.run()
+                finally:
+                    cache.clear()
+                transaction.set_rollback(True)
+        finally:
+            shutil.rmtree(media_root, ignore_errors=True)
+
+        report = {
+            'started_at': started.isoformat(),
+            'database': connection.vendor,
+            'user_recipes': self.recipe_count,
+            'requests_per_route': options['requests'],
+            'clear_cache': options['clear_cache'],
+            'routes': results,
+        }
+        output = options['output'] or f'benchmark-{started:%Y%m%d-%H%M%S}.json'
+        with open(output, 'w') as file:
+            json.dump(report, file, indent=2)
+
+        self.print_report(results)
+        if options['compare']:
+            with open(options['compare']) as file:
+                self.print_comparison(json.load(file)['routes'], results)
+        return f'Results written to {output}.'
+
+    def run(self):
+        """ prepare the data the routes need, then measure them in order """
+        token, _ = Token.objects.get_or_create(user=self.user)
+        self.client = Client(HTTP_AUTHORIZATION=f'Token {token.key}')
+        recipes = Recipe.objects.filter(user=self.user)
+        self.recipe_count = recipes.count()
+        self.recipe_ids = list(recipes.order_by('-id').values_list('id', flat=True)[:100])
+        self.tag_ids = list(Tag.objects.filter(user=self.user).values_list('id', flat=True)[:100])
+        self.ingredient_ids = list(Ingredient.objects.filter(user=self.user).values_list('id', flat=True)[:100])
+        if not self.recipe_ids or not self.tag_ids or not self.ingredient_ids:
+            raise CommandError('The user needs recipes, tags and ingredients, create them with seed_data.')
+        self.search = urlencode({'search': Ingredient.objects.get(id=self.ingredient_ids[0]).name})
+        self.next_page = self.client.get(reverse('recipe-list')).json()['next'] or reverse('recipe-list')
+        self.created = {'recipes': [], 'tags': [], 'ingredients': []}
+        self.created_users = []
+        self.access_tokens, self.refresh_tokens = [], []
+
+        results = {}
+        scenarios = self.scenarios()
+        for name, url_name, method, request in scenarios:
+            results[name] = self.measure(url_name, method, request)
+            self.stdout.write(f'{name}: p50 {results[name]["p50_ms"]:.2f}ms')
+
+        measured = {url_name for _, url_name, _, _ in scenarios}
+        for urlconf in URLCONFS:
+            for url_name in sorted(route_names(urlconf) - measured):
+                self.stderr.write(f'No benchmark for the route "{url_name}" of {urlconf}.')
+        return results
+
+    def scenarios(self):
+        """ (name, url name, method, request) of every measured request, a request takes its index """
+        def pick(ids, i):
+            return ids[i % len(ids)]
+
+        def recipe_url(i):
+            return reverse('recipe-detail', args=[pick(self.recipe_ids, i)])
+
+        def new_recipe(i):
+            return {
+                'title': f'benchmark recipe {i}', 'time_minutes': 10, 'price': '9.90',
+                'tags': [{'name': f'benchmark tag {i}'}], 'ingredients': [{'name': f'benchmark ingredient {i}'}],
+            }
+
+        def image(i):
+            buffer = io.BytesIO()
+            Image.new('RGB', (1600, 1200), (i % 256, 120, 60)).save(buffer, 'JPEG')
+            buffer.name = f'benchmark{i}.jpg'
+            buffer.seek(0)
+            return {'image': buffer}, MULTIPART_CONTENT
+
+        return [
+            ('api root', 'api-root', 'get', lambda i: (reverse('api-root'), None)),
+            ('recipe list', 'recipe-list', 'get', lambda i: (reverse('recipe-list'), None)),
+            ('recipe list next page', 'recipe-list', 'get', lambda i: (self.next_page, None)),
+            ('recipe list search', 'recipe-list', 'get', lambda i: (f'{reverse("recipe-list")}?{self.search}', None)),
+            ('recipe list filtered', 'recipe-list', 'get', lambda i: (
+                f'{reverse("recipe-list")}?tags={pick(self.tag_ids, i)}&ingredients={pick(self.ingredient_ids, i)}', None,
+            )),
+            ('recipe detail', 'recipe-detail', 'get', lambda i: (recipe_url(i), None)),
+            ('recipe create', 'recipe-list', 'post', lambda i: (reverse('recipe-list'), new_recipe(i))),
+            ('recipe update', 'recipe-detail', 'patch', lambda i: (recipe_url(i), {'title': f'updated {i}'})),
+            ('recipe replace', 'recipe-detail', 'put', lambda i: (
+                recipe_url(i), {'title': f'replaced {i}', 'time_minutes': 5, 'price': '1.00'},
+            )),
+            ('recipe bulk create', 'recipe-bulk', 'post', lambda i: (
+                reverse('recipe-bulk'), [new_recipe(f'{i}-{n}') for n in range(20)],
+            )),
+            ('recipe bulk update', 'recipe-bulk', 'patch', lambda i: (
+                reverse('recipe-bulk'),
+                [{'id': pk, 'time_minutes': 20} for pk in dict.fromkeys(pick(self.recipe_ids, i + n) for n in range(20))],
+            )),
+            ('async recipe list', 'async-recipe-list', 'get', lambda i: (reverse('async-recipe-list'), None)),
+            ('async recipe detail', 'async-recipe-detail', 'get', lambda i: (
+                reverse('async-recipe-detail', args=[pick(self.recipe_ids, i)]), None,
+            )),
+            ('async tag list', 'async-tag-list', 'get', lambda i: (reverse('async-tag-list'), None)),
+            ('async tag detail', 'async-tag-detail', 'get', lambda i: (
+                reverse('async-tag-detail', args=[pick(self.tag_ids, i)]), None,
+            )),
+            ('async ingredient list', 'async-ingredient-list', 'get', lambda i: (reverse('async-ingredient-list'), None)),
+            ('async ingredient detail', 'async-ingredient-detail', 'get', lambda i: (
+                reverse('async-ingredient-detail', args=[pick(self.ingredient_ids, i)]), None,
+            )),
+            ('recipe image upload', 'recipe-upload-image', 'post', lambda i: (
+                reverse('recipe-upload-image', args=[pick(self.recipe_ids, i)]), image(i),
+            )),
+            ('recipe export', 'recipe-export', 'get', lambda i: (f'{reverse("recipe-export")}?format=ndjson', None)),
+            ('tag list', 'tag-list', 'get', lambda i: (reverse('tag-list'), None)),
+            ('tag update', 'tag-detail', 'patch', lambda i: (
+                reverse('tag-detail', args=[pick(self.created['tags'], i)]), {'name': f'renamed tag {i}'},
+            )),
+            ('tag autocomplete', 'tag-autocomplete', 'get', lambda i: (f'{reverse("tag-autocomplete")}?q=benchmark', None)),
+            ('ingredient list', 'ingredient-list', 'get', lambda i: (reverse('ingredient-list'), None)),
+            ('ingredient autocomplete', 'ingredient-autocomplete', 'get', lambda i: (
+                f'{reverse("ingredient-autocomplete")}?q=benchmark', None,
+            )),
+            ('ingredient update', 'ingredient-detail', 'patch', lambda i: (
+                reverse('ingredient-detail', args=[pick(self.created['ingredients'], i)]), {'name': f'renamed ingredient {i}'},
+            )),
+            # the deletes remove what the creates above added, one object per request
+            ('recipe delete', 'recipe-detail', 'delete', lambda i: (
+                reverse('recipe-detail', args=[self.created['recipes'].pop()]), None,
+            )),
+            ('tag delete', 'tag-detail', 'delete', lambda i: (reverse('tag-detail', args=[self.created['tags'].pop()]), None)),
+            ('ingredient delete', 'ingredient-detail', 'delete', lambda i: (
+                reverse('ingredient-detail', args=[self.created['ingredients'].pop()]), None,
+            )),
+            ('user create', 'create-user', 'post', lambda i: (
+                reverse('create-user'), {'email': f'benchmark{i}@example.com', 'password': PASSWORD, 'name': 'benchmark'},
+            )),
+            ('user token', 'token', 'post', lambda i: (
+                reverse('token'), {'email': pick(self.created_users, i), 'password': PASSWORD},
+            )),
+            ('user token jwt', 'token', 'post', lambda i: (
+                reverse('token'), {'email': pick(self.created_users, i), 'password': PASSWORD, 'mode': 'jwt'},
+            )),
+            ('recipe list jwt', 'recipe-list', 'get', lambda i: (
+                reverse('recipe-list'), None, {'HTTP_AUTHORIZATION': f'Bearer {self.access_tokens[-1]}'},
+            )),
+            # every refresh revokes the token it is given and returns a new pair
+            ('user token refresh', 'token-refresh', 'post', lambda i: (
+                reverse('token-refresh'), {'refresh': self.refresh_tokens.pop()},
+            )),
+            ('user token revoke', 'token-revoke', 'post', lambda i: (
+                reverse('token-revoke'), {'refresh': self.refresh_tokens.pop()},
+            )),
+            ('user me', 'me', 'get', lambda i: (reverse('me'), None)),
+            ('user me update', 'me', 'patch', lambda i: (reverse('me'), {'name': f'benchmark {i}'})),
+        ]
+
+    def measure(self, url_name, method, request):
+        """ send the requests of a route and return their statistics """
+        timings, queries, statuses = [], [], {}
+        total = self.options['warmup'] + self.options['requests']
+        for i in range(total):
+            # a request may also give the headers it is sent with
+            path, data, *headers = request(i)
+            if self.options['clear_cache']:
+                cache.clear()
+            send = getattr(self.client, method)
+            # data is sent as json, unless it comes with its content type
+            if data is None:
+                args = (path,)
+            elif isinstance(data, tuple):
+                args = (path, *data)
+            else:
+                args = (path, json.dumps(data), 'application/json')
+            with CaptureQueriesContext(connection) as context:
+                start = time.perf_counter()
+                response = send(*args, **(headers[0] if headers else {}))
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                elapsed = time.perf_counter() - start
+            self.collect(response)
+            if i < self.options['warmup']:
+                continue
+            timings.append(elapsed * 1000)
+            queries.append(len(context))
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+        return {
+            'route': url_name,
+            'method': method.upper(),
+            'requests': len(timings),
+            'statuses': statuses,
+            'p50_ms': percentile(timings, 50),
+            'p95_ms': percentile(timings, 95),
+            'p99_ms': percentile(timings, 99),
+            'mean_ms': statistics.fmean(timings),
+            'queries': statistics.fmean(queries),
+            'requests_per_second': len(timings) / (sum(timings) / 1000),
+        }
+
+    def collect(self, response):
+        """ keep the objects, users and jwts created by a request, for the routes that use them """
+        if response.status_code not in (200, 201) or response.streaming:
+            return
+        data = response.json()
+        if isinstance(data, dict) and 'refresh' in data:
+            self.access_tokens.append(data['access'])
+            self.refresh_tokens.append(data['refresh'])
+            return
+        if response.status_code != 201:
+            return
+        for recipe in data if isinstance(data, list) else [data]:
+            if 'email' in recipe:
+                self.created_users.append(recipe['email'])
+                continue
+            self.created['recipes'].append(recipe['id'])
+            self.created['tags'].extend(tag['id'] for tag in recipe['tags'])
+            self.created['ingredients'].extend(ingredient['id'] for ingredient in recipe['ingredients'])
+
+    def print_report(self, results):
+        self.stdout.write(f'\n{"route":<28}{"p50":>9}{"p95":>9}{"p99":>9}{"queries":>9}{"req/s":>9}')
+        for name, result in results.items():
+            self.stdout.write(
+                f'{name:<28}{result["p50_ms"]:>9.2f}{result["p95_ms"]:>9.2f}{result["p99_ms"]:>9.2f}'
+                f'{result["queries"]:>9.1f}{result["requests_per_second"]:>9.0f}'
+            )
+
+    def print_comparison(self, before, after):
+        self.stdout.write(f'\n{"route":<28}{"p50 before":>12}{"p50 after":>12}{"change":>9}')
+        for name, result in after.items():
+            if name not in before:
+                continue
+            old, new = before[name]['p50_ms'], result['p50_ms']
+            self.stdout.write(f'{name:<28}{old:>12.2f}{new:>12.2f}{(new - old) / old:>9.0%}')
@@ -0,0 +1,87 @@
+import sys
+import time
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from core.management.recipe_writer import FIELDS, RecipeWriter
+from core.models import Recipe, Tag
+from core.renderers import loads
+from recipe_app.cache import bump_version
+
+
+class Command(BaseCommand):
+    help = 'Import recipes of a user from a json lines file, like the one written by the ndjson export'
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help='json lines file, or - to read the standard input')
+        parser.add_argument('--user', required=True, help='email of the owner of the recipes')
+        parser.add_argument('--batch-size', type=int, default=5000, help='recipes written per transaction')
+        parser.add_argument('--offset', type=int, default=0, help='lines to skip, to resume an interrupted import')
+
+    def handle(self, *args, **options):
+        try:
+            self.user = get_user_model().objects.get(email=options['user'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f'User "{options["user"]}" does not exist.')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive.')
+        if options['offset'] < 0:
+            raise CommandError('--offset must not be negative.')
+
+        self.writer = RecipeWriter(self.user)
+        self.valid_names = set()
+
+        stream = sys.stdin if options['file'] == '-' else open(options['file'], encoding='utf-8')
+        with stream:
+            imported = self.import_lines(stream, options['offset'], options['batch_size'])
+        bump_version(self.user.id)
+
+        return f'Imported {imported} recipes.'
+
+    def import_lines(self, stream, offset, batch_size):
+        """ write the lines after the offset batch by batch, reporting the throughput """
+        lines = enumerate(islice(stream, offset, None), start=offset + 1)
+        imported = 0
+        start = time.perf_counter()
+        while batch := list(islice(lines, batch_size)):
+            try:
+                rows = [self.parse(number, line) for number, line in batch if line.strip()]
+            except CommandError as exc:
+                # nothing of the batch is written yet, so it starts over after the fix
+                raise CommandError(f'{exc} Fix it and resume with --offset {batch[0][0] - 1}.')
+            with transaction.atomic(using=self.writer.connection.alias):
+                self.writer.write(rows)
+            imported += len(rows)
+            rate = imported / (time.perf_counter() - start)
+            self.stdout.write(f'{imported} recipes imported, resume with --offset {batch[-1][0]} ({rate:.0f} rows/s)')
+        return imported
+
+    def parse(self, number, line):
+        """ return the fields, tag names and ingredient names of a line """
+        try:
+            data = loads(line)
+            fields = {
+                name: Recipe._meta.get_field(name).clean(data.get(name, ''), None)
+                for name in FIELDS
+            }
+            return fields, self.parse_names(data.get('tags'), 'tags'), self.parse_names(data.get('ingredients'), 'ingredients')
+        except (ValueError, TypeError, AttributeError, ValidationError) as exc:
+            raise CommandError(f'Invalid recipe on line {number}: {exc}.')
+
+    def parse_names(self, items, field):
+        """ accept a list of names or of objects with a name """
+        if items is not None and not isinstance(items, list):
+            raise ValidationError(f'"{field}" must be a list')
+        if any(isinstance(item, dict) and 'name' not in item for item in items or []):
+            raise ValidationError('a tag or ingredient object has no "name"')
+        names = list(dict.fromkeys(item['name'] if isinstance(item, dict) else item for item in items or []))
+        for name in names:
+            # the same few names repeat over millions of lines, validate each one once
+            if name not in self.valid_names:
+                Tag._meta.get_field('name').clean(name, None)
+                self.valid_names.add(name)
+        return names
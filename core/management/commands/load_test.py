@@ -0,0 +1,133 @@
+import http.client
+import json
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+
+from core.management.commands.benchmark_api import percentile
+from core.models import Ingredient, Recipe, Tag
+
+
+class Command(BaseCommand):
+    help = (
+        'Send concurrent requests to a running server, WSGI or ASGI, and compare the synchronous read routes '
+        'with their async counterparts under /api/recipe/async. Run it against each server to compare them.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='address of the running server')
+        parser.add_argument('--user', required=True, help='email of the user whose recipes are requested')
+        parser.add_argument('--concurrency', type=int, default=100, help='clients sending requests at the same time')
+        parser.add_argument('--requests', type=int, default=2000, help='requests per route')
+        parser.add_argument('--no-cache', action='store_true', help='vary the url of every request to skip the response cache')
+        parser.add_argument('--label', default='', help='name of the server in the results, like wsgi or asgi')
+        parser.add_argument('--output', help='json file for the results, load-<time>.json by default')
+
+    def handle(self, *args, **options):
+        try:
+            user = get_user_model().objects.get(email=options['user'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f'User "{options["user"]}" does not exist.')
+        if options['concurrency'] < 1 or options['requests'] < 1:
+            raise CommandError('--concurrency and --requests must be positive.')
+        recipe = Recipe.objects.filter(user=user).order_by('-id').first()
+        tag = Tag.objects.filter(user=user).first()
+        ingredient = Ingredient.objects.filter(user=user).first()
+        if not recipe or not tag or not ingredient:
+            raise CommandError('The user needs recipes, tags and ingredients, create them with seed_data.')
+        token, _ = Token.objects.get_or_create(user=user)
+        self.options = options
+        self.headers = {'Authorization': f'Token {token.key}', 'Connection': 'keep-alive'}
+        self.local = threading.local()
+        started = datetime.now(timezone.utc)
+
+        # tags and ingredients are only retrieved by the async views, the synchronous ones list them
+        routes = [
+            ('recipe list', reverse('recipe-list')),
+            ('async recipe list', reverse('async-recipe-list')),
+            ('recipe detail', reverse('recipe-detail', args=[recipe.id])),
+            ('async recipe detail', reverse('async-recipe-detail', args=[recipe.id])),
+            ('tag list', reverse('tag-list')),
+            ('async tag list', reverse('async-tag-list')),
+            ('async tag detail', reverse('async-tag-detail', args=[tag.id])),
+            ('ingredient list', reverse('ingredient-list')),
+            ('async ingredient list', reverse('async-ingredient-list')),
+            ('async ingredient detail', reverse('async-ingredient-detail', args=[ingredient.id])),
+        ]
+        results = {}
+        for name, path in routes:
+            results[name] = self.run(path)
+            self.stdout.write(f'{name}: {results[name]["requests_per_second"]:.0f} req/s')
+
+        output = options['output'] or f'load-{started:%Y%m%d-%H%M%S}.json'
+        with open(output, 'w') as file:
+            json.dump({
+                'started_at': started.isoformat(), 'server': options['label'], 'url': options['url'],
+                'concurrency': options['concurrency'], 'no_cache': options['no_cache'], 'routes': results,
+            }, file, indent=2)
+        self.print_report(results)
+        return f'Results written to {output}.'
+
+    def run(self, path):
+        """ send the requests of a path from concurrency threads, each with its own keep-alive connection """
+        def send(i):
+            url = f'{path}?nocache={i}-{time.time_ns()}' if self.options['no_cache'] else path
+            for attempt in range(2):
+                connection = self.connection()
+                start = time.perf_counter()
+                try:
+                    connection.request('GET', url, headers=self.headers)
+                    response = connection.getresponse()
+                    response.read()
+                    return time.perf_counter() - start, response.status
+                except (OSError, http.client.HTTPException):
+                    # the server closed the idle connection, open another one and retry once
+                    connection.close()
+                    self.local.connection = None
+            return time.perf_counter() - start, 'error'
+
+        with ThreadPoolExecutor(self.options['concurrency']) as executor:
+            # one round before measuring, so connections are open and caches warm
+            list(executor.map(send, range(self.options['concurrency'])))
+            start = time.perf_counter()
+            responses = list(executor.map(send, range(self.options['requests'])))
+            elapsed = time.perf_counter() - start
+
+        timings = [duration * 1000 for duration, _ in responses]
+        statuses = {}
+        for _, status in responses:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        return {
+            'path': path,
+            'requests': len(responses),
+            'statuses': statuses,
+            'p50_ms': percentile(timings, 50),
+            'p95_ms': percentile(timings, 95),
+            'p99_ms': percentile(timings, 99),
+            'mean_ms': statistics.fmean(timings),
+            'requests_per_second': len(responses) / elapsed,
+        }
+
+    def connection(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            url = urlsplit(self.options['url'])
+            connection_class = http.client.HTTPSConnection if url.scheme == 'https' else http.client.HTTPConnection
+            connection = self.local.connection = connection_class(url.hostname, url.port, timeout=60)
+        return connection
+
+    def print_report(self, results):
+        self.stdout.write(f'\n{"route":<26}{"p50":>9}{"p95":>9}{"p99":>9}{"req/s":>9}  statuses')
+        for name, result in results.items():
+            self.stdout.write(
+                f'{name:<26}{result["p50_ms"]:>9.2f}{result["p95_ms"]:>9.2f}{result["p99_ms"]:>9.2f}'
+                f'{result["requests_per_second"]:>9.0f}  {result["statuses"]}'
+            )
@@ -0,0 +1,36 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core.models import DiscardedFile
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete the files of the recipe images replaced or deleted more than IMAGE_DELETE_GRACE_SECONDS ago, '
+        'run it periodically, like from cron'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace-seconds', type=int, default=settings.IMAGE_DELETE_GRACE_SECONDS,
+            help='seconds a discarded file is kept, IMAGE_DELETE_GRACE_SECONDS by default',
+        )
+
+    def handle(self, *args, **options):
+        if options['grace_seconds'] < 0:
+            raise CommandError('--grace-seconds must not be negative.')
+        discarded = DiscardedFile.objects.filter(discarded_at__lte=timezone.now() - timedelta(seconds=options['grace_seconds']))
+
+        deleted = 0
+        while rows := list(discarded.order_by('id').values_list('id', 'name')[:BATCH_SIZE]):
+            for _, name in rows:
+                default_storage.delete(name)
+            DiscardedFile.objects.filter(id__in=[pk for pk, _ in rows]).delete()
+            deleted += len(rows)
+        return f'Deleted {deleted} files.'
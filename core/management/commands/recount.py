@@ -0,0 +1,39 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F
+
+from core.counters import RELATIONS, actual_recipe_count
+from recipe_app.cache import bump_version
+
+
+class Command(BaseCommand):
+    help = 'Recount the recipes of every tag and ingredient, repairing the recipe_count of the ones that drifted'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='email of the only user to recount')
+
+    def handle(self, *args, **options):
+        users = get_user_model().objects.all()
+        if options['user']:
+            users = users.filter(email=options['user'])
+            if not users.exists():
+                raise CommandError(f'User "{options["user"]}" does not exist.')
+
+        repaired = []
+        owners = set()
+        for model in RELATIONS:
+            with transaction.atomic():
+                # lock the drifted rows so a concurrent link change waits for the repair
+                drifted = (
+                    model.objects.filter(user__in=users).select_for_update()
+                    .annotate(actual=actual_recipe_count(model)).exclude(recipe_count=F('actual'))
+                )
+                rows = list(drifted.values_list('id', 'user_id'))
+                model.objects.filter(id__in=[pk for pk, _ in rows]).update(recipe_count=actual_recipe_count(model))
+            owners.update(user_id for _, user_id in rows)
+            repaired.append(f'{len(rows)} {model._meta.verbose_name_plural}')
+
+        for user_id in owners:
+            bump_version(user_id)
+        return f'Repaired the recipe count of {" and ".join(repaired)}.'
@@ -0,0 +1,105 @@
+import random
+import time
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from core.management.recipe_writer import RecipeWriter
+from recipe_app.cache import bump_version
+
+TAGS = [
+    'dinner', 'lunch', 'quick', 'vegetarian', 'healthy', 'breakfast', 'dessert', 'vegan', 'easy', 'comfort food',
+    'gluten free', 'brazilian', 'italian', 'snack', 'low carb', 'spicy', 'kids', 'party', 'baking', 'grill',
+    'soup', 'salad', 'seafood', 'mexican', 'asian', 'holiday', 'one pot', 'meal prep', 'budget', 'summer',
+]
+INGREDIENTS = [
+    'salt', 'olive oil', 'garlic', 'onion', 'black pepper', 'butter', 'sugar', 'flour', 'egg', 'milk',
+    'tomato', 'water', 'lemon', 'parsley', 'chicken breast', 'rice', 'carrot', 'potato', 'cheese', 'cream',
+    'basil', 'oregano', 'cumin', 'paprika', 'ginger', 'soy sauce', 'honey', 'vinegar', 'bell pepper', 'spinach',
+    'beans', 'corn', 'beef', 'pork', 'bacon', 'shrimp', 'salmon', 'mushroom', 'zucchini', 'broccoli',
+    'chocolate', 'vanilla', 'cinnamon', 'yogurt', 'oats', 'banana', 'apple', 'coconut milk', 'chili', 'cilantro',
+    'pasta', 'bread', 'lime', 'thyme', 'rosemary', 'peas', 'cabbage', 'avocado', 'cassava flour', 'cashew',
+]
+# the long tail of ingredient names, like "smoked paprika" or "fresh basil"
+INGREDIENT_KINDS = ['fresh', 'dried', 'ground', 'chopped', 'smoked', 'organic', 'frozen', 'canned']
+STYLES = ['creamy', 'spicy', 'roasted', 'grilled', 'baked', 'crispy', 'homemade', 'quick', 'classic', 'stuffed']
+DISHES = ['soup', 'salad', 'pie', 'stew', 'pasta', 'risotto', 'cake', 'bowl', 'tacos', 'casserole', 'stir fry', 'curry']
+
+
+def zipf_weights(count, exponent=1.1):
+    """ a few names are used by most recipes, like real tags and ingredients """
+    return [1 / rank ** exponent for rank in range(1, count + 1)]
+
+
+class Command(BaseCommand):
+    help = 'Create users with synthetic recipes, tags and ingredients to measure the api at scale'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10, help='users to create, or to reuse when they exist')
+        parser.add_argument('--recipes', type=int, default=1000, help='recipes added to every user')
+        parser.add_argument('--batch-size', type=int, default=5000, help='recipes written per transaction')
+        parser.add_argument('--password', default='seedpassword', help='password of the created users')
+        parser.add_argument('--seed', type=int, default=42, help='seed of the random generator, for repeatable data')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive.')
+        self.rng = random.Random(options['seed'])
+        self.ingredients = INGREDIENTS + [f'{kind} {name}' for kind in INGREDIENT_KINDS for name in INGREDIENTS]
+        self.rng.shuffle(self.ingredients)
+        self.tag_weights = zipf_weights(len(TAGS))
+        self.ingredient_weights = zipf_weights(len(self.ingredients))
+
+        users = self.create_users(options['users'], options['password'])
+        start = time.perf_counter()
+        created = 0
+        for user in users:
+            writer = RecipeWriter(user)
+            remaining = options['recipes']
+            while remaining > 0:
+                rows = [self.recipe() for _ in range(min(remaining, options['batch_size']))]
+                with transaction.atomic(using=writer.connection.alias):
+                    writer.write(rows)
+                remaining -= len(rows)
+                created += len(rows)
+            bump_version(user.id)
+            rate = created / (time.perf_counter() - start)
+            self.stdout.write(f'{user.email}: {options["recipes"]} recipes added ({rate:.0f} rows/s)')
+
+        return f'Seeded {created} recipes for {len(users)} users.'
+
+    def create_users(self, count, password):
+        """ return the seed users, creating the missing ones with a single password hash """
+        emails = [f'seed{i}@example.com' for i in range(count)]
+        User = get_user_model()
+        existing = {user.email: user for user in User.objects.filter(email__in=emails)}
+        password = make_password(password)
+        User.objects.bulk_create(
+            User(email=email, name=f'Seed user {i}', password=password)
+            for i, email in enumerate(emails) if email not in existing
+        )
+        users = {user.email: user for user in User.objects.filter(email__in=emails)}
+        return [users[email] for email in emails]
+
+    def recipe(self):
+        """ return the fields, tag names and ingredient names of a random recipe """
+        rng = self.rng
+        tags = self.pick(TAGS, self.tag_weights, rng.choice([0, 1, 1, 2, 2, 3, 4]))
+        ingredients = self.pick(self.ingredients, self.ingredient_weights, rng.randint(3, 12))
+        main = ingredients[0].split()[-1]
+        fields = {
+            'title': f'{rng.choice(STYLES)} {main} {rng.choice(DISHES)}'.capitalize(),
+            'time_minutes': min(int(rng.lognormvariate(3.4, 0.6)) + 5, 600),
+            'price': Decimal(rng.randint(100, 20000)) / 100,
+            'description': f'A {rng.choice(STYLES)} dish with {", ".join(ingredients[:3])}.',
+            'link': f'https://example.com/recipes/{rng.getrandbits(32):08x}' if rng.random() < 0.3 else '',
+        }
+        return fields, tags, ingredients
+
+    def pick(self, names, weights, count):
+        """ pick count different names, the popular ones more often """
+        picked = dict.fromkeys(self.rng.choices(names, weights, k=count * 2))
+        return list(picked)[:count]
@@ -0,0 +1,130 @@
+import glob
+import json
+import os
+import threading
+import time
+
+from django.conf import settings
+
+# seconds of the request latency histogram, and queries of the queries per request one
+DURATION_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+QUERY_BUCKETS = [0, 1, 2, 3, 5, 10, 20, 50, 100]
+
+METRICS = {
+    'http_requests_total': ('counter', 'Requests by view, method and status code.'),
+    'http_request_duration_seconds': ('histogram', 'Time to the first byte of the response by view.'),
+    'http_request_queries': ('histogram', 'Database queries per request by view.'),
+}
+
+
+def labels(**values):
+    escaped = (str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n') for value in values.values())
+    return ','.join(f'{name}="{value}"' for name, value in zip(values, escaped))
+
+
+def view_label(request, view_func):
+    """ basename-action of viewsets, like recipe-list or tag-partial_update, and the url name of other views """
+    actions = getattr(view_func, 'actions', None)
+    basename = getattr(view_func, 'initkwargs', {}).get('basename')
+    if actions and basename and request.method.lower() in actions:
+        return f'{basename}-{actions[request.method.lower()]}'
+    return request.resolver_match.url_name or 'unnamed'
+
+
+class MetricsStore:
+    """
+    the samples of this process, kept in memory and written to a file of their own in METRICS_DIR
+    at most every METRICS_FLUSH_SECONDS, and by a timer once the last ones are that old, so a
+    process gone idle still publishes them; the scrape adds up the files of every worker process
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.timer = None
+        self.reset()
+
+    def reset(self):
+        if self.timer is not None and os.getpid() == self.pid:
+            self.timer.cancel()
+        # the timer of a parent process is not running in a forked one
+        self.timer = None
+        self.pid = os.getpid()
+        # the start time tells apart processes that got the pid of an exited one
+        self.name = f'{self.pid}-{time.time_ns()}.json'
+        self.samples = {}
+        self.flushed_at = 0.0
+
+    def observe(self, view, method, status, duration, queries):
+        with self.lock:
+            if os.getpid() != self.pid:
+                # a forked worker starts from zero, its parent keeps counting in its own file
+                self.reset()
+            self.inc(f'http_requests_total{{{labels(view=view, method=method, status=status)}}}')
+            self.histogram('http_request_duration_seconds', DURATION_BUCKETS, duration, view=view)
+            self.histogram('http_request_queries', QUERY_BUCKETS, queries, view=view)
+            wait = settings.METRICS_FLUSH_SECONDS - (time.monotonic() - self.flushed_at)
+            if wait <= 0:
+                self.flush()
+            elif self.timer is None and settings.METRICS_DIR:
+                self.timer = threading.Timer(wait, self.timed_flush)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def timed_flush(self):
+        with self.lock:
+            if self.timer is not None and os.getpid() == self.pid:
+                self.timer = None
+                self.flush()
+
+    def inc(self, sample, amount=1):
+        self.samples[sample] = self.samples.get(sample, 0) + amount
+
+    def histogram(self, name, buckets, value, **values):
+        label = labels(**values)
+        for bucket in [*buckets, '+Inf']:
+            self.inc(f'{name}_bucket{{{label},le="{bucket}"}}', bucket == '+Inf' or value <= bucket)
+        self.inc(f'{name}_sum{{{label}}}', value)
+        self.inc(f'{name}_count{{{label}}}')
+
+    def flush(self):
+        self.flushed_at = time.monotonic()
+        if not settings.METRICS_DIR:
+            return
+        path = os.path.join(settings.METRICS_DIR, self.name)
+        with open(f'{path}.tmp', 'w') as file:
+            json.dump(self.samples, file)
+        os.replace(f'{path}.tmp', path)
+
+    def collect(self):
+        """ return the samples of every process, or of this one when there is no METRICS_DIR """
+        with self.lock:
+            self.flush()
+            if not settings.METRICS_DIR:
+                return dict(self.samples)
+        samples = {}
+        for path in glob.glob(os.path.join(settings.METRICS_DIR, '*.json')):
+            with open(path) as file:
+                for sample, value in json.load(file).items():
+                    samples[sample] = samples.get(sample, 0) + value
+        return samples
+
+
+store = MetricsStore()
+
+
+def exposition(samples, extra=()):
+    """ the samples in the prometheus text format, grouped by metric """
+    families = {name: [] for name in METRICS}
+    for sample, value in samples.items():
+        name = sample.split('{', 1)[0]
+        for suffix in ('_bucket', '_sum', '_count'):
+            if name.endswith(suffix) and name[:-len(suffix)] in families:
+                name = name[:-len(suffix)]
+        families[name].append(f'{sample} {float(value)}')
+
+    lines = []
+    for name, sample_lines in families.items():
+        kind, description = METRICS[name]
+        lines += [f'# HELP {name} {description}', f'# TYPE {name} {kind}', *sample_lines]
+    for name, kind, description, value in extra:
+        lines += [f'# HELP {name} {description}', f'# TYPE {name} {kind}', f'{name} {float(value)}']
+    return '\n'.join(lines) + '\n'
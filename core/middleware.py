@@ -0,0 +1,98 @@
+import logging
+import time
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+from .metrics import store, view_label
+from .timing import current_timings, start_timings, stop_timings
+
+logger = logging.getLogger('recipe.requests')
+METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+
+class RequestTimingMiddleware:
+    """
+    time every request, its queries and its auth, serialize and render sections, which
+    exclude the queries run inside them, into a Server-Timing header and the /metrics
+    store, and log slow requests with their slowest queries. streaming responses are
+    timed up to their first byte.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timings, token = start_timings(slowest=settings.SLOW_REQUEST_SQL)
+        try:
+            with wrap_connections(timings):
+                response = self.get_response(request)
+        finally:
+            stop_timings(token)
+        return self.finish(request, response, timings)
+
+    async def __acall__(self, request):
+        timings, token = start_timings(slowest=settings.SLOW_REQUEST_SQL)
+        try:
+            # connections belong to a thread, so wrap the ones of the thread the queries of this request run in
+            with await sync_to_async(wrap_connections)(timings):
+                response = await self.get_response(request)
+        finally:
+            stop_timings(token)
+        return self.finish(request, response, timings)
+
+    def finish(self, request, response, timings):
+        total = timings.total()
+        if settings.SERVER_TIMING_HEADER:
+            response['Server-Timing'] = server_timing(timings, total)
+        method = request.method if request.method in METHODS else 'other'
+        # label metrics by view rather than by path, which would give a series per recipe
+        match = getattr(request, 'resolver_match', None)
+        view = view_label(request, match.func) if match else 'unmatched'
+        store.observe(view, method, response.status_code, total, timings.query_count)
+        if total * 1000 >= settings.SLOW_REQUEST_MS or timings.query_count >= settings.SLOW_REQUEST_QUERIES:
+            log_slow_request(request, response, timings, total)
+        return response
+
+    def process_template_response(self, request, response):
+        """ time the rendering of the response, which runs after the view returned """
+        timings = current_timings()
+        if timings is not None:
+            start = time.perf_counter()
+            response.add_post_render_callback(lambda rendered: timings.add('render', time.perf_counter() - start))
+        return response
+
+
+def wrap_connections(timings):
+    """ count and time the queries of the connections of the current thread """
+    stack = ExitStack()
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(timings.execute))
+    return stack
+
+
+def server_timing(timings, total):
+    metrics = [f'db;dur={timings.db_time * 1000:.1f};desc="{timings.query_count} queries"']
+    metrics += [f'{name};dur={duration * 1000:.1f}' for name, duration in timings.sections.items()]
+    metrics.append(f'total;dur={total * 1000:.1f}')
+    return ', '.join(metrics)
+
+
+def log_slow_request(request, response, timings, total):
+    sections = ', '.join(f'{name} {duration * 1000:.1f}ms' for name, duration in timings.sections.items())
+    slowest = ''.join(
+        f'\n  {duration * 1000:.1f}ms {sql}' for duration, sql in sorted(timings.slowest_queries, reverse=True)
+    )
+    logger.warning(
+        'slow request %s %s %s in %.1fms: %d queries in %.1fms%s%s',
+        request.method, request.get_full_path(), response.status_code, total * 1000,
+        timings.query_count, timings.db_time * 1000, f', {sections}' if sections else '', slowest,
+    )
@@ -0,0 +1,118 @@
+# Generated by Django 4.1 on 2026-10-18 02:51
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+import core.operations
+
+
+# the search vector of a recipe: title (A), tag and ingredient names (B) and description (C)
+CREATE_TRIGGERS = """
+CREATE FUNCTION core_recipe_document(bigint, text, text) RETURNS tsvector AS $$
+    SELECT setweight(to_tsvector('pg_catalog.english', coalesce($2, '')), 'A')
+        || setweight(to_tsvector('pg_catalog.english', coalesce((
+            SELECT string_agg(t.name, ' ') FROM core_tag t
+            JOIN core_recipe_tags rt ON rt.tag_id = t.id WHERE rt.recipe_id = $1), '')), 'B')
+        || setweight(to_tsvector('pg_catalog.english', coalesce((
+            SELECT string_agg(i.name, ' ') FROM core_ingredient i
+            JOIN core_recipe_ingredients ri ON ri.ingredient_id = i.id WHERE ri.recipe_id = $1), '')), 'B')
+        || setweight(to_tsvector('pg_catalog.english', coalesce($3, '')), 'C')
+$$ LANGUAGE sql STABLE;
+
+CREATE FUNCTION core_recipe_search_vector() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector := core_recipe_document(NEW.id, NEW.title, NEW.description);
+    RETURN NEW;
+END $$ LANGUAGE plpgsql;
+
+CREATE TRIGGER core_recipe_search_vector BEFORE INSERT OR UPDATE OF title, description ON core_recipe
+    FOR EACH ROW EXECUTE FUNCTION core_recipe_search_vector();
+
+CREATE FUNCTION core_recipe_links_search_vector() RETURNS trigger AS $$
+BEGIN
+    UPDATE core_recipe r SET search_vector = core_recipe_document(r.id, r.title, r.description)
+    WHERE r.id IN (SELECT recipe_id FROM changed_links);
+    RETURN NULL;
+END $$ LANGUAGE plpgsql;
+
+CREATE TRIGGER core_recipe_tags_added AFTER INSERT ON core_recipe_tags
+    REFERENCING NEW TABLE AS changed_links
+    FOR EACH STATEMENT EXECUTE FUNCTION core_recipe_links_search_vector();
+CREATE TRIGGER core_recipe_tags_removed AFTER DELETE ON core_recipe_tags
+    REFERENCING OLD TABLE AS changed_links
+    FOR EACH STATEMENT EXECUTE FUNCTION core_recipe_links_search_vector();
+CREATE TRIGGER core_recipe_ingredients_added AFTER INSERT ON core_recipe_ingredients
+    REFERENCING NEW TABLE AS changed_links
+    FOR EACH STATEMENT EXECUTE FUNCTION core_recipe_links_search_vector();
+CREATE TRIGGER core_recipe_ingredients_removed AFTER DELETE ON core_recipe_ingredients
+    REFERENCING OLD TABLE AS changed_links
+    FOR EACH STATEMENT EXECUTE FUNCTION core_recipe_links_search_vector();
+
+CREATE FUNCTION core_tag_search_vector() RETURNS trigger AS $$
+BEGIN
+    UPDATE core_recipe r SET search_vector = core_recipe_document(r.id, r.title, r.description)
+    WHERE r.id IN (SELECT recipe_id FROM core_recipe_tags WHERE tag_id = NEW.id);
+    RETURN NULL;
+END $$ LANGUAGE plpgsql;
+
+CREATE TRIGGER core_tag_search_vector AFTER UPDATE OF name ON core_tag
+    FOR EACH ROW WHEN (OLD.name IS DISTINCT FROM NEW.name) EXECUTE FUNCTION core_tag_search_vector();
+
+CREATE FUNCTION core_ingredient_search_vector() RETURNS trigger AS $$
+BEGIN
+    UPDATE core_recipe r SET search_vector = core_recipe_document(r.id, r.title, r.description)
+    WHERE r.id IN (SELECT recipe_id FROM core_recipe_ingredients WHERE ingredient_id = NEW.id);
+    RETURN NULL;
+END $$ LANGUAGE plpgsql;
+
+CREATE TRIGGER core_ingredient_search_vector AFTER UPDATE OF name ON core_ingredient
+    FOR EACH ROW WHEN (OLD.name IS DISTINCT FROM NEW.name) EXECUTE FUNCTION core_ingredient_search_vector();
+
+UPDATE core_recipe SET search_vector = core_recipe_document(id, title, description);
+"""
+
+DROP_TRIGGERS = """
+DROP TRIGGER core_ingredient_search_vector ON core_ingredient;
+DROP FUNCTION core_ingredient_search_vector();
+DROP TRIGGER core_tag_search_vector ON core_tag;
+DROP FUNCTION core_tag_search_vector();
+DROP TRIGGER core_recipe_ingredients_removed ON core_recipe_ingredients;
+DROP TRIGGER core_recipe_ingredients_added ON core_recipe_ingredients;
+DROP TRIGGER core_recipe_tags_removed ON core_recipe_tags;
+DROP TRIGGER core_recipe_tags_added ON core_recipe_tags;
+DROP FUNCTION core_recipe_links_search_vector();
+DROP TRIGGER core_recipe_search_vector ON core_recipe;
+DROP FUNCTION core_recipe_search_vector();
+DROP FUNCTION core_recipe_document(bigint, text, text);
+"""
+
+
+def create_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(CREATE_TRIGGERS)
+
+
+def drop_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_TRIGGERS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        core.operations.AddPostgresIndex(
+            model_name='recipe',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='recipe_search_vector_idx'),
+        ),
+        migrations.RunPython(create_triggers, drop_triggers),
+    ]
@@ -0,0 +1,43 @@
+from django.db import migrations
+from django.db.models import Count, Min
+
+
+def merge_duplicate_names(apps, schema_editor):
+    """ keep the oldest tag and ingredient of each user and name, moving the links of the others to it """
+    Recipe = apps.get_model('core', 'Recipe')
+    for relation in ('tags', 'ingredients'):
+        field = Recipe._meta.get_field(relation)
+        model = field.related_model
+        through = field.remote_field.through
+        target = f'{field.m2m_reverse_field_name()}_id'
+
+        groups = (
+            model.objects.values('user', 'name')
+            .annotate(keep=Min('id'), count=Count('id'))
+            .filter(count__gt=1)
+            .order_by()
+        )
+        for group in groups:
+            duplicates = model.objects.filter(user=group['user'], name=group['name']).exclude(id=group['keep'])
+            kept_links = through.objects.filter(**{target: group['keep']}).values('recipe_id')
+            recipe_ids = (
+                through.objects.filter(**{f'{target}__in': duplicates})
+                .exclude(recipe_id__in=kept_links)
+                .values_list('recipe_id', flat=True)
+                .distinct()
+            )
+            through.objects.bulk_create(through(recipe_id=pk, **{target: group['keep']}) for pk in recipe_ids)
+            duplicates.delete()
+
+
+class Migration(migrations.Migration):
+    # the unique constraints are added by the next migration, postgres does not alter
+    # tables with pending deferred foreign key checks in the transaction of this one
+
+    dependencies = [
+        ('core', '0003_recipe_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_names, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_recipes(apps, schema_editor):
+    """ start the recipe_count of every tag and ingredient from its links """
+    Recipe = apps.get_model('core', 'Recipe')
+    for relation in ('tags', 'ingredients'):
+        field = Recipe._meta.get_field(relation)
+        through = field.remote_field.through
+        target = f'{field.m2m_reverse_field_name()}_id'
+        links = through.objects.filter(**{target: OuterRef('pk')}).order_by().values(target).annotate(count=Count('*'))
+        field.related_model.objects.update(recipe_count=Coalesce(Subquery(links.values('count')), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_tag_ingredient_ordering'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingredient',
+            name='recipe_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='recipe_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='ingredient',
+            index=models.Index(fields=['user', '-recipe_count', 'id'], name='ingredient_user_popular_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tag',
+            index=models.Index(fields=['user', '-recipe_count', 'id'], name='tag_user_popular_idx'),
+        ),
+        migrations.RunPython(count_recipes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.1 on 2026-10-18 05:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_denied_token'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DiscardedFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('discarded_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+    ]
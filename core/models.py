@@ -1,5 +1,12 @@
+import os
+import uuid
+
 from django.db import models
+from django.db.models import F
+from django.db.models.functions import Upper
 from django.contrib.auth.models import BaseUserManager, AbstractBaseUser, PermissionsMixin
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import SearchVectorField
 
 from recipe import settings
 
@@ -28,6 +35,8 @@ class User(PermissionsMixin, AbstractBaseUser):
     name = models.CharField(max_length=150)
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
+    # the jwts issued before are revoked, set on a password change or a deactivation, see user.tokens
+    tokens_revoked_at = models.DateTimeField(null=True, blank=True, editable=False)
 
     objects = UserManager()
 
@@ -40,6 +49,20 @@ class User(PermissionsMixin, AbstractBaseUser):
 class Tag(models.Model):
     name = models.CharField(max_length=150)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    # the number of recipes linked to it, kept up to date on every link change, see core.counters
+    recipe_count = models.IntegerField(default=0, editable=False)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['user', 'name'], name='unique_tag_name_per_user')]
+        indexes = [
+            # the tags of a user by popularity, and the ones used by any recipe
+            models.Index(fields=['user', '-recipe_count', 'id'], name='tag_user_popular_idx'),
+            # prefix and similarity searches of the autocomplete, on PostgreSQL
+            models.Index(F('user'), OpClass(Upper('name'), name='text_pattern_ops'), name='tag_name_prefix_idx'),
+            GinIndex(OpClass(Upper('name'), name='gin_trgm_ops'), name='tag_name_trgm_idx'),
+        ]
+        # recipes list their tags in this order, whichever way they are read
+        ordering = ['id']
 
     def __str__(self) -> str:
         return self.name
@@ -48,11 +71,31 @@ class Tag(models.Model):
 class Ingredient(models.Model):
     name = models.CharField(max_length=150)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    # the number of recipes linked to it, kept up to date on every link change, see core.counters
+    recipe_count = models.IntegerField(default=0, editable=False)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['user', 'name'], name='unique_ingredient_name_per_user')]
+        indexes = [
+            # the ingredients of a user by popularity, and the ones used by any recipe
+            models.Index(fields=['user', '-recipe_count', 'id'], name='ingredient_user_popular_idx'),
+            # prefix and similarity searches of the autocomplete, on PostgreSQL
+            models.Index(F('user'), OpClass(Upper('name'), name='text_pattern_ops'), name='ingredient_name_prefix_idx'),
+            GinIndex(OpClass(Upper('name'), name='gin_trgm_ops'), name='ingredient_name_trgm_idx'),
+        ]
+        # recipes list their ingredients in this order, whichever way they are read
+        ordering = ['id']
 
     def __str__(self) -> str:
         return self.name
 
 
+def recipe_image_file_path(instance, filename):
+    """ a new name for every uploaded recipe image, so its url can be cached for good """
+    extension = os.path.splitext(filename)[1].lower()
+    return os.path.join('uploads', 'recipe', f'{uuid.uuid4()}{extension}')
+
+
 class Recipe(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     title = models.CharField(max_length=150)
@@ -60,8 +103,40 @@ class Recipe(models.Model):
     time_minutes = models.IntegerField()
     price = models.DecimalField(decimal_places=2, max_digits=5)
     link = models.CharField(max_length=255, blank=True)
+    image = models.ImageField(upload_to=recipe_image_file_path, blank=True)
+    # {variant: file name} of the resized copies of the image, filled in once they are rendered
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     tags = models.ManyToManyField(Tag)
     ingredients = models.ManyToManyField(Ingredient)
+    # also touched when tags or ingredients are linked, unlinked or renamed, see core.signals
+    updated_at = models.DateTimeField(auto_now=True)
+    # kept up to date by database triggers on PostgreSQL, see migration 0002
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_vector'], name='recipe_search_vector_idx'),
+            # the recipes of a user in id order, as listed and paginated by the api
+            models.Index(fields=['user', 'id'], name='recipe_user_id_idx'),
+        ]
 
     def __str__(self) -> str:
         return self.title
+
+
+class DiscardedFile(models.Model):
+    """ a stored file no longer used, deleted by the purge_images command once no cached response links to it """
+    name = models.CharField(max_length=255)
+    discarded_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self) -> str:
+        return self.name
+
+
+class DeniedToken(models.Model):
+    """ a revoked jwt refresh token, kept until it expires, see user.tokens """
+    jti = models.CharField(max_length=255, unique=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self) -> str:
+        return self.jti
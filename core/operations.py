@@ -0,0 +1,49 @@
+from django.contrib.postgres.operations import CreateExtension
+from django.db.migrations.operations import AddIndex
+
+
+def has_extension(connection, name):
+    """ whether the PostgreSQL extension is installed in the database of the connection """
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1 FROM pg_extension WHERE extname = %s', [name])
+        return cursor.fetchone() is not None
+
+
+class AddPostgresIndex(AddIndex):
+    """ add an index only on PostgreSQL, for index types the other backends do not support """
+    # the extension the index needs, the index is skipped on the servers without it
+    extension = None
+
+    def applies(self, connection):
+        return connection.vendor == 'postgresql' and (self.extension is None or has_extension(connection, self.extension))
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if self.applies(schema_editor.connection):
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if self.applies(schema_editor.connection):
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+class AddTrigramIndex(AddPostgresIndex):
+    """ add a pg_trgm index only on the PostgreSQL servers where the extension is installed """
+    extension = 'pg_trgm'
+
+
+class CreateExtensionIfAvailable(CreateExtension):
+    """ create a PostgreSQL extension when the server ships it, the features using it are skipped otherwise """
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute('SELECT 1 FROM pg_available_extensions WHERE name = %s', [self.name])
+            if cursor.fetchone() is None:
+                return
+        super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
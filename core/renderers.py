@@ -0,0 +1,75 @@
+import io
+import json
+
+from django.conf import settings
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.json import strict_constant
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_encoder = JSONEncoder()
+# line and paragraph separators are valid json but not valid javascript, the rest framework escapes them
+_SEPARATORS = (('\u2028'.encode(), b'\\u2028'), ('\u2029'.encode(), b'\\u2029'))
+
+
+def _escape(content):
+    for separator, escaped in _SEPARATORS:
+        if separator in content:
+            content = content.replace(separator, escaped)
+    return content
+
+
+def dumps(data):
+    """
+    the compact utf-8 json of data, as the rest framework renderer writes it, with orjson when it is
+    installed; dates, times, decimals and the types orjson does not know go through the rest framework
+    encoder, so the output does not depend on the library
+    """
+    if orjson is not None:
+        try:
+            return _escape(orjson.dumps(data, default=_encoder.default, option=orjson.OPT_PASSTHROUGH_DATETIME))
+        except orjson.JSONEncodeError:
+            # integers past 64 bits, keys that are not strings: the stdlib writes them or raises its own error
+            pass
+    return _escape(json.dumps(
+        data, cls=JSONEncoder, ensure_ascii=False, allow_nan=False, separators=(',', ':'),
+    ).encode())
+
+
+def loads(data):
+    """ parse json bytes or text, with orjson when it is installed and the stdlib errors otherwise """
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(data, parse_constant=strict_constant)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """ the rest framework renderer, written by dumps unless an indent is asked for """
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+        return dumps(data)
+
+
+class FastJSONParser(JSONParser):
+    """ the rest framework parser, reading utf-8 bodies with loads """
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        if orjson is None or encoding.lower().replace('_', '-') not in ('utf-8', 'utf8'):
+            return super().parse(stream, media_type, parser_context)
+        body = stream.read()
+        try:
+            return orjson.loads(body)
+        except orjson.JSONDecodeError:
+            # the stdlib parser raises the parse error clients get today
+            return super().parse(io.BytesIO(body), media_type, parser_context)
@@ -0,0 +1,70 @@
+from collections import Counter
+
+from django.db.models.signals import m2m_changed, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .counters import RELATIONS, adjust_recipe_counts, uncount_links
+from .models import Ingredient, Recipe, Tag
+
+
+def touch_recipes(queryset):
+    """ mark the recipes of the queryset as modified now """
+    queryset.update(updated_at=timezone.now())
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def touch_linked_recipes(sender, instance, action, reverse, pk_set, **kwargs):
+    """ mark recipes as modified when their tags or ingredients are linked or unlinked """
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            instance.updated_at = timezone.now()
+            touch_recipes(Recipe.objects.filter(pk=instance.pk))
+    elif action in ('post_add', 'post_remove'):
+        touch_recipes(Recipe.objects.filter(pk__in=pk_set))
+    elif action == 'pre_clear':
+        touch_recipes(instance.recipe_set.all())
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+def touch_renamed_recipes(sender, instance, created, **kwargs):
+    """ mark recipes as modified when one of their tags or ingredients changes """
+    if not created:
+        touch_recipes(instance.recipe_set.all())
+
+
+@receiver(pre_delete, sender=Tag)
+@receiver(pre_delete, sender=Ingredient)
+def touch_unlinked_recipes(sender, instance, **kwargs):
+    """ mark recipes as modified before a deleted tag or ingredient is unlinked from them """
+    touch_recipes(instance.recipe_set.all())
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def count_linked_recipes(sender, instance, action, reverse, model, pk_set, **kwargs):
+    """
+    keep the recipe_count of tags and ingredients up to date in the transaction of a link change;
+    an add signals the links it inserts, a remove every pk it is given, so the removed links are read
+    """
+    counted = type(instance) if reverse else model
+    column = f'{counted._meta.model_name}_id'
+    if action == 'post_add':
+        deltas = {instance.pk: len(pk_set)} if reverse else dict.fromkeys(pk_set, 1)
+    elif action in ('pre_remove', 'pre_clear'):
+        links = sender.objects.filter(**{column: instance.pk} if reverse else {'recipe_id': instance.pk})
+        if pk_set is not None:
+            links = links.filter(**{'recipe_id__in': pk_set} if reverse else {f'{column}__in': pk_set})
+        deltas = {pk: -count for pk, count in Counter(links.values_list(column, flat=True)).items()}
+    else:
+        return
+    adjust_recipe_counts(counted, deltas)
+
+
+@receiver(pre_delete, sender=Recipe)
+def uncount_deleted_recipe(sender, instance, **kwargs):
+    """ the links of a deleted recipe are removed without m2m signals """
+    for model in RELATIONS:
+        uncount_links(model, [instance.pk])
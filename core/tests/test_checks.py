@@ -0,0 +1,18 @@
+from django.test import SimpleTestCase, override_settings
+
+from core.checks import check_shared_cache
+
+
+class SharedCacheCheckTests(SimpleTestCase):
+    """ test the deployment check of the cache shared by the worker processes """
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_local_cache_rejected(self):
+        """ test a cache local to each process is an error """
+        self.assertEqual([error.id for error in check_shared_cache(None)], ['core.E001'])
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://cache:6379/0',
+    }})
+    def test_shared_cache_accepted(self):
+        """ test a redis cache passes """
+        self.assertEqual(check_shared_cache(None), [])
@@ -0,0 +1,203 @@
+import json
+import os
+import tempfile
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import LiveServerTestCase, TestCase, override_settings
+
+from core.models import Recipe, Tag, Ingredient
+from recipe_app.cache import get_version
+
+
+def recipe_line(index, **params):
+    data = {
+        'title': f'recipe {index}',
+        'time_minutes': 10,
+        'price': '5.50',
+        'tags': [f'tag {index % 2}'],
+        'ingredients': [{'name': 'salt'}, {'name': f'ingredient {index}'}],
+    }
+    data.update(params)
+    return json.dumps(data)
+
+
+class ImportRecipesCommandTests(TestCase):
+    """ test the import_recipes command """
+    def setUp(self) -> None:
+        self.user = get_user_model().objects.create_user(email='test@email.com', password='testpassword')
+
+    def _import(self, lines, **options):
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl', delete=False) as file:
+            file.write('\n'.join(lines) + '\n')
+        self.addCleanup(os.remove, file.name)
+        out = StringIO()
+        call_command('import_recipes', file.name, user=self.user.email, stdout=out, **options)
+        return out.getvalue()
+
+    def test_import_recipes(self):
+        """ test importing recipes with their tags and ingredients in batches """
+        Tag.objects.create(user=self.user, name='tag 0')
+
+        out = self._import([recipe_line(i) for i in range(5)], batch_size=2)
+
+        self.assertEqual(Recipe.objects.filter(user=self.user).count(), 5)
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(Ingredient.objects.filter(user=self.user).count(), 6)
+        recipe = Recipe.objects.get(title='recipe 3')
+        self.assertEqual(recipe.price, Decimal('5.50'))
+        self.assertEqual(recipe.description, '')
+        self.assertEqual([tag.name for tag in recipe.tags.all()], ['tag 1'])
+        self.assertEqual(sorted(ing.name for ing in recipe.ingredients.all()), ['ingredient 3', 'salt'])
+        self.assertIn('resume with --offset 4', out)
+        self.assertIn('Imported 5 recipes.', out)
+
+    def test_import_resume_from_offset(self):
+        """ test the lines before the offset are skipped """
+        self._import([recipe_line(i) for i in range(5)], offset=3)
+
+        self.assertEqual(sorted(Recipe.objects.values_list('title', flat=True)), ['recipe 3', 'recipe 4'])
+
+    def test_import_invalid_line(self):
+        """ test an invalid line stops the import after the previous batches """
+        lines = [recipe_line(i) for i in range(4)] + [recipe_line(4, price='cheap')]
+
+        with self.assertRaisesMessage(CommandError, 'line 5: '):
+            self._import(lines, batch_size=3)
+
+        self.assertEqual(Recipe.objects.count(), 3)
+
+    def test_import_invalid_line_resume_offset(self):
+        """ test the error points to the start of the batch that was not written """
+        lines = [recipe_line(i) for i in range(4)] + [recipe_line(4, title='')]
+
+        with self.assertRaisesMessage(CommandError, 'resume with --offset 3.'):
+            self._import(lines, batch_size=3)
+
+    def test_import_name_missing(self):
+        """ test an ingredient object without a name is reported with its line and resume offset """
+        lines = [recipe_line(i) for i in range(4)] + [recipe_line(4, ingredients=[{'amount': '1 cup'}])]
+
+        with self.assertRaisesMessage(CommandError, 'line 5: [\'a tag or ingredient object has no "name"\']. Fix it and resume with --offset 3.'):
+            self._import(lines, batch_size=3)
+
+        self.assertEqual(Recipe.objects.count(), 3)
+
+    def test_import_names_not_list(self):
+        """ test tags given as a string are rejected, not split into one tag per character """
+        with self.assertRaisesMessage(CommandError, 'line 2: [\'"tags" must be a list\']'):
+            self._import([recipe_line(0), recipe_line(1, tags='vegan')])
+
+        self.assertFalse(Tag.objects.filter(name='v').exists())
+
+    def test_import_negative_offset(self):
+        """ test a negative offset is rejected """
+        with self.assertRaisesMessage(CommandError, '--offset must not be negative.'):
+            self._import([recipe_line(0)], offset=-1)
+
+    def test_import_unknown_user(self):
+        """ test importing for an unknown user fails """
+        with self.assertRaises(CommandError):
+            call_command('import_recipes', 'recipes.jsonl', user='nobody@email.com')
+
+
+class RecountCommandTests(TestCase):
+    """ test the recount command """
+    def test_recount_repairs_drift(self):
+        """ test the drifted counts are repaired and the others left alone """
+        user = get_user_model().objects.create_user(email='test@email.com', password='testpassword')
+        recipe = Recipe.objects.create(user=user, title='test recipe', time_minutes=5, price=Decimal('5.00'))
+        vegan = Tag.objects.create(user=user, name='vegan')
+        Tag.objects.create(user=user, name='dessert')
+        salt = Ingredient.objects.create(user=user, name='salt')
+        recipe.tags.add(vegan)
+        recipe.ingredients.add(salt)
+        Tag.objects.filter(id=vegan.id).update(recipe_count=5)
+        Ingredient.objects.filter(id=salt.id).update(recipe_count=0)
+
+        out = StringIO()
+        call_command('recount', stdout=out)
+
+        self.assertEqual(dict(Tag.objects.values_list('name', 'recipe_count')), {'vegan': 1, 'dessert': 0})
+        self.assertEqual(Ingredient.objects.get().recipe_count, 1)
+        self.assertIn('Repaired the recipe count of 1 tags and 1 ingredients.', out.getvalue())
+
+    def test_recount_unknown_user(self):
+        """ test an unknown user is reported """
+        with self.assertRaises(CommandError):
+            call_command('recount', user='nobody@email.com')
+
+
+class SeedDataCommandTests(TestCase):
+    """ test the seed_data command """
+    def test_seed_data(self):
+        """ test users are created with their recipes, and reused by a second run """
+        call_command('seed_data', users=2, recipes=5, batch_size=2, stdout=StringIO())
+        call_command('seed_data', users=2, recipes=5, stdout=StringIO())
+
+        users = get_user_model().objects.filter(email__startswith='seed')
+        self.assertEqual(users.count(), 2)
+        for user in users:
+            self.assertEqual(Recipe.objects.filter(user=user).count(), 10)
+            self.assertTrue(user.check_password('seedpassword'))
+        recipe = Recipe.objects.first()
+        self.assertGreaterEqual(recipe.ingredients.count(), 3)
+        # the recipe counts of the seeded tags and ingredients are kept as they are written
+        self.assertIn('of 0 tags and 0 ingredients', call_command('recount', stdout=StringIO()))
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class BenchmarkApiCommandTests(TestCase):
+    """ test the benchmark_api command """
+    def test_benchmark_api(self):
+        """ test every route is measured, the results written to json and the writes rolled back """
+        call_command('seed_data', users=1, recipes=30, stdout=StringIO())
+        output = os.path.join(tempfile.mkdtemp(), 'benchmark.json')
+        self.addCleanup(os.remove, output)
+        recipes = Recipe.objects.count()
+        user_id = get_user_model().objects.get(email='seed0@example.com').id
+        version = get_version(user_id)
+        err = StringIO()
+
+        call_command(
+            'benchmark_api', user='seed0@example.com', requests=2, warmup=1, output=output,
+            stdout=StringIO(), stderr=err,
+        )
+
+        with open(output) as file:
+            report = json.load(file)
+        self.assertEqual(err.getvalue(), '')
+        self.assertEqual(report['user_recipes'], 30)
+        for name, result in report['routes'].items():
+            self.assertEqual(result['requests'], 2)
+            self.assertTrue(all(int(status) < 400 for status in result['statuses']), name)
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+        self.assertEqual(Recipe.objects.count(), recipes)
+        self.assertFalse(get_user_model().objects.filter(email__startswith='benchmark').exists())
+        # the writes did not bump the version of the user in the cache
+        self.assertEqual(get_version(user_id), version)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class LoadTestCommandTests(LiveServerTestCase):
+    """ test the load_test command against the live test server """
+    def test_load_test(self):
+        """ test the sync and async routes are requested concurrently and the results written to json """
+        call_command('seed_data', users=1, recipes=5, stdout=StringIO())
+        output = os.path.join(tempfile.mkdtemp(), 'load.json')
+        self.addCleanup(os.remove, output)
+
+        call_command(
+            'load_test', url=self.live_server_url, user='seed0@example.com', concurrency=2, requests=4,
+            no_cache=True, output=output, stdout=StringIO(),
+        )
+
+        with open(output) as file:
+            report = json.load(file)
+        self.assertIn('recipe list', report['routes'])
+        self.assertIn('async recipe list', report['routes'])
+        for name, result in report['routes'].items():
+            self.assertEqual(result['statuses'], {'200': 4}, name)
@@ -0,0 +1,123 @@
+import os
+import tempfile
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db.models import Count
+from django.urls import reverse
+from rest_framework.test import APIClient, APITestCase
+
+from core.models import Ingredient, Recipe, Tag
+
+
+def create_recipe(user, **params):
+    defaults = {'title': 'test recipe', 'time_minutes': 7, 'price': Decimal('7.90')}
+    defaults.update(params)
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class RecipeCountTest(APITestCase):
+    """ test the recipe_count of tags and ingredients follows every way of linking and unlinking recipes """
+    def setUp(self) -> None:
+        self.user = get_user_model().objects.create_user(email='test@email.com', password='testpassword')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.tags = [Tag.objects.create(user=self.user, name=f'tag {i}') for i in range(3)]
+        self.recipes = [create_recipe(self.user, title=f'recipe {i}') for i in range(3)]
+
+    def assertCountsMatch(self):
+        for model in (Tag, Ingredient):
+            stored = dict(model.objects.values_list('id', 'recipe_count'))
+            actual = dict(model.objects.annotate(actual=Count('recipe')).values_list('id', 'actual'))
+            self.assertEqual(stored, actual)
+
+    def recipe_counts(self):
+        return [tag.recipe_count for tag in Tag.objects.order_by('id')]
+
+    def test_add_remove_clear(self):
+        """ test adding, removing and clearing the tags of a recipe """
+        recipe = self.recipes[0]
+        recipe.tags.add(*self.tags)
+        recipe.tags.add(self.tags[0])
+        self.recipes[1].tags.add(self.tags[0])
+        self.assertEqual(self.recipe_counts(), [2, 1, 1])
+
+        recipe.tags.remove(self.tags[1], Tag.objects.create(user=self.user, name='never linked'))
+        self.assertEqual(self.recipe_counts(), [2, 0, 1, 0])
+
+        recipe.tags.clear()
+        self.assertEqual(self.recipe_counts(), [1, 0, 0, 0])
+        self.assertCountsMatch()
+
+    def test_set(self):
+        """ test replacing the tags of a recipe """
+        self.recipes[0].tags.set(self.tags[:2])
+        self.recipes[0].tags.set(self.tags[1:])
+
+        self.assertEqual(self.recipe_counts(), [0, 1, 1])
+
+    def test_reverse_relations(self):
+        """ test linking and unlinking the recipes of a tag """
+        tag = self.tags[0]
+        tag.recipe_set.add(*self.recipes)
+        tag.recipe_set.remove(self.recipes[0])
+        self.assertEqual(self.recipe_counts(), [2, 0, 0])
+
+        tag.recipe_set.clear()
+        self.assertEqual(self.recipe_counts(), [0, 0, 0])
+        self.assertCountsMatch()
+
+    def test_delete_recipes(self):
+        """ test deleting a recipe, or many at once, unlinks them """
+        for recipe in self.recipes:
+            recipe.tags.add(*self.tags[:2])
+
+        self.recipes[0].delete()
+        self.assertEqual(self.recipe_counts(), [2, 2, 0])
+
+        Recipe.objects.filter(id__in=[recipe.id for recipe in self.recipes[1:]]).delete()
+        self.assertEqual(self.recipe_counts(), [0, 0, 0])
+
+    def test_api_create_update(self):
+        """ test creating and updating recipes with their tags and ingredients """
+        payload = {'title': 'new', 'time_minutes': 5, 'price': '5.00', 'tags': [{'name': 'tag 0'}, {'name': 'new tag'}],
+                   'ingredients': [{'name': 'salt'}]}
+        res = self.client.post(reverse('recipe-list'), payload, format='json')
+        url = reverse('recipe-detail', args=[res.data['id']])
+        self.client.patch(url, {'tags': [{'name': 'new tag'}, {'name': 'tag 2'}], 'ingredients': []}, format='json')
+
+        self.assertEqual(Tag.objects.get(name='new tag').recipe_count, 1)
+        self.assertEqual(self.recipe_counts(), [0, 0, 1, 1])
+        self.assertEqual(Ingredient.objects.get(name='salt').recipe_count, 0)
+        self.assertCountsMatch()
+
+    def test_api_bulk(self):
+        """ test the bulk create and update count the links they insert and delete """
+        payload = [
+            {'title': f'bulk {i}', 'time_minutes': 5, 'price': '5.00', 'tags': [{'name': 'tag 0'}, {'name': f'tag {i}'}],
+             'ingredients': [{'name': 'salt'}]}
+            for i in range(1, 3)
+        ]
+        res = self.client.post(reverse('recipe-bulk'), payload, format='json')
+        self.assertEqual(self.recipe_counts(), [2, 1, 1])
+
+        updates = [{'id': res.data[0]['id'], 'tags': [{'name': 'tag 2'}]}]
+        self.client.patch(reverse('recipe-bulk'), updates, format='json')
+
+        self.assertEqual(self.recipe_counts(), [1, 0, 2])
+        self.assertEqual(Ingredient.objects.get(name='salt').recipe_count, 2)
+        self.assertCountsMatch()
+
+    def test_import(self):
+        """ test the recipes written by import_recipes are counted """
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl', delete=False) as file:
+            file.write('{"title": "a", "time_minutes": 1, "price": "1.00", "tags": ["tag 0"], "ingredients": ["salt"]}\n')
+            file.write('{"title": "b", "time_minutes": 1, "price": "1.00", "tags": ["tag 0", "tag 1"], "ingredients": []}\n')
+        self.addCleanup(os.remove, file.name)
+
+        call_command('import_recipes', file.name, user=self.user.email, stdout=StringIO())
+
+        self.assertEqual(self.recipe_counts(), [2, 1, 0])
+        self.assertCountsMatch()
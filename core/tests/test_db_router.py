@@ -0,0 +1,121 @@
+from contextlib import contextmanager
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.db_router import ReplicaRouter, replica_reads
+from core.models import Recipe, Tag
+
+RECIPE_URL = reverse('recipe-list')
+
+
+@contextmanager
+def routed_reads():
+    """ record the (model, alias) of the reads routed, None when left to the primary """
+    reads = []
+    db_for_read = ReplicaRouter.db_for_read
+
+    def record(router, model, **hints):
+        alias = db_for_read(router, model, **hints)
+        reads.append((model, alias))
+        return alias
+
+    with mock.patch.object(ReplicaRouter, 'db_for_read', record):
+        yield reads
+
+
+# the test database has no replica, the default alias stands in for one
+@override_settings(DATABASE_REPLICAS=['default'], DATABASE_PIN_SECONDS=60)
+class ReplicaRouterTest(TestCase):
+    """ test the reads of the recipe views go to a replica, unless the user wrote lately """
+    def setUp(self) -> None:
+        self.user = get_user_model().objects.create_user(email='test@email.com', password='testpassword')
+        Recipe.objects.create(user=self.user, title='test recipe', time_minutes=7, price=Decimal('7.90'))
+        Tag.objects.create(user=self.user, name='vegan')
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def assertReadsFrom(self, reads, model, alias):
+        aliases = {read_alias for read_model, read_alias in reads if read_model is model}
+        self.assertEqual(aliases, {alias})
+
+    def test_router(self):
+        """ test only the reads under replica_reads go to a replica """
+        router = ReplicaRouter()
+
+        self.assertIsNone(router.db_for_read(Recipe))
+        with replica_reads():
+            self.assertEqual(router.db_for_read(Recipe), 'default')
+            self.assertEqual(router.db_for_write(Recipe), 'default')
+        self.assertIsNone(router.db_for_read(Recipe))
+        self.assertFalse(router.allow_migrate('replica_1', 'core'))
+
+    def test_reads_from_replica(self):
+        """ test the recipe and tag lists and the recipe detail read from a replica """
+        recipe = Recipe.objects.get()
+        for url, model in ((RECIPE_URL, Recipe), (reverse('recipe-detail', args=[recipe.id]), Recipe), (reverse('tag-list'), Tag)):
+            with self.subTest(url=url), routed_reads() as reads:
+                res = self.client.get(url)
+
+                self.assertEqual(res.status_code, status.HTTP_200_OK)
+                self.assertReadsFrom(reads, model, 'default')
+
+    def test_async_reads_from_replica(self):
+        """ test the async recipe list reads from a replica """
+        token = Token.objects.create(user=self.user)
+
+        with routed_reads() as reads:
+            res = self.client.get(reverse('async-recipe-list'), HTTP_AUTHORIZATION=f'Token {token.key}')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertReadsFrom(reads, Recipe, 'default')
+
+    def test_write_pins_to_primary(self):
+        """ test the reads of a user who just wrote go to the primary until the pin expires """
+        with routed_reads() as reads:
+            res = self.client.post(RECIPE_URL, {'title': 'new recipe', 'time_minutes': 5, 'price': '5.00'})
+            self.client.get(RECIPE_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertReadsFrom(reads, Recipe, None)
+
+        cache.clear()
+        with routed_reads() as reads:
+            self.client.get(RECIPE_URL)
+        self.assertReadsFrom(reads, Recipe, 'default')
+
+    def test_pin_seen_by_other_worker(self):
+        """ test a write handled by another worker sharing the cache pins the reads, the pin is kept nowhere else """
+        with mock.patch('core.db_router.cache', caches.create_connection('default')):
+            self.client.post(RECIPE_URL, {'title': 'new recipe', 'time_minutes': 5, 'price': '5.00'})
+
+        with routed_reads() as reads:
+            self.client.get(RECIPE_URL)
+
+        self.assertReadsFrom(reads, Recipe, None)
+
+    def test_pin_is_per_user(self):
+        """ test the write of a user does not pin the reads of another """
+        other = get_user_model().objects.create_user(email='other@email.com', password='testpassword')
+        Recipe.objects.create(user=other, title='other recipe', time_minutes=7, price=Decimal('7.90'))
+
+        with routed_reads() as reads:
+            self.client.get(RECIPE_URL)
+
+        self.assertReadsFrom(reads, Recipe, 'default')
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_without_replicas(self):
+        """ test every read goes to the primary when no replica is configured """
+        with routed_reads() as reads:
+            self.client.get(RECIPE_URL)
+
+        self.assertReadsFrom(reads, Recipe, None)
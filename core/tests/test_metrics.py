@@ -0,0 +1,102 @@
+import json
+import os
+import shutil
+import tempfile
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient, APITestCase
+
+from core.metrics import store
+from core.models import Recipe, Tag
+
+METRICS_URL = reverse('metrics')
+
+
+class MetricsTests(APITestCase):
+    """ test the /metrics endpoint """
+    def setUp(self) -> None:
+        cache.clear()
+        store.reset()
+        self.user = get_user_model().objects.create_user(email='test@email.com', password='testpassword')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        Recipe.objects.create(user=self.user, title='test recipe', time_minutes=7, price=Decimal('7.9'))
+
+    def metrics(self, **headers):
+        res = self.client.get(METRICS_URL, **headers)
+        return res, res.content.decode()
+
+    def test_requests_labelled_by_view_and_action(self):
+        """ test requests are counted by viewset and action, with their status """
+        tag = Tag.objects.create(user=self.user, name='vegan')
+        self.client.get(reverse('recipe-list'))
+        self.client.get(reverse('recipe-list'))
+        self.client.patch(reverse('tag-detail', args=[tag.id]), {'name': 'vegetarian'})
+        self.client.get(reverse('me'))
+
+        res, text = self.metrics()
+
+        self.assertEqual(res['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        self.assertIn('http_requests_total{view="recipe-list",method="GET",status="200"} 2.0', text)
+        self.assertIn('http_requests_total{view="tag-partial_update",method="PATCH",status="200"} 1.0', text)
+        self.assertIn('http_requests_total{view="me",method="GET",status="200"} 1.0', text)
+        self.assertIn('# TYPE http_request_duration_seconds histogram', text)
+        self.assertIn('http_request_duration_seconds_bucket{view="recipe-list",le="+Inf"} 2.0', text)
+        self.assertIn('http_request_duration_seconds_count{view="recipe-list"} 2.0', text)
+        # the first list misses the response cache and runs 3 queries, the second one none
+        self.assertIn('http_request_queries_sum{view="recipe-list"} 3.0', text)
+        self.assertIn('http_request_queries_bucket{view="recipe-list",le="0"} 1.0', text)
+        self.assertIn('response_cache_hits_total 1.0', text)
+
+    def test_unknown_path_not_labelled_by_path(self):
+        """ test requests to unknown paths share one series """
+        self.client.get('/api/recipe/nothing-here')
+
+        _, text = self.metrics()
+
+        self.assertIn('http_requests_total{view="unmatched",method="GET",status="404"} 1.0', text)
+
+    def test_processes_added_up(self):
+        """ test the samples written by other worker processes are added to the ones of this process """
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        with open(os.path.join(directory, '1-1.json'), 'w') as file:
+            json.dump({'http_requests_total{view="recipe-list",method="GET",status="200"}': 5}, file)
+
+        with self.settings(METRICS_DIR=directory):
+            self.client.get(reverse('recipe-list'))
+            _, text = self.metrics()
+
+        self.assertIn('http_requests_total{view="recipe-list",method="GET",status="200"} 6.0', text)
+        self.assertEqual(len(os.listdir(directory)), 2)
+
+    def test_idle_process_flushes(self):
+        """ test the samples observed after a flush are written once METRICS_FLUSH_SECONDS pass without requests """
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+
+        with self.settings(METRICS_DIR=directory, METRICS_FLUSH_SECONDS=1):
+            self.client.get(reverse('recipe-list'))
+            self.client.get(reverse('recipe-list'))
+            timer = store.timer
+            path = os.path.join(directory, store.name)
+            with open(path) as file:
+                self.assertEqual(json.load(file)['http_requests_total{view="recipe-list",method="GET",status="200"}'], 1)
+            timer.join(5)
+
+            with open(path) as file:
+                self.assertEqual(json.load(file)['http_requests_total{view="recipe-list",method="GET",status="200"}'], 2)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_token_required(self):
+        """ test the endpoint requires the bearer token when one is set """
+        res, _ = self.metrics()
+        self.assertEqual(res.status_code, 401)
+
+        res, text = self.metrics(HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('http_requests_total', text)
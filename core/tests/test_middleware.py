@@ -0,0 +1,79 @@
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient, APITestCase
+
+from core.models import Recipe, Tag
+
+RECIPE_URL = reverse('recipe-list')
+
+
+def server_timing(response):
+    """ return the Server-Timing header as a dict of metric name to its parameters """
+    metrics = {}
+    for metric in response['Server-Timing'].split(', '):
+        name, *params = metric.split(';')
+        metrics[name] = dict(param.split('=', 1) for param in params)
+    return metrics
+
+
+class RequestTimingMiddlewareTests(APITestCase):
+    """ test the request timing middleware """
+    def setUp(self) -> None:
+        cache.clear()
+        self.user = get_user_model().objects.create_user(email='test@email.com', password='testpassword')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=self.user).key}')
+        recipe = Recipe.objects.create(user=self.user, title='test recipe', time_minutes=7, price=Decimal('7.9'))
+        recipe.tags.add(Tag.objects.create(user=self.user, name='vegan'))
+
+    def test_server_timing_header(self):
+        """ test the header holds the queries and the time of each section """
+        res = self.client.get(RECIPE_URL)
+
+        metrics = server_timing(res)
+        self.assertEqual(set(metrics), {'db', 'auth', 'serialize', 'render', 'total'})
+        # a query more than the view runs, the token is checked again once cached
+        self.assertEqual(metrics['db']['desc'], '"5 queries"')
+        self.assertGreater(float(metrics['total']['dur']), float(metrics['serialize']['dur']))
+
+    def test_cached_response_has_no_serialize(self):
+        """ test a response served from the cache runs no queries and no serializer """
+        self.client.get(RECIPE_URL)
+
+        metrics = server_timing(self.client.get(RECIPE_URL))
+
+        self.assertEqual(metrics['db']['desc'], '"0 queries"')
+        self.assertNotIn('serialize', metrics)
+
+    @override_settings(SERVER_TIMING_HEADER=False)
+    def test_server_timing_header_disabled(self):
+        """ test the header can be turned off """
+        res = self.client.get(RECIPE_URL)
+
+        self.assertNotIn('Server-Timing', res)
+
+    @override_settings(SLOW_REQUEST_MS=0)
+    def test_slow_request_logged(self):
+        """ test a request above the time threshold is logged with its slowest queries """
+        with self.assertLogs('recipe.requests', 'WARNING') as logs:
+            self.client.get(RECIPE_URL)
+
+        self.assertIn(f'slow request GET {RECIPE_URL} 200', logs.output[0])
+        self.assertIn('5 queries', logs.output[0])
+        self.assertIn('SELECT', logs.output[0])
+
+    @override_settings(SLOW_REQUEST_QUERIES=3)
+    def test_many_queries_logged(self):
+        """ test a request above the query threshold is logged """
+        with self.assertLogs('recipe.requests', 'WARNING'):
+            self.client.get(RECIPE_URL)
+
+    def test_fast_request_not_logged(self):
+        """ test requests under the thresholds are not logged """
+        with self.assertNoLogs('recipe.requests', 'WARNING'):
+            self.client.get(RECIPE_URL)
@@ -1,3 +1,4 @@
+from django.db import IntegrityError
 from django.test import TestCase
 from django.contrib.auth import get_user_model
 from decimal import Decimal
@@ -58,9 +59,29 @@ class ModelTests(TestCase):
 
         self.assertEqual(tag.__str__(), tag.name)
     
+    def test_tag_name_unique_per_user(self):
+        """ test a user can not have two tags with the same name, while other users can """
+        user = create_user()
+        Tag.objects.create(user=user, name='tag1')
+        Tag.objects.create(user=create_user(email='test2@email.com'), name='tag1')
+
+        with self.assertRaises(IntegrityError):
+            Tag.objects.create(user=user, name='tag1')
+
     def test_create_ingredient(self):
         """ test create ingredient """
         user = create_user()
         ingredient = Ingredient.objects.create(user=user, name='ingredient')
 
         self.assertEqual(ingredient.__str__(), ingredient.name)
+
+    def test_recipe_touched_by_tag_link(self):
+        """ test linking a tag marks the recipe as modified """
+        user = create_user()
+        recipe = Recipe.objects.create(user=user, title='test recipe name', time_minutes=5, price=Decimal('6.90'))
+        updated_at = recipe.updated_at
+
+        recipe.tags.add(Tag.objects.create(user=user, name='tag1'))
+
+        recipe.refresh_from_db()
+        self.assertGreater(recipe.updated_at, updated_at)
@@ -0,0 +1,114 @@
+import io
+import uuid
+from datetime import date, datetime, time, timedelta, timezone
+from decimal import Decimal
+from unittest import mock, skipIf
+
+from django.test import SimpleTestCase
+from django.utils.translation import gettext_lazy
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.serializer_helpers import ReturnDict, ReturnList
+
+from core import renderers
+from core.renderers import FastJSONParser, FastJSONRenderer, dumps, loads
+
+DATA = ReturnDict({
+    'id': 7,
+    'title': 'pão de queijo\u2028\u2029',
+    'price': Decimal('7.90'),
+    'ratio': 0.1,
+    'created_at': datetime(2022, 8, 1, 12, 30, 15, 123456, tzinfo=timezone.utc),
+    'local': datetime(2022, 8, 1, 12, 30, tzinfo=timezone(timedelta(hours=-3))),
+    'naive': datetime(2022, 8, 1, 12, 30),
+    'day': date(2022, 8, 1),
+    'at': time(12, 30, 15, 500),
+    'duration': timedelta(minutes=90),
+    'uuid': uuid.UUID('12345678-1234-5678-1234-567812345678'),
+    'label': gettext_lazy('This field is required.'),
+    'big': 2 ** 70,
+    'tags': ReturnList([{'id': 1, 'name': 'vegan'}, {'id': 2, 'name': 'café'}], serializer=None),
+    'empty': None,
+}, serializer=None)
+
+
+class JSONBackendMixin:
+    """ run the tests of a class with and without orjson """
+    def for_each_backend(self, test):
+        with self.subTest(backend='stdlib'), mock.patch.object(renderers, 'orjson', None):
+            test()
+        with self.subTest(backend='orjson' if renderers.orjson else 'stdlib'):
+            test()
+
+
+class FastJSONRendererTest(JSONBackendMixin, SimpleTestCase):
+    """ test the renderer writes the bytes of the rest framework renderer """
+    def test_same_output(self):
+        """ test decimals, dates, times, lazy strings and big integers keep their output """
+        expected = JSONRenderer().render(DATA)
+
+        self.for_each_backend(lambda: self.assertEqual(FastJSONRenderer().render(DATA), expected))
+
+    def test_indent(self):
+        """ test an indent asked for in the accept header is kept """
+        media_type = 'application/json; indent=4'
+        expected = JSONRenderer().render(DATA, media_type)
+
+        self.for_each_backend(lambda: self.assertEqual(FastJSONRenderer().render(DATA, media_type), expected))
+
+    def test_none(self):
+        """ test no data renders an empty body """
+        self.assertEqual(FastJSONRenderer().render(None), b'')
+
+    def test_non_string_keys(self):
+        """ test keys orjson does not accept fall back to the stdlib """
+        self.for_each_backend(lambda: self.assertEqual(dumps({1: 'a'}), b'{"1":"a"}'))
+
+
+@skipIf(renderers.orjson is None, 'orjson is not installed')
+class OrjsonBackendTest(SimpleTestCase):
+    def test_uses_orjson(self):
+        """ test the renderer writes with orjson when it is installed """
+        with mock.patch.object(renderers.orjson, 'dumps', wraps=renderers.orjson.dumps) as orjson_dumps:
+            FastJSONRenderer().render({'id': 1})
+
+        orjson_dumps.assert_called_once()
+
+
+class FastJSONParserTest(JSONBackendMixin, SimpleTestCase):
+    """ test the parser reads what the rest framework parser reads and raises its errors """
+    def parse(self, parser, body, encoding='utf-8'):
+        return parser.parse(io.BytesIO(body), 'application/json', {'encoding': encoding})
+
+    def test_same_data(self):
+        """ test a body is parsed like the rest framework parser does """
+        body = '{"title": "pão", "price": "7.90", "time_minutes": 7, "tags": [{"name": "café"}]}'.encode()
+        expected = self.parse(JSONParser(), body)
+
+        self.for_each_backend(lambda: self.assertEqual(self.parse(FastJSONParser(), body), expected))
+
+    def test_errors(self):
+        """ test invalid bodies and out of range constants raise the rest framework error """
+        for body in (b'{"title": ', b'{"price": NaN}', b'[1, 2,]'):
+            with self.assertRaises(ParseError) as expected:
+                self.parse(JSONParser(), body)
+
+            def check():
+                with self.assertRaises(ParseError) as raised:
+                    self.parse(FastJSONParser(), body)
+                self.assertEqual(str(raised.exception), str(expected.exception))
+
+            self.for_each_backend(check)
+
+    def test_other_encoding(self):
+        """ test a body in another charset is decoded by the rest framework parser """
+        body = '{"title": "pão"}'.encode('latin-1')
+
+        self.assertEqual(self.parse(FastJSONParser(), body, 'latin-1'), {'title': 'pão'})
+
+    def test_loads(self):
+        """ test loads parses text and bytes and raises the stdlib errors """
+        self.for_each_backend(lambda: self.assertEqual(loads('{"a": [1, 2.5]}'), loads(b'{"a": [1, 2.5]}')))
+        with self.assertRaises(ValueError):
+            loads('{"a": Infinity}')
@@ -0,0 +1,90 @@
+import heapq
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+_current = ContextVar('request_timings', default=None)
+
+
+class RequestTimings:
+    """ the queries of a request and the time it spends in named sections, like auth or serialize """
+    def __init__(self, slowest=3):
+        self.start = time.perf_counter()
+        self.query_count = 0
+        self.db_time = 0.0
+        # (duration, sql) of the slowest queries, the fastest of them first
+        self.slowest_queries = []
+        self.slowest = slowest
+        self.sections = {}
+        self.open_sections = set()
+
+    def execute(self, execute, sql, params, many, context):
+        """ connection execute wrapper counting and timing every query """
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            self.query_count += 1
+            self.db_time += duration
+            if len(self.slowest_queries) < self.slowest:
+                heapq.heappush(self.slowest_queries, (duration, sql))
+            elif self.slowest:
+                heapq.heappushpop(self.slowest_queries, (duration, sql))
+
+    @contextmanager
+    def section(self, name):
+        """ time a section without its queries, a section opened again inside itself counts once """
+        if name in self.open_sections:
+            yield
+            return
+        self.open_sections.add(name)
+        start = time.perf_counter()
+        db_time = self.db_time
+        try:
+            yield
+        finally:
+            self.open_sections.discard(name)
+            self.add(name, time.perf_counter() - start - (self.db_time - db_time))
+
+    def add(self, name, duration):
+        self.sections[name] = self.sections.get(name, 0.0) + duration
+
+    def total(self):
+        return time.perf_counter() - self.start
+
+
+def start_timings(**kwargs):
+    """ start timing the current request, returns the token to stop it with """
+    timings = RequestTimings(**kwargs)
+    return timings, _current.set(timings)
+
+
+def stop_timings(token):
+    _current.reset(token)
+
+
+def current_timings():
+    """ the timings of the request being handled, None outside of the timing middleware """
+    return _current.get()
+
+
+@contextmanager
+def timed(name):
+    """ time a section of the current request, if any """
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    with timings.section(name):
+        yield
+
+
+class TimedSerializerMixin:
+    """ count the time spent turning instances into data as the serialize section of the request """
+    def to_representation(self, instance):
+        timings = _current.get()
+        if timings is None or 'serialize' in timings.open_sections:
+            return super().to_representation(instance)
+        with timings.section('serialize'):
+            return super().to_representation(instance)
@@ -0,0 +1,29 @@
+import hmac
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.views.static import serve
+
+from recipe_app.cache import cache_stats
+from .metrics import exposition, store
+
+
+def metrics(request):
+    """ expose the request metrics of every worker process in the prometheus text format """
+    token = settings.METRICS_TOKEN
+    if token and not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponse(status=401)
+
+    stats = cache_stats()
+    extra = [
+        ('response_cache_hits_total', 'counter', 'Responses served from the response cache.', stats['hits']),
+        ('response_cache_misses_total', 'counter', 'Responses missing from the response cache.', stats['misses']),
+    ]
+    return HttpResponse(exposition(store.collect(), extra), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def media(request, path):
+    """ serve an uploaded file, cached for good since the name of a file is never reused """
+    response = serve(request, path, document_root=settings.MEDIA_ROOT)
+    response['Cache-Control'] = settings.MEDIA_CACHE_CONTROL
+    return response
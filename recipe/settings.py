@@ -10,8 +10,12 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.1/ref/settings/
 """
 
+import os
+from datetime import timedelta
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -37,6 +41,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 
     'rest_framework',
     'rest_framework.authtoken',
@@ -48,6 +53,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.RequestTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -81,17 +87,85 @@ WSGI_APPLICATION = 'recipe.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.1/ref/settings/#databases
 
+def env_int(name, default):
+    value = os.environ.get(name)
+    return default if value in (None, '') else int(value)
+
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.postgresql',
-        'NAME': 'postgres',
-        'USER': 'postgres',
-        'PASSWORD': 'postgres',
-        'HOST': 'db',
-        'PORT': 5432,
+        'NAME': os.environ.get('POSTGRES_NAME', 'postgres'),
+        'USER': os.environ.get('POSTGRES_USER', 'postgres'),
+        'PASSWORD': os.environ.get('POSTGRES_PASSWORD', 'postgres'),
+        'HOST': os.environ.get('POSTGRES_HOST', 'db'),
+        'PORT': env_int('POSTGRES_PORT', 5432),
+        # keep connections open between requests, checking them first so a dropped one is replaced;
+        # the threads of an asgi server do not outlive their request, set DB_CONN_MAX_AGE=0 there
+        'CONN_MAX_AGE': env_int('DB_CONN_MAX_AGE', 60),
+        'CONN_HEALTH_CHECKS': os.environ.get('DB_CONN_HEALTH_CHECKS', '1') == '1',
+    }
+}
+
+# replicas of the primary, as comma separated host or host:port, with its name, user and password;
+# the recipe, tag and ingredient reads of users who did not write in DATABASE_PIN_SECONDS go to them
+for number, replica in enumerate(filter(None, os.environ.get('POSTGRES_REPLICAS', '').split(',')), 1):
+    host, _, port = replica.strip().partition(':')
+    DATABASES[f'replica_{number}'] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'PORT': int(port) if port else DATABASES['default']['PORT'],
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['core.db_router.ReplicaRouter']
+DATABASE_PIN_SECONDS = env_int('DB_PIN_SECONDS', 5)
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.1/topics/cache/
+# invalidations, revocations and read-your-writes pins only reach the cache they are sent to, so
+# deployments with several processes must share one: CACHE_URL=redis://host:6379/0 (needs the
+# redis package) or CACHE_URL=memcached://host:11211 (needs pymemcache). Without it each process
+# has a cache of its own, enough for the tests and a single process
+
+CACHE_BACKENDS = {
+    'redis': 'django.core.cache.backends.redis.RedisCache',
+    'memcached': 'django.core.cache.backends.memcached.PyMemcacheCache',
+}
+cache_scheme, _, cache_location = os.environ.get('CACHE_URL', '').partition('://')
+if cache_scheme:
+    if cache_scheme not in CACHE_BACKENDS:
+        raise ImproperlyConfigured(f'CACHE_URL must start with {" or ".join(f"{name}://" for name in CACHE_BACKENDS)}.')
+    CACHES = {
+        'default': {
+            'BACKEND': CACHE_BACKENDS[cache_scheme],
+            'LOCATION': os.environ['CACHE_URL'] if cache_scheme == 'redis' else cache_location,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
     }
+
+# seconds an authentication token stays cached after its first lookup
+AUTH_TOKEN_CACHE_TTL = 300
+
+# jwt mode of the token endpoint, access tokens are checked against the cache only, so their
+# revocations reach every worker through a shared cache (CACHE_URL); revoked refresh tokens are
+# kept in the database so evictions never bring them back, see user.tokens
+SIMPLE_JWT = {
+    'ACCESS_TOKEN_LIFETIME': timedelta(minutes=5),
+    'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
+    'AUTH_HEADER_TYPES': ('Bearer',),
+    'AUTH_TOKEN_CLASSES': ('user.tokens.AccessToken',),
 }
 
+# seconds a recipe, tag or ingredient read stays cached, writes invalidate it before that
+RESPONSE_CACHE_TTL = 300
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
@@ -129,6 +203,27 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Uploaded files, the recipe images and their variants
+# their names are never reused, so they are served with a cache lifetime of a year; set
+# SERVE_MEDIA=0 when the web server or a cdn serves MEDIA_ROOT, with the same Cache-Control
+
+MEDIA_URL = '/media/'
+MEDIA_ROOT = os.environ.get('MEDIA_ROOT', BASE_DIR / 'media')
+SERVE_MEDIA = os.environ.get('SERVE_MEDIA', '1') == '1'
+MEDIA_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# largest recipe image accepted, and the side of the box each webp variant is resized to fit in
+IMAGE_MAX_UPLOAD_BYTES = 10 * 1024 * 1024
+IMAGE_VARIANTS = {'thumbnail': 320, 'large': 1280}
+IMAGE_WEBP_QUALITY = 80
+# processes rendering the variants off the request, and the images waiting for or being rendered
+# by them before uploads are refused; with no workers the variants are rendered in the request
+IMAGE_WORKERS = env_int('IMAGE_WORKERS', 2)
+IMAGE_MAX_PENDING = env_int('IMAGE_MAX_PENDING', 32)
+# seconds the files of a replaced or deleted image are kept, for the responses still linking to
+# them, before the purge_images command deletes them
+IMAGE_DELETE_GRACE_SECONDS = env_int('IMAGE_DELETE_GRACE_SECONDS', 24 * 60 * 60)
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.1/ref/settings/#default-auto-field
 
@@ -138,8 +233,47 @@ AUTH_USER_MODEL = 'core.User'
 
 REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    # json written and read with orjson when it is installed, with the output of the stock classes
+    'DEFAULT_RENDERER_CLASSES': [
+        'core.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'core.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
 }
 
+# default page size of the paginated endpoints and upper bound for their `page_size` query param
+API_PAGE_SIZE = 50
+API_MAX_PAGE_SIZE = 200
+# names returned by the tag and ingredient autocomplete, by default and at most, the users whose
+# name indexes each process keeps, the most names an index holds before searches go to the
+# database, and the shortest text searched for similar names on PostgreSQL
+AUTOCOMPLETE_LIMIT = 10
+AUTOCOMPLETE_MAX_LIMIT = 50
+AUTOCOMPLETE_CACHE_USERS = 1000
+AUTOCOMPLETE_MAX_CACHED_NAMES = 20000
+AUTOCOMPLETE_MIN_FUZZY_LENGTH = 3
+# most recipes accepted by one request of the bulk endpoint
+API_MAX_BULK_SIZE = 500
+# recipes fetched, prefetched and written per chunk by the streaming export
+EXPORT_CHUNK_SIZE = 2000
+
+# Server-Timing header of every response, and the requests logged as slow with their slowest queries
+SERVER_TIMING_HEADER = True
+SLOW_REQUEST_MS = 500
+SLOW_REQUEST_QUERIES = 30
+SLOW_REQUEST_SQL = 3
+
+# directory where every worker process writes its request metrics for /metrics to add up, it
+# must be emptied when the server starts; without it /metrics only shows the answering process
+METRICS_DIR = os.environ.get('METRICS_DIR')
+METRICS_FLUSH_SECONDS = 1
+# when set, /metrics requires an `Authorization: Bearer <token>` header
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
 SPECTACULAR_SETTINGS = {
     'TITLE': 'RECIPE API',
     'DESCRIPTION': 'API que prove receitas para comidas',
@@ -13,16 +13,23 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include
 from drf_spectacular.views import SpectacularAPIView, SpectacularRedocView, SpectacularSwaggerView
 
+from core.views import media, metrics
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/user/', include('user.urls')),
     path('api/recipe/', include('recipe_app.urls')),
+    path('metrics', metrics, name='metrics'),
     # 
     path('api/schema/', SpectacularAPIView.as_view(), name='schema'),
     path('api/docs/', SpectacularSwaggerView.as_view(url_name='schema'), name='apí-docs'),
     path('api/redoc/', SpectacularRedocView.as_view(url_name='schema'), name='api-redoc'),
 ]
+
+if settings.SERVE_MEDIA:
+    urlpatterns.append(path(f'{settings.MEDIA_URL.strip("/")}/<path:path>', media, name='media'))
@@ -0,0 +1,198 @@
+import functools
+from base64 import b64decode, b64encode
+from urllib.parse import parse_qs, urlencode
+
+from django.conf import settings
+from django.http import HttpResponse
+from rest_framework.exceptions import (
+    APIException, AuthenticationFailed, MethodNotAllowed, NotAuthenticated, NotFound, ValidationError,
+)
+from rest_framework.utils.urls import replace_query_param
+
+from core.db_router import areads_from_replica, replica_reads
+from core.models import Ingredient, Recipe, Tag
+from core.renderers import dumps
+from user.authentication import CachedTokenAuthentication, ClaimsJWTAuthentication
+from .cache import acached_data, aresponse_key
+from .fast import row_serializer
+from .filters import filter_linked, parse_flag, parse_ids, parse_match, parse_names
+from .serializers import RecipeDetailSerializer, RecipeSerializer, TagDetailSerializer
+
+AUTHENTICATORS = [CachedTokenAuthentication(), ClaimsJWTAuthentication()]
+
+
+def json_response(data, status=200):
+    return HttpResponse(dumps(data), status=status, content_type='application/json')
+
+
+def error_response(exc):
+    """ render an api exception the way the rest framework exception handler does """
+    detail = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+    return json_response(detail, status=exc.status_code)
+
+
+def async_api_view(view):
+    """ only allow reads of authenticated users on an async view, and render api errors """
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            response = error_response(MethodNotAllowed(request.method))
+            response['Allow'] = 'GET, HEAD'
+            return response
+        try:
+            for authenticator in AUTHENTICATORS:
+                user_auth = await authenticator.aauthenticate(request)
+                if user_auth is not None:
+                    break
+            else:
+                raise NotAuthenticated()
+            request.user, request.auth = user_auth
+            if await areads_from_replica(request):
+                with replica_reads():
+                    return await view(request, *args, **kwargs)
+            return await view(request, *args, **kwargs)
+        except APIException as exc:
+            response = error_response(exc)
+            if isinstance(exc, (NotAuthenticated, AuthenticationFailed)):
+                response['WWW-Authenticate'] = AUTHENTICATORS[0].authenticate_header(request)
+            return response
+    return wrapper
+
+
+def page_size(request):
+    """ the page_size query param, capped like RecipeCursorPagination does """
+    try:
+        size = int(request.GET['page_size'])
+    except (KeyError, ValueError):
+        return settings.API_PAGE_SIZE
+    return min(size, settings.API_MAX_PAGE_SIZE) if size > 0 else settings.API_PAGE_SIZE
+
+
+def decode_cursor(request):
+    """ the (reverse, position) of the cursor param, in the format of the rest framework cursor pagination """
+    encoded = request.GET.get('cursor')
+    if encoded is None:
+        return False, None
+    try:
+        tokens = parse_qs(b64decode(encoded.encode('ascii')).decode('ascii'), keep_blank_values=True)
+        reverse = bool(int(tokens.get('r', ['0'])[0]))
+        position = tokens.get('p', [None])[0]
+        return reverse, None if position is None else int(position)
+    except (TypeError, ValueError):
+        raise NotFound('Invalid cursor')
+
+
+def cursor_link(request, reverse, position):
+    tokens = {'p': position, **({'r': '1'} if reverse else {})}
+    encoded = b64encode(urlencode(tokens).encode('ascii')).decode('ascii')
+    return replace_query_param(request.build_absolute_uri(), 'cursor', encoded)
+
+
+async def keyset_page(request, queryset, descending):
+    """
+    a page of rows ordered by id, with the next and previous links, whose cursors are
+    interchangeable with the ones of the synchronous views since ids are unique
+    """
+    reverse, position = decode_cursor(request)
+    size = page_size(request)
+    # a reverse cursor walks back from its position, in the opposite order
+    backwards = descending != reverse
+    if position is not None:
+        queryset = queryset.filter(**{'id__lt' if backwards else 'id__gt': position})
+    rows = [row async for row in queryset.order_by('-id' if backwards else 'id')[:size + 1]]
+    has_following = len(rows) > size
+    rows = rows[:size]
+    if reverse:
+        rows.reverse()
+
+    has_next, has_previous = (position is not None, has_following) if reverse else (has_following, position is not None)
+    if not rows:
+        # rest framework links back to the position of the cursor from an empty page
+        first = last = position
+    else:
+        first, last = rows[0]['id'], rows[-1]['id']
+    return {
+        'next': cursor_link(request, False, last) if has_next else None,
+        'previous': cursor_link(request, True, first) if has_previous else None,
+        'results': rows,
+    }
+
+
+def sparse_row_serializer(request, serializer_class):
+    """ the row serializer of the fields and expand query params, like the synchronous views """
+    fields, expand = request.GET.get('fields') or None, request.GET.get('expand')
+    return row_serializer(
+        serializer_class,
+        None if fields is None else parse_names(fields, 'fields', serializer_class.Meta.fields),
+        None if expand is None else parse_names(expand, 'expand', serializer_class.expandable),
+    )
+
+
+@async_api_view
+async def recipe_list(request):
+    """ list recipes of authenticated user, served without a worker thread per request """
+    if request.GET.get('search'):
+        raise ValidationError({'search': ['Search the recipes at /api/recipe/recipes.']})
+    serializer = sparse_row_serializer(request, RecipeSerializer)
+
+    async def page():
+        queryset = Recipe.objects.filter(user=request.user)
+        match_all = parse_match(request.GET.get('match'), 'match')
+        for relation in ('tags', 'ingredients'):
+            if request.GET.get(relation):
+                queryset = filter_linked(queryset, relation, parse_ids(request.GET[relation], relation), match_all)
+        data = await keyset_page(request, serializer.values(queryset), descending=True)
+        data['results'] = await serializer.aserialize(data['results'])
+        return data
+
+    data, hit = await acached_data(await aresponse_key(request), page)
+    response = json_response(data)
+    response['X-Cache'] = hit
+    return response
+
+
+@async_api_view
+async def recipe_detail(request, pk):
+    """ retrieve a recipe of authenticated user """
+    serializer = sparse_row_serializer(request, RecipeDetailSerializer)
+    recipe = await serializer.values(Recipe.objects.filter(user=request.user, pk=pk)).afirst()
+    if recipe is None:
+        raise NotFound()
+    return json_response((await serializer.aserialize([recipe]))[0])
+
+
+# the fields of the synchronous tag and ingredient views
+ATTR_FIELDS = TagDetailSerializer.Meta.fields
+
+
+def attr_views(model):
+    """ the async list and detail views of tags or ingredients """
+    @async_api_view
+    async def list_view(request):
+        if request.GET.get('ordering'):
+            raise ValidationError({'ordering': ['Order the tags and ingredients at /api/recipe/tags and /api/recipe/ingredients.']})
+        assigned_only = parse_flag(request.GET.get('assigned_only'), 'assigned_only')
+
+        async def page():
+            queryset = model.objects.filter(user=request.user)
+            if assigned_only:
+                queryset = queryset.filter(recipe_count__gt=0)
+            return await keyset_page(request, queryset.values(*ATTR_FIELDS), descending=False)
+
+        data, hit = await acached_data(await aresponse_key(request), page)
+        response = json_response(data)
+        response['X-Cache'] = hit
+        return response
+
+    @async_api_view
+    async def detail_view(request, pk):
+        obj = await model.objects.filter(user=request.user, pk=pk).values(*ATTR_FIELDS).afirst()
+        if obj is None:
+            raise NotFound()
+        return json_response(obj)
+
+    return list_view, detail_view
+
+
+tag_list, tag_detail = attr_views(Tag)
+ingredient_list, ingredient_detail = attr_views(Ingredient)
@@ -0,0 +1,143 @@
+import heapq
+import re
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db import connections
+from django.db.models.functions import Upper
+
+from core.operations import has_extension
+
+from .cache import get_version
+
+# where the words of a name start, a name matches the prefixes of each of its words
+WORD_START = re.compile(r'(?<!\w)\w')
+
+
+class NameIndex:
+    """
+    the tags or ingredients of a user, as a sorted list of the casefolded names and of their tails
+    from every later word on, so the names with a word starting with a prefix are a bisect away
+    """
+    def __init__(self, rows):
+        # (id, name, recipe_count) rows
+        self.rows = rows
+        keys = []
+        for position, (_, name, _) in enumerate(rows):
+            folded = name.casefold()
+            for match in WORD_START.finditer(folded):
+                # the tier of a match: 0 for the start of the name, 1 for a later word
+                keys.append((folded[match.start():], 0 if match.start() == 0 else 1, position))
+        keys.sort()
+        self.keys = keys
+
+    def search(self, prefix, limit):
+        """ the rows starting with the prefix, then the ones with a later word starting with it, the most used first """
+        prefix = prefix.casefold()
+        tiers = {}
+        for index in range(bisect_left(self.keys, (prefix,)), len(self.keys)):
+            key, tier, position = self.keys[index]
+            if not key.startswith(prefix):
+                break
+            tiers[position] = min(tier, tiers.get(position, tier))
+        best = heapq.nsmallest(
+            limit, tiers.items(), key=lambda item: (item[1], -self.rows[item[0]][2], self.rows[item[0]][1].casefold()),
+        )
+        return [self.rows[position] for position, _ in best]
+
+
+class NameIndexCache:
+    """ the name indexes of the users served lately by this process, each kept while its cache version is current """
+    def __init__(self, size):
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, model, user_id, version):
+        with self.lock:
+            entry = self.entries.get((model, user_id))
+            if entry is None or entry[0] != version:
+                return None
+            self.entries.move_to_end((model, user_id))
+            return entry[1]
+
+    def set(self, model, user_id, version, index):
+        with self.lock:
+            self.entries[(model, user_id)] = (version, index)
+            self.entries.move_to_end((model, user_id))
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+indexes = NameIndexCache(settings.AUTOCOMPLETE_CACHE_USERS)
+# whether pg_trgm is installed, by database alias
+_trigrams = {}
+
+
+def name_index(queryset, model, user_id):
+    """
+    the name index of the user, built from the queryset once per cache version; every write of the
+    user bumps the version, so a rename, a new tag or a new link rebuilds it. None when the user
+    has too many names to hold, their searches go to the database.
+    """
+    version = get_version(user_id)
+    index = indexes.get(model, user_id, version)
+    if index is None:
+        rows = list(queryset.values_list('id', 'name', 'recipe_count')[:settings.AUTOCOMPLETE_MAX_CACHED_NAMES + 1])
+        if len(rows) > settings.AUTOCOMPLETE_MAX_CACHED_NAMES:
+            return None
+        index = NameIndex(rows)
+        indexes.set(model, user_id, version, index)
+    return index
+
+
+def autocomplete(queryset, model, user_id, text, limit):
+    """
+    the (id, name, recipe_count) of the names of the queryset starting with the text, or with a
+    word starting with it, the most used first, filled up with fuzzy matches. Without an index the
+    database matches the name starts only, through the text_pattern_ops index on PostgreSQL.
+    """
+    index = name_index(queryset, model, user_id)
+    if index is not None:
+        rows = index.search(text, limit)
+    else:
+        rows = list(
+            queryset.filter(name__istartswith=text).order_by('-recipe_count', 'name')
+            .values_list('id', 'name', 'recipe_count')[:limit]
+        )
+    if len(rows) < limit:
+        rows += fuzzy_matches(queryset.exclude(id__in=[row[0] for row in rows]), text, limit - len(rows))
+    return rows
+
+
+def has_trigrams(alias):
+    """ whether pg_trgm is installed in the database, checked once per process """
+    if alias not in _trigrams:
+        _trigrams[alias] = has_extension(connections[alias], 'pg_trgm')
+    return _trigrams[alias]
+
+
+def fuzzy_matches(queryset, text, limit):
+    """
+    the names most similar to the text, through the trigram index on PostgreSQL with pg_trgm, or
+    else the most used names containing it
+    """
+    if has_trigrams(queryset.db):
+        if len(text) < settings.AUTOCOMPLETE_MIN_FUZZY_LENGTH:
+            return []
+        # the % operator on the indexed expression filters with the similarity threshold of pg_trgm
+        upper_name = Upper('name')
+        queryset = (
+            queryset.annotate(upper_name=upper_name, similarity=TrigramSimilarity(upper_name, text.upper()))
+            .filter(upper_name__trigram_similar=text.upper()).order_by('-similarity', '-recipe_count', 'name')
+        )
+    else:
+        queryset = queryset.filter(name__icontains=text).order_by('-recipe_count', 'name')
+    return list(queryset.values_list('id', 'name', 'recipe_count')[:limit])
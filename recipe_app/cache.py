@@ -0,0 +1,146 @@
+import hashlib
+import time
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import router, transaction
+from rest_framework.response import Response
+
+from core.db_router import pin_to_primary
+from core.models import Recipe
+
+# the versions are only kept in the cache, so the workers see each other's writes through a
+# cache they share, which check --deploy requires (core.E001); with a cache local to each process,
+# a worker serves its cached responses until RESPONSE_CACHE_TTL after a write made by another
+HITS_KEY = 'response-cache:hits'
+MISSES_KEY = 'response-cache:misses'
+
+
+def _version_key(user_id):
+    return f'response-cache:version:{user_id}'
+
+
+def _modified_key(user_id):
+    return f'response-cache:modified:{user_id}'
+
+
+def get_version(user_id):
+    """ return the current cache version of a user """
+    key = _version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        # start from the clock so an evicted counter never goes back to a used version
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+async def aget_version(user_id):
+    """ get_version for async views """
+    key = _version_key(user_id)
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, time.time_ns(), None)
+        version = await cache.aget(key)
+    return version
+
+
+def bump_version(user_id):
+    """
+    invalidate every cached response of a user, and read their data from the primary for a while;
+    inside a transaction the version is bumped again on commit, since a read running before the
+    commit still sees the old rows and would cache them under the version bumped now
+    """
+    _bump(user_id)
+    if transaction.get_connection(router.db_for_write(Recipe)).in_atomic_block:
+        transaction.on_commit(partial(_bump, user_id))
+
+
+def _bump(user_id):
+    pin_to_primary(user_id)
+    try:
+        cache.incr(_version_key(user_id))
+    except ValueError:
+        cache.add(_version_key(user_id), time.time_ns(), None)
+    cache.set(_modified_key(user_id), int(time.time()), None)
+
+
+def get_last_modified(user_id):
+    """ return the timestamp of the last write of a user, None when it is not known anymore """
+    return cache.get(_modified_key(user_id))
+
+
+def _count(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 1, None)
+
+
+async def _acount(key):
+    try:
+        await cache.aincr(key)
+    except ValueError:
+        await cache.aadd(key, 1, None)
+
+
+def cache_stats():
+    """ return the hit and miss counters of the response cache """
+    stats = cache.get_many([HITS_KEY, MISSES_KEY])
+    return {'hits': stats.get(HITS_KEY, 0), 'misses': stats.get(MISSES_KEY, 0)}
+
+
+def response_key(request):
+    """ return the cache key of a request, made of its user, cache version and full url """
+    url = hashlib.sha1(request.build_absolute_uri().encode()).hexdigest()
+    return f'response-cache:{request.user.id}:{get_version(request.user.id)}:{url}'
+
+
+async def aresponse_key(request):
+    """ response_key for async views """
+    url = hashlib.sha1(request.build_absolute_uri().encode()).hexdigest()
+    return f'response-cache:{request.user.id}:{await aget_version(request.user.id)}:{url}'
+
+
+async def acached_data(key, handler):
+    """ the cached data of a key, or the data returned by the async handler, cached when it is not None """
+    data = await cache.aget(key)
+    if data is not None:
+        await _acount(HITS_KEY)
+        return data, 'HIT'
+
+    await _acount(MISSES_KEY)
+    data = await handler()
+    if data is not None:
+        await cache.aset(key, data, settings.RESPONSE_CACHE_TTL)
+    return data, 'MISS'
+
+
+class CachedListMixin:
+    """ serve the list action from the per-user response cache """
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        # the key is built before the handler runs, so a write racing with it only bumps the version
+        key = response_key(request)
+        data = cache.get(key)
+        if data is not None:
+            _count(HITS_KEY)
+            response = Response(data)
+            response['X-Cache'] = 'HIT'
+            return response
+
+        _count(MISSES_KEY)
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, settings.RESPONSE_CACHE_TTL)
+        response['X-Cache'] = 'MISS'
+        return response
+
+
+class CachedResponseMixin(CachedListMixin):
+    """ serve the list and retrieve actions from the per-user response cache """
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
@@ -0,0 +1,73 @@
+import hashlib
+import time
+
+from django.db import transaction
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from .cache import get_last_modified, get_version
+
+
+def set_validators(response, etag, last_modified):
+    """ add the ETag and Last-Modified headers to a response """
+    response['ETag'] = quote_etag(etag)
+    response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+def list_etag(request):
+    """
+    the ETag of a list, changed exactly when the cache version of the user is; the url and the
+    media type rendered tell apart the filtered, sparse and otherwise rendered lists, like response_key
+    """
+    representation = hashlib.sha1(f'{request.build_absolute_uri()} {request.accepted_media_type}'.encode()).hexdigest()
+    return f'{request.user.id}-{get_version(request.user.id)}-{representation}'
+
+
+class ConditionalRecipeMixin:
+    """ answer conditional requests on recipes without running the queries and serializers of the view """
+    def list(self, request, *args, **kwargs):
+        last_modified = get_last_modified(request.user.id) or int(time.time())
+        return self._conditional_response(super().list, request, list_etag(request), last_modified, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._object_conditional_response(super().retrieve, request, *args, **kwargs)
+
+    def update(self, request, *args, **kwargs):
+        # the row stays locked from the check of If-Match to the end of the update, so two updates
+        # sent with the same ETag cannot both pass it
+        with transaction.atomic():
+            return self._object_conditional_response(super().update, request, *args, lock=True, **kwargs)
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        self._updated_at = serializer.instance.updated_at
+
+    def _object_conditional_response(self, handler, request, *args, lock=False, **kwargs):
+        lookup = {'user': request.user, 'pk': kwargs[self.lookup_url_kwarg or self.lookup_field]}
+        try:
+            queryset = self.queryset.model.objects.filter(**lookup)
+        except (TypeError, ValueError):
+            # not an id, the handler answers it with 404 like any recipe not found
+            queryset = self.queryset.none()
+        if lock:
+            queryset = queryset.select_for_update()
+        updated_at = queryset.values_list('updated_at', flat=True).first()
+        if updated_at is None:
+            return handler(request, *args, **kwargs)
+
+        response = self._conditional_response(handler, request, *self._object_validators(updated_at), *args, **kwargs)
+        if getattr(self, '_updated_at', None):
+            set_validators(response, *self._object_validators(self._updated_at))
+        return response
+
+    def _object_validators(self, updated_at):
+        return f'{updated_at.timestamp():.6f}', int(updated_at.timestamp())
+
+    def _conditional_response(self, handler, request, etag, last_modified, *args, **kwargs):
+        response = get_conditional_response(request, quote_etag(etag), last_modified)
+        if response is None:
+            response = handler(request, *args, **kwargs)
+        if 200 <= response.status_code < 300 or response.status_code == 304:
+            set_validators(response, etag, last_modified)
+        return response
@@ -0,0 +1,86 @@
+import csv
+import io
+from itertools import islice
+
+from rest_framework.renderers import BaseRenderer
+
+from core.renderers import dumps
+
+CSV_COLUMNS = ['id', 'title', 'time_minutes', 'price', 'description', 'link', 'tags', 'ingredients']
+# tag and ingredient names share one csv cell
+NAME_SEPARATOR = '|'
+
+
+def _json_line(data):
+    return dumps(data) + b'\n'
+
+
+class NDJSONRenderer(BaseRenderer):
+    """ one json document per line, errors are a single line """
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return _json_line(data) if data is not None else b''
+
+
+class CSVRenderer(BaseRenderer):
+    """ comma separated values with a header row, errors are field,message rows """
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if not data:
+            return b''
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(['field', 'message'])
+        for field, messages in data.items():
+            for message in messages if isinstance(messages, list) else [messages]:
+                writer.writerow([field, message])
+        return buffer.getvalue().encode()
+
+
+def _ndjson_lines(rows):
+    for row in rows:
+        yield _json_line(row)
+
+
+def _csv_lines(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_COLUMNS)
+    for row in rows:
+        row['tags'] = NAME_SEPARATOR.join(tag['name'] for tag in row['tags'])
+        row['ingredients'] = NAME_SEPARATOR.join(ingredient['name'] for ingredient in row['ingredients'])
+        writer.writerow(row[column] for column in CSV_COLUMNS)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+LINES = {'ndjson': _ndjson_lines, 'csv': _csv_lines}
+
+
+def _serialized(rows, serializer, chunk_size):
+    """ serialize the rows a chunk at a time, with one query per relation and chunk """
+    while chunk := list(islice(rows, chunk_size)):
+        yield from serializer.serialize(chunk)
+
+
+def export_recipes(queryset, serializer, format, chunk_size):
+    """ yield the recipes of the queryset, read through a row serializer, in the format, one chunk of rows at a time """
+    recipes = serializer.values(queryset.order_by('id')).iterator(chunk_size=chunk_size)
+    rows = _serialized(recipes, serializer, chunk_size)
+
+    # join the lines of a chunk so the server does not write every row apart
+    chunk = []
+    for line in LINES[format](rows):
+        chunk.append(line)
+        if len(chunk) >= chunk_size:
+            yield b''.join(chunk)
+            chunk = []
+    if chunk:
+        yield b''.join(chunk)
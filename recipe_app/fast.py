@@ -0,0 +1,130 @@
+from functools import lru_cache
+
+from django.http import Http404
+from rest_framework import serializers
+from rest_framework.response import Response
+
+from core.models import Recipe
+from core.timing import timed
+from .serializers import ImageURLField, ImageVariantsField
+
+# the fields whose db value is converted to their output
+CONVERTED_FIELDS = (serializers.DecimalField, ImageURLField, ImageVariantsField)
+
+
+class RecipeRowSerializer:
+    """
+    read-only serializer of recipe values() rows and their grouped tag and ingredient links, with
+    the output of the recipe serializer it is built from, fields and expand included, but without
+    the field by field machinery of rest framework
+    """
+    def __init__(self, serializer_class, fields=None, expand=None):
+        serializer = serializer_class(fields=fields, expand=expand)
+        self.relations = {
+            name: expand is None or name in expand for name in serializer_class.expandable if name in serializer.fields
+        }
+        # (name, is a relation, converter) of every field
+        self.plan = [
+            (name, name in self.relations, field.to_representation if isinstance(field, CONVERTED_FIELDS) else None)
+            for name, field in serializer.fields.items()
+        ]
+
+    def values(self, queryset, *extra):
+        """ the values() queryset of the rows, the id is always read to group the links by """
+        columns = dict.fromkeys(['id', *(name for name, relation, _ in self.plan if not relation), *extra])
+        return queryset.prefetch_related(None).values(*columns)
+
+    def link_querysets(self, ids):
+        """ (relation, expanded, queryset) of the links of the recipes, in the id order of the linked objects """
+        for relation, expanded in self.relations.items():
+            field = Recipe._meta.get_field(relation)
+            target = field.m2m_reverse_field_name()
+            links = field.remote_field.through.objects.filter(recipe_id__in=ids).order_by(f'{target}_id')
+            if expanded:
+                yield relation, expanded, links.values_list('recipe_id', f'{target}_id', f'{target}__name')
+            else:
+                yield relation, expanded, links.values_list('recipe_id', f'{target}_id')
+
+    def to_representation(self, rows, links):
+        with timed('serialize'):
+            data = []
+            for row in rows:
+                item = {}
+                for name, relation, convert in self.plan:
+                    if relation:
+                        item[name] = links[name].get(row['id'], [])
+                    else:
+                        value = row[name]
+                        item[name] = value if convert is None or value is None else convert(value)
+                data.append(item)
+            return data
+
+    def serialize(self, rows):
+        """ the output of a list of rows """
+        rows = list(rows)
+        links = {}
+        if rows:
+            ids = [row['id'] for row in rows]
+            for relation, expanded, queryset in self.link_querysets(ids):
+                links[relation] = group_links(queryset, expanded)
+        return self.to_representation(rows, links)
+
+    async def aserialize(self, rows):
+        """ serialize for async views """
+        links = {}
+        if rows:
+            ids = [row['id'] for row in rows]
+            for relation, expanded, queryset in self.link_querysets(ids):
+                links[relation] = group_links([link async for link in queryset], expanded)
+        return self.to_representation(rows, links)
+
+
+def group_links(links, expanded):
+    grouped = {}
+    if expanded:
+        for recipe_id, pk, name in links:
+            grouped.setdefault(recipe_id, []).append({'id': pk, 'name': name})
+    else:
+        for recipe_id, pk in links:
+            grouped.setdefault(recipe_id, []).append(pk)
+    return grouped
+
+
+@lru_cache(maxsize=256)
+def _row_serializer(serializer_class, fields, expand):
+    return RecipeRowSerializer(serializer_class, fields, expand)
+
+
+def row_serializer(serializer_class, fields=None, expand=None):
+    """ the row serializer of a serializer class and sparse fields, built once per combination """
+    return _row_serializer(
+        serializer_class, None if fields is None else tuple(fields), None if expand is None else tuple(expand),
+    )
+
+
+class FastReadMixin:
+    """ serve the list and retrieve actions from values() rows, see RecipeRowSerializer """
+    def list(self, request, *args, **kwargs):
+        serializer = self.get_row_serializer()
+        queryset = self.filter_queryset(self.get_queryset())
+        # the position of a search cursor is the rank
+        extra = ['rank'] if 'rank' in queryset.query.annotations else []
+        page = self.paginate_queryset(serializer.values(queryset, *extra))
+        if page is None:
+            return Response(serializer.serialize(serializer.values(queryset)))
+        return self.get_paginated_response(serializer.serialize(page))
+
+    def retrieve(self, request, *args, **kwargs):
+        serializer = self.get_row_serializer()
+        lookup = {self.lookup_field: kwargs[self.lookup_url_kwarg or self.lookup_field]}
+        try:
+            row = serializer.values(self.get_queryset().filter(**lookup)).first()
+        except (TypeError, ValueError):
+            row = None
+        if row is None:
+            raise Http404
+        return Response(serializer.serialize([row])[0])
+
+    def get_row_serializer(self):
+        fields, expand = self.sparse_fields()
+        return row_serializer(self.get_serializer_class(), fields, expand)
@@ -0,0 +1,66 @@
+from django.db.models import Exists, OuterRef
+from rest_framework.exceptions import ValidationError
+
+from core.models import Recipe
+
+
+def parse_ids(value, param):
+    """ convert a comma separated list of at least one id to integers """
+    try:
+        ids = [int(item) for item in value.split(',') if item.strip()]
+    except ValueError:
+        ids = []
+    if not ids:
+        raise ValidationError({param: [f'Expected a comma separated list of ids, got "{value}".']})
+    return ids
+
+
+def parse_flag(value, param):
+    """ convert a 0 or 1 query param to a boolean, a missing one is false """
+    if value in (None, '', '0'):
+        return False
+    if value == '1':
+        return True
+    raise ValidationError({param: [f'Expected 0 or 1, got "{value}".']})
+
+
+def parse_match(value, param):
+    """ convert an any or all query param to whether every id must match, a missing one is any """
+    if value in (None, '', 'any'):
+        return False
+    if value == 'all':
+        return True
+    raise ValidationError({param: [f'Expected any or all, got "{value}".']})
+
+
+def parse_int(value, param, low, high):
+    """ convert a query param to an integer between low and high """
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        number = None
+    if number is None or not low <= number <= high:
+        raise ValidationError({param: [f'Expected an integer between {low} and {high}, got "{value}".']})
+    return number
+
+
+def parse_names(value, param, allowed):
+    """ convert a comma separated list of names to a list, rejecting the names not allowed """
+    names = list(dict.fromkeys(item.strip() for item in value.split(',') if item.strip()))
+    unknown = [name for name in names if name not in allowed]
+    if unknown:
+        raise ValidationError({param: [f'Unknown {param}: {", ".join(unknown)}. Choose from {", ".join(allowed)}.']})
+    return names
+
+
+def filter_linked(queryset, relation, ids, match_all=False):
+    """ keep the recipes linked to any, or all, of the ids through the m2m table of the relation """
+    field = Recipe._meta.get_field(relation)
+    links = field.remote_field.through.objects.filter(recipe_id=OuterRef('pk'))
+    target = f'{field.m2m_reverse_field_name()}_id'
+
+    if not match_all:
+        return queryset.filter(Exists(links.filter(**{f'{target}__in': ids})))
+    for pk in set(ids):
+        queryset = queryset.filter(Exists(links.filter(**{target: pk})))
+    return queryset
@@ -0,0 +1,159 @@
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from core.imaging import render_variants
+from core.models import DiscardedFile, Recipe
+from .cache import bump_version
+
+logger = logging.getLogger('recipe.images')
+
+
+class ImageQueueFull(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Too many images are being processed, try again shortly.'
+    default_code = 'image_queue_full'
+
+
+class ImagePool:
+    """
+    the worker processes rendering image variants, and a thread per worker waiting for a render
+    and storing its result, so the request workers only queue the image; at most max_pending
+    images wait for or go through them
+    """
+    def __init__(self, workers, max_pending):
+        self.workers = workers
+        self.slots = threading.BoundedSemaphore(max_pending)
+        self.lock = threading.Lock()
+        self.processes = None
+        self.threads = None
+
+    def reserve(self):
+        """ take the slot of an image, raising ImageQueueFull when max_pending are taken; give it to submit or release it """
+        if not self.slots.acquire(blocking=False):
+            raise ImageQueueFull()
+
+    def release(self):
+        self.slots.release()
+
+    def submit(self, finish, path, *args, reserved=False):
+        """
+        render the image file at path in a worker process, then call finish(variants, *args) in a
+        thread; in the slot taken by reserve() when reserved
+        """
+        if not reserved:
+            self.reserve()
+        try:
+            with self.lock:
+                if self.processes is None:
+                    # spawned, not forked: the request workers may be running threads
+                    self.processes = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+                    self.threads = ThreadPoolExecutor(self.workers, thread_name_prefix='image')
+                threads = self.threads
+            return threads.submit(self._run, finish, path, *args)
+        except BaseException:
+            self.slots.release()
+            raise
+
+    def _run(self, finish, path, *args):
+        try:
+            finish(self._render(path), *args)
+        except Exception:
+            logger.exception('Rendering the variants of an image failed')
+        finally:
+            # the connections of the thread are not closed by any request
+            connections.close_all()
+            self.slots.release()
+
+    def _render(self, path):
+        processes = self.processes
+        try:
+            return processes.submit(render_variants, path, settings.IMAGE_VARIANTS, settings.IMAGE_WEBP_QUALITY).result()
+        except BrokenProcessPool:
+            # a worker died, with the image it was rendering or not, start new ones for the next images
+            with self.lock:
+                if self.processes is processes:
+                    self.processes = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+            raise
+
+    def shutdown(self):
+        with self.lock:
+            if self.processes is not None:
+                self.threads.shutdown()
+                self.processes.shutdown()
+                self.processes = self.threads = None
+
+
+pool = ImagePool(settings.IMAGE_WORKERS, settings.IMAGE_MAX_PENDING)
+
+
+def variant_name(name, variant):
+    """ the file name of a variant of an image, next to it """
+    return f'{os.path.splitext(name)[0]}-{variant}.webp'
+
+
+def attach_image(recipe, upload):
+    """
+    make the upload the image of the recipe, rendering its variants from the stored file in the
+    image pool, or in the request without workers; the files of the previous image are discarded
+    """
+    if settings.IMAGE_WORKERS:
+        # with the pool full the upload is refused before the recipe is changed
+        pool.reserve()
+    try:
+        previous = recipe.image.name, recipe.image_variants
+        recipe.image.save(upload.name, upload, save=False)
+        recipe.image_variants = {}
+        recipe.save(update_fields=['image', 'image_variants', 'updated_at'])
+        discard_image_files(*previous)
+    except BaseException:
+        if settings.IMAGE_WORKERS:
+            pool.release()
+        raise
+
+    if settings.IMAGE_WORKERS:
+        # the workers read the stored file, the upload is not copied to them
+        path = default_storage.path(recipe.image.name)
+        pool.submit(store_variants, path, recipe.id, recipe.user_id, recipe.image.name, reserved=True)
+    else:
+        with default_storage.open(recipe.image.name) as file:
+            variants = render_variants(file, settings.IMAGE_VARIANTS, settings.IMAGE_WEBP_QUALITY)
+        store_variants(variants, recipe.id, recipe.user_id, recipe.image.name)
+        recipe.refresh_from_db(fields=['image_variants', 'updated_at'])
+    return recipe
+
+
+def store_variants(variants, recipe_id, user_id, name):
+    """ save the rendered {variant: bytes} of an image, and list them on its recipe if it still has the image """
+    names = {variant: default_storage.save(variant_name(name, variant), ContentFile(content)) for variant, content in variants.items()}
+    if Recipe.objects.filter(id=recipe_id, image=name).update(image_variants=names, updated_at=timezone.now()):
+        bump_version(user_id)
+    else:
+        # the recipe was deleted, or given another image, while the variants were rendered
+        delete_image_files('', names)
+
+
+def discard_image_files(name, variants):
+    """
+    note an image and its variants for the purge_images command, which deletes them after
+    IMAGE_DELETE_GRACE_SECONDS: responses cached before the change may still link to them
+    """
+    DiscardedFile.objects.bulk_create([DiscardedFile(name=file_name) for file_name in [name, *variants.values()] if file_name])
+
+
+def delete_image_files(name, variants):
+    """ delete an image and its variants from the storage """
+    for file_name in [name, *variants.values()]:
+        if file_name:
+            default_storage.delete(file_name)
@@ -0,0 +1,116 @@
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connections
+from django.db.models import Case, Exists, F, FloatField, OuterRef, Q, Value, When
+from django.db.models.functions import Cast
+
+from core.models import Ingredient, Tag
+
+# weights of ts_rank for the A (title), B (tags and ingredients) and C (description) labels
+TITLE_WEIGHT = 1.0
+RELATED_WEIGHT = 0.4
+DESCRIPTION_WEIGHT = 0.2
+
+
+def search_recipes(queryset, text):
+    """ filter recipes matching the search text and order them by relevance """
+    if connections[queryset.db].vendor == 'postgresql':
+        query = SearchQuery(text, config='english', search_type='websearch')
+        rank = SearchRank(F('search_vector'), query)
+        queryset = queryset.filter(search_vector=query)
+    else:
+        queryset, rank = _search_fallback(queryset, text)
+
+    # the rank is also the cursor position, so it must round trip through python floats
+    return queryset.annotate(rank=Cast(rank, FloatField())).order_by('-rank', '-id')
+
+
+# the stop words of the english configuration of postgres, left out of the query like it does
+STOP_WORDS = frozenset('''
+    i me my myself we our ours ourselves you your yours yourself yourselves he him his himself she
+    her hers herself it its itself they them their theirs themselves what which who whom this that
+    these those am is are was were be been being have has had having do does did doing a an the and
+    but if or because as until while of at by for with about against between into through during
+    before after above below to from up down in out on off over under again further then once here
+    there when where why how all any both each few more most other some such no nor not only own
+    same so than too very s t can will just don should now
+'''.split())
+# the suffixes cut from a word, so its forms match each other roughly like the stems of postgres do
+SUFFIXES = ('ies', 'ing', 'es', 'ed', 's')
+# a "quoted phrase" or a word, each maybe negated with a leading -
+WEBSEARCH_TOKEN = re.compile(r'(-?)"([^"]*)"?|(-?)([^\s"]+)')
+
+
+def _stem(word):
+    for suffix in SUFFIXES:
+        if word.endswith(suffix) and not word.endswith('ss') and len(word) - len(suffix) >= 3:
+            return word[:-len(suffix)]
+    return word
+
+
+def parse_websearch(text):
+    """
+    the (terms, negated) clauses of a search in the syntax of websearch_to_tsquery, the recipes
+    match every clause, or none of its terms when negated: words and "quoted phrases" are and-ed,
+    or joins the terms around it in one clause and a leading - negates a term; stop words are
+    dropped and the other words cut to a rough stem
+    """
+    clauses = []
+    join = False
+    for negated, phrase, word_negated, word in WEBSEARCH_TOKEN.findall(text):
+        if phrase == '' and word.lower() == 'or':
+            join = bool(clauses)
+            continue
+        words = [_stem(item) for item in re.findall(r'\w+', (phrase or word).lower()) if item not in STOP_WORDS]
+        if not words:
+            continue
+        negated = bool(negated or word_negated)
+        terms = [' '.join(words)] if phrase else words
+        if join and not negated and not clauses[-1][1]:
+            clauses[-1][0].extend(terms[:1])
+            terms = terms[1:]
+        clauses += [([term], negated) for term in terms]
+        join = False
+    return clauses
+
+
+def _term_match(term):
+    """ the (title, description, related) matches of a term """
+    return (
+        Q(title__icontains=term),
+        Q(description__icontains=term),
+        Exists(Tag.objects.filter(recipe=OuterRef('pk'), name__icontains=term))
+        | Exists(Ingredient.objects.filter(recipe=OuterRef('pk'), name__icontains=term)),
+    )
+
+
+def _search_fallback(queryset, text):
+    """
+    substring search for backends without full text search, with the syntax, stop words and a
+    rough stemming of the websearch of postgres, see parse_websearch
+    """
+    clauses = parse_websearch(text)
+    if not clauses:
+        return queryset.none(), Value(0.0)
+
+    title = Q()
+    description = Q()
+    related = Q()
+    for terms, negated in clauses:
+        match = Q()
+        for term in terms:
+            term_title, term_description, term_related = _term_match(term)
+            match |= term_title | term_description | term_related
+            if not negated:
+                title |= term_title
+                description |= term_description
+                related |= term_related
+        queryset = queryset.exclude(match) if negated else queryset.filter(match)
+
+    rank = (
+        Case(When(title, then=Value(TITLE_WEIGHT)), default=Value(0.0))
+        + Case(When(related, then=Value(RELATED_WEIGHT)), default=Value(0.0))
+        + Case(When(description, then=Value(DESCRIPTION_WEIGHT)), default=Value(0.0))
+    )
+    return queryset, rank
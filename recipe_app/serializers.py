@@ -1,21 +1,194 @@
+from collections import Counter
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import connections, router, transaction
+from django.db.models import Prefetch, prefetch_related_objects
+from django.utils import timezone
 from rest_framework import serializers
 
+from core.counters import adjust_recipe_counts, uncount_links
 from core.models import Recipe, Tag, Ingredient
+from core.timing import TimedSerializerMixin
+from .cache import bump_version
+from .images import attach_image
+
+# insert the new names and read the existing ones in a single round trip, the
+# unique (user, name) constraint turns concurrent inserts of a name into no-ops
+UPSERT_NAMES_SQL = """
+    WITH created AS (
+        INSERT INTO {table} (user_id, name, recipe_count) SELECT %s, unnest(%s::varchar[]), 0
+        ON CONFLICT (user_id, name) DO NOTHING
+        RETURNING id, user_id, name, recipe_count
+    )
+    SELECT id, user_id, name, recipe_count FROM created
+    UNION ALL
+    SELECT id, user_id, name, recipe_count FROM {table} WHERE user_id = %s AND name = ANY(%s)
+"""
+
+
+def get_or_create_by_name(model, user, items):
+    """ return the objects named in items, creating the missing ones without racing other requests """
+    names = list(dict.fromkeys(item['name'] for item in items))
+    if not names:
+        return []
+    connection = connections[router.db_for_write(model)]
+    if connection.vendor == 'postgresql':
+        found = {obj.name: obj for obj in model.objects.db_manager(connection.alias).raw(
+            UPSERT_NAMES_SQL.format(table=connection.ops.quote_name(model._meta.db_table)),
+            [user.id, names, user.id, names],
+        )}
+    else:
+        found = {obj.name: obj for obj in model.objects.filter(user=user, name__in=names)}
+        missing = [model(user=user, name=name) for name in names if name not in found]
+        model.objects.bulk_create(missing, ignore_conflicts=True)
+
+    # bulk_create sets no ids when ignoring conflicts, and names committed by a concurrent
+    # request after the snapshot above are not seen by it, so read those back by name
+    missing = [name for name in names if name not in found]
+    if missing:
+        found.update((obj.name, obj) for obj in model.objects.filter(user=user, name__in=missing))
+    return [found[name] for name in names]
+
 
-class IngredientSerialize(serializers.ModelSerializer):
+def link_by_name(model, user, relation, recipes, items_by_recipe, replace=False):
+    """ link each recipe to the objects named in its items, inserting all the links at once """
+    named = {obj.name: obj for obj in get_or_create_by_name(model, user, [item for items in items_by_recipe for item in items])}
+    field = Recipe._meta.get_field(relation)
+    through = field.remote_field.through
+    target = f'{field.m2m_reverse_field_name()}_id'
+
+    if replace:
+        recipe_ids = [recipe.id for recipe in recipes]
+        uncount_links(model, recipe_ids)
+        through.objects.filter(recipe_id__in=recipe_ids).delete()
+    links = through.objects.bulk_create(
+        through(recipe_id=recipe.id, **{target: named[name].id})
+        for recipe, items in zip(recipes, items_by_recipe)
+        for name in dict.fromkeys(item['name'] for item in items)
+    )
+    adjust_recipe_counts(model, Counter(getattr(link, target) for link in links))
+
+
+class IngredientSerialize(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Ingredient
         fields = ['id', 'name']
         read_only_fields = ['id']
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Tag
         fields = ['id', 'name']
         read_only_fields = ['id']
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class IngredientDetailSerializer(IngredientSerialize):
+    class Meta(IngredientSerialize.Meta):
+        fields = IngredientSerialize.Meta.fields + ['recipe_count']
+        read_only_fields = ['id', 'recipe_count']
+
+
+class TagDetailSerializer(TagSerializer):
+    class Meta(TagSerializer.Meta):
+        fields = TagSerializer.Meta.fields + ['recipe_count']
+        read_only_fields = ['id', 'recipe_count']
+
+
+class RecipeListSerializer(serializers.ListSerializer):
+    """ create or update many recipes, their tags and ingredients with a fixed number of queries """
+    def to_internal_value(self, data):
+        """ on updates the instance lists the recipe of each item, or None when the item names no recipe of the user """
+        if self.instance is None:
+            return super().to_internal_value(data)
+        try:
+            validated = super().to_internal_value(data)
+            errors = [{} for _ in validated]
+        except serializers.ValidationError as exc:
+            if not isinstance(exc.detail, list):
+                raise
+            validated, errors = None, exc.detail
+
+        seen = set()
+        for recipe, item_errors in zip(self.instance, errors):
+            if recipe is None:
+                item_errors['id'] = ['Recipe not found.']
+            elif recipe.id in seen:
+                item_errors['id'] = ['Recipe given more than once.']
+            else:
+                seen.add(recipe.id)
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        return validated
+
+    @transaction.atomic
+    def create(self, validated_data):
+        """ insert the recipes, then their tags, ingredients and links """
+        user = self.context['request'].user
+        tags = [attrs.pop('tags', []) for attrs in validated_data]
+        ingredients = [attrs.pop('ingredients', []) for attrs in validated_data]
+        recipes = [Recipe(**attrs) for attrs in validated_data]
+        if connections[router.db_for_write(Recipe)].features.can_return_rows_from_bulk_insert:
+            Recipe.objects.bulk_create(recipes)
+        else:
+            for recipe in recipes:
+                recipe.save()
+        link_by_name(Tag, user, 'tags', recipes, tags)
+        link_by_name(Ingredient, user, 'ingredients', recipes, ingredients)
+
+        return self._finish(user, recipes)
+
+    @transaction.atomic
+    def update(self, instance, validated_data):
+        """ update the fields given for each recipe and replace the tags and ingredients given """
+        user = self.context['request'].user
+        now = timezone.now()
+        fields = {'updated_at'}
+        linked = {'tags': ([], []), 'ingredients': ([], [])}
+        for recipe, attrs in zip(instance, validated_data):
+            for relation, (recipes, items_by_recipe) in linked.items():
+                items = attrs.pop(relation, None)
+                if items is not None:
+                    recipes.append(recipe)
+                    items_by_recipe.append(items)
+            for attr, value in attrs.items():
+                setattr(recipe, attr, value)
+            fields.update(attrs)
+            recipe.updated_at = now
+
+        Recipe.objects.bulk_update(instance, sorted(fields))
+        link_by_name(Tag, user, 'tags', *linked['tags'], replace=True)
+        link_by_name(Ingredient, user, 'ingredients', *linked['ingredients'], replace=True)
+
+        return self._finish(user, instance)
+
+    def _finish(self, user, recipes):
+        # bulk writes send no model signals, so invalidate the cached responses here
+        bump_version(user.id)
+        prefetch_related_objects(
+            recipes,
+            Prefetch('tags', queryset=Tag.objects.only('id', 'name')),
+            Prefetch('ingredients', queryset=Ingredient.objects.only('id', 'name')),
+        )
+        return recipes
+
+
+class SparseFieldsMixin:
+    """ keep only the fields given, and render the relations not expanded as lists of ids """
+    expandable = ['tags', 'ingredients']
+
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+        if expand is not None:
+            for name in set(self.expandable) - set(expand):
+                if name in self.fields:
+                    self.fields[name] = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
+
+
+class RecipeSerializer(SparseFieldsMixin, TimedSerializerMixin, serializers.ModelSerializer):
     """ utilizar quando o usuário tiver a opção de cadastar tags junto com receitas """
     tags = TagSerializer(many=True, required=False) # listar as tags
     ingredients = IngredientSerialize(many=True, required=False)
@@ -24,22 +197,31 @@ class RecipeSerializer(serializers.ModelSerializer):
         model = Recipe
         fields = ['id', 'title', 'time_minutes', 'price', 'tags', 'ingredients']
         read_only_fields = ['id']
+        list_serializer_class = RecipeListSerializer
     
     def _get_or_create_tags(self, tags, recipe):
         """ handle getting or creating tags as needed """
         auth_user = self.context['request'].user
-        for tag in tags:
-            tag_obj, created = Tag.objects.get_or_create(user=auth_user, **tag)
-            recipe.tags.add(tag_obj)
+        recipe.tags.add(*get_or_create_by_name(Tag, auth_user, tags))
     
     def _get_or_create_ingredients(self, ingredients, recipe):
         """ handle getting or cvreating ingredients a needed """
         auth_user = self.context['request'].user
-        for ingredient in ingredients:
-            ingredient_obj, created = Ingredient.objects.get_or_create(user=auth_user, **ingredient)
-            recipe.ingredients.add(ingredient_obj)
+        recipe.ingredients.add(*get_or_create_by_name(Ingredient, auth_user, ingredients))
+
+    def _set_linked(self, recipe, relation, model, items):
+        """ link the recipe to the objects named in items, removing and adding only the links that change """
+        manager = getattr(recipe, relation)
+        names = dict.fromkeys(item['name'] for item in items)
+        linked = dict(manager.values_list('name', 'id'))
+        removed = [pk for name, pk in linked.items() if name not in names]
+        added = [{'name': name} for name in names if name not in linked]
+        if removed:
+            manager.remove(*removed)
+        if added:
+            manager.add(*get_or_create_by_name(model, self.context['request'].user, added))
 
-        
+    @transaction.atomic
     def create(self, validated_data):
         """Cria receita e cria as tags"""
         tags = validated_data.pop('tags', [])
@@ -50,26 +232,60 @@ class RecipeSerializer(serializers.ModelSerializer):
 
         return recipe
     
+    @transaction.atomic
     def update(self, instance, validated_data):
         """ update recipe """
         tags = validated_data.pop('tags', None)
         ingredients = validated_data.pop('ingredients', None)
         if tags is not None:
-            instance.tags.clear()
-            self._get_or_create_tags(tags, instance)
+            self._set_linked(instance, 'tags', Tag, tags)
         if ingredients is not None:
-            instance.ingredients.clear()
-            self._get_or_create_ingredients(ingredients, instance)
-        
+            self._set_linked(instance, 'ingredients', Ingredient, ingredients)
+
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
         instance.save()
         return instance
 
 
+class ImageURLField(serializers.ImageField):
+    """ an image as the url of its file in the storage, from a file or a file name, None without one """
+    def to_representation(self, value):
+        name = getattr(value, 'name', value)
+        return default_storage.url(name) if name else None
+
+
+class ImageVariantsField(serializers.ReadOnlyField):
+    """ the {variant: file name} of an image as {variant: url} """
+    def to_representation(self, value):
+        return {variant: default_storage.url(name) for variant, name in value.items()}
+
+
 class RecipeDetailSerializer(RecipeSerializer):
+    image = ImageURLField(read_only=True)
+    image_variants = ImageVariantsField()
+
     class Meta(RecipeSerializer.Meta):
-        fields = RecipeSerializer.Meta.fields + ['description', 'link']
+        fields = RecipeSerializer.Meta.fields + ['description', 'link', 'image', 'image_variants']
+
+
+class RecipeImageSerializer(serializers.ModelSerializer):
+    """ upload the image of a recipe, its variants are listed once rendered """
+    image = ImageURLField()
+    image_variants = ImageVariantsField()
+
+    class Meta:
+        model = Recipe
+        fields = ['id', 'image', 'image_variants']
+        read_only_fields = ['id']
+
+    def validate_image(self, image):
+        if image.size > settings.IMAGE_MAX_UPLOAD_BYTES:
+            raise serializers.ValidationError(f'Send an image of at most {settings.IMAGE_MAX_UPLOAD_BYTES // 1024 // 1024} MB.')
+        return image
+
+    def update(self, instance, validated_data):
+        return attach_image(instance, validated_data['image'])
 
 
 # class RecipeSerializer(serializers.ModelSerializer):
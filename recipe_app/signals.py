@@ -0,0 +1,40 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from core.models import Ingredient, Recipe, Tag
+from .cache import bump_version
+from .images import discard_image_files
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_owner_cache(sender, instance, **kwargs):
+    """ invalidate the cached responses of the owner of a changed recipe, tag or ingredient """
+    bump_version(instance.user_id)
+
+
+@receiver(post_delete, sender=Recipe)
+def delete_recipe_image(sender, instance, **kwargs):
+    """ discard the image of a deleted recipe and its variants, with the deletion """
+    if instance.image:
+        discard_image_files(instance.image.name, instance.image_variants)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def invalidate_links_cache(sender, instance, action, **kwargs):
+    """ invalidate the cached responses of the owner when recipe links change """
+    if action.startswith('post_'):
+        bump_version(instance.user_id)
+
+
+@receiver(post_save, sender=get_user_model())
+def start_user_cache(sender, instance, created, **kwargs):
+    """ start a new user on a fresh version, so a reused id never sees old entries """
+    if created:
+        bump_version(instance.id)
@@ -0,0 +1,150 @@
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.models import Ingredient, Recipe, Tag
+from recipe_app.cache import bump_version
+
+RECIPE_URL = reverse('recipe-list')
+ASYNC_RECIPE_URL = reverse('async-recipe-list')
+
+
+def create_recipe(user, **params):
+    defaults = {'title': 'test recipe', 'time_minutes': 7, 'price': Decimal('7.9')}
+    defaults.update(params)
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class AsyncViewsTest(TestCase):
+    """ test the async read endpoints answer like the synchronous ones """
+    def setUp(self) -> None:
+        cache.clear()
+        self.user = get_user_model().objects.create_user(email='test@email.com', password='testpassword')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.vegan = Tag.objects.create(user=self.user, name='vegan')
+        self.dinner = Tag.objects.create(user=self.user, name='dinner')
+        self.salt = Ingredient.objects.create(user=self.user, name='salt')
+        self.recipes = []
+        for i in range(5):
+            recipe = create_recipe(user=self.user, title=f'recipe {i}', price=Decimal(f'{i}.5'), link=f'https://example.com/{i}')
+            recipe.tags.add(self.vegan, *([self.dinner] if i % 2 else []))
+            recipe.ingredients.add(self.salt)
+            self.recipes.append(recipe)
+        other = get_user_model().objects.create_user(email='other@email.com', password='testpassword')
+        self.other_recipe = create_recipe(user=other)
+
+    def assert_same(self, url, async_url, params=None):
+        res = self.client.get(url, params)
+        async_res = self.client.get(async_url, params)
+
+        self.assertEqual(async_res.status_code, res.status_code)
+        self.assertEqual(async_res.json(), res.json())
+
+    def test_list_same_as_sync(self):
+        """ test the async recipe list returns the page of the synchronous one """
+        self.assert_same(RECIPE_URL, ASYNC_RECIPE_URL)
+        self.assert_same(RECIPE_URL, ASYNC_RECIPE_URL, {'tags': self.dinner.id})
+        self.assert_same(RECIPE_URL, ASYNC_RECIPE_URL, {'tags': f'{self.vegan.id},{self.dinner.id}', 'match': 'all'})
+
+    def test_list_queries(self):
+        """ test the async recipe list runs a query for the page and one per relation """
+        self.client.get(ASYNC_RECIPE_URL)
+        bump_version(self.user.id)
+
+        with self.assertNumQueries(3):
+            res = self.client.get(ASYNC_RECIPE_URL)
+
+        self.assertEqual(res['X-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            res = self.client.get(ASYNC_RECIPE_URL)
+        self.assertEqual(res['X-Cache'], 'HIT')
+
+    def test_cursor_pages(self):
+        """ test the cursors of both paths walk the same pages back and forth """
+        res = self.client.get(ASYNC_RECIPE_URL, {'page_size': 2})
+        self.assertIsNone(res.json()['previous'])
+        second = self.client.get(res.json()['next'])
+        sync_second = self.client.get(res.json()['next'].replace(ASYNC_RECIPE_URL, RECIPE_URL))
+        third = self.client.get(second.json()['next'])
+        back = self.client.get(third.json()['previous'])
+
+        ids = [recipe['id'] for page in (res, second, third) for recipe in page.json()['results']]
+        self.assertEqual(ids, [recipe.id for recipe in reversed(self.recipes)])
+        self.assertEqual(sync_second.json()['results'], second.json()['results'])
+        self.assertIsNone(third.json()['next'])
+        self.assertEqual(back.json()['results'], second.json()['results'])
+
+        sync_page = self.client.get(RECIPE_URL, {'page_size': 2})
+        self.assertEqual(
+            self.client.get(sync_page.json()['next'].replace(RECIPE_URL, ASYNC_RECIPE_URL)).json()['results'],
+            second.json()['results'],
+        )
+
+    def test_invalid_params(self):
+        """ test invalid ids and cursors are rejected like on the synchronous path """
+        self.assert_same(RECIPE_URL, ASYNC_RECIPE_URL, {'tags': 'a,b'})
+        self.assert_same(RECIPE_URL, ASYNC_RECIPE_URL, {'tags': ','})
+        self.assert_same(RECIPE_URL, ASYNC_RECIPE_URL, {'tags': f'{self.vegan.id}', 'match': 'al'})
+        self.assert_same(RECIPE_URL, ASYNC_RECIPE_URL, {'cursor': 'invalid'})
+
+    def test_detail_same_as_sync(self):
+        """ test the async recipe detail, and the not found recipe of another user """
+        recipe = self.recipes[1]
+        self.assert_same(reverse('recipe-detail', args=[recipe.id]), reverse('async-recipe-detail', args=[recipe.id]))
+
+        res = self.client.get(reverse('async-recipe-detail', args=[self.other_recipe.id]))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_tags_and_ingredients_same_as_sync(self):
+        """ test the async tag and ingredient lists and details """
+        self.assert_same(reverse('tag-list'), reverse('async-tag-list'))
+        self.assert_same(reverse('ingredient-list'), reverse('async-ingredient-list'), {'page_size': 1})
+
+        res = self.client.get(reverse('async-tag-detail', args=[self.dinner.id]))
+
+        self.assertEqual(res.json(), {'id': self.dinner.id, 'name': 'dinner', 'recipe_count': 2})
+
+    def test_assigned_only_same_as_sync(self):
+        """ test the async tag list filters the tags assigned to a recipe """
+        Tag.objects.create(user=self.user, name='unused')
+
+        self.assert_same(reverse('tag-list'), reverse('async-tag-list'), {'assigned_only': 1})
+
+    def test_authentication_required(self):
+        """ test requests without a valid token are rejected """
+        self.client.credentials()
+        res = self.client.get(ASYNC_RECIPE_URL)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(res['WWW-Authenticate'], 'Token')
+
+        self.client.credentials(HTTP_AUTHORIZATION='Token invalid')
+        res = self.client.get(ASYNC_RECIPE_URL)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(res.json(), {'detail': 'Invalid token.'})
+
+    def test_only_reads(self):
+        """ test writes are not allowed on the async endpoints """
+        res = self.client.post(ASYNC_RECIPE_URL, {'title': 'new recipe'})
+
+        self.assertEqual(res.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+        self.assertEqual(res['Allow'], 'GET, HEAD')
+
+    async def test_served_asynchronously(self):
+        """ test the async client is served by the async view, with its token lookup cached """
+        headers = {'AUTHORIZATION': f'Token {self.token.key}'}
+        res = await self.async_client.get(ASYNC_RECIPE_URL, **headers)
+        again = await self.async_client.get(ASYNC_RECIPE_URL, **headers)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.json()['results']), 5)
+        self.assertIn('db;dur=', res['Server-Timing'])
+        self.assertIn('desc="0 queries"', again['Server-Timing'])
@@ -0,0 +1,210 @@
+import threading
+from unittest import skipUnless
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection, connections, transaction
+from django.test import TransactionTestCase
+from django.test.utils import override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient, APITestCase
+
+from core.models import Ingredient, Recipe, Tag
+from recipe_app.autocomplete import NameIndex, has_trigrams, indexes
+
+TAG_AUTOCOMPLETE_URL = reverse('tag-autocomplete')
+INGREDIENT_AUTOCOMPLETE_URL = reverse('ingredient-autocomplete')
+
+
+def names(res):
+    return [item['name'] for item in res.data]
+
+
+class NameIndexTest(APITestCase):
+    """ test searching the sorted names of a name index """
+    def test_search(self):
+        """ test name starts come before later words, then the most used, then by name """
+        index = NameIndex([(1, 'Sauce Tomato', 9), (2, 'tomato', 1), (3, 'Tomatillo', 5), (4, 'Top', 7), (5, 'cherry tomato', 2)])
+
+        self.assertEqual([row[0] for row in index.search('TOMA', 10)], [3, 2, 1, 5])
+        self.assertEqual([row[0] for row in index.search('to', 2)], [4, 3])
+        self.assertEqual(index.search('tomatoes', 10), [])
+
+    def test_search_counts_a_name_once(self):
+        """ test a name with several words starting with the prefix is returned once, in its best tier """
+        index = NameIndex([(1, 'tomato tomato', 0), (2, 'red tomato tomato', 0)])
+
+        self.assertEqual([row[0] for row in index.search('tom', 10)], [1, 2])
+
+
+class PublicAutocompleteApiTest(APITestCase):
+    """ test unauthenticated autocomplete requests """
+    def test_login_required(self):
+        """ test user is required """
+        res = APIClient().get(TAG_AUTOCOMPLETE_URL, {'q': 'to'})
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class PrivateAutocompleteApiTest(APITestCase):
+    """ test the tag and ingredient autocomplete """
+    def setUp(self) -> None:
+        indexes.clear()
+        self.user = get_user_model().objects.create_user(email='test@email.com', password='testpass123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_prefix_matches(self):
+        """ test names starting with the text come first, the most used first, then the ones with a later word """
+        Tag.objects.create(user=self.user, name='tomato', recipe_count=1)
+        Tag.objects.create(user=self.user, name='Tomatillo', recipe_count=4)
+        Tag.objects.create(user=self.user, name='sauce tomato', recipe_count=9)
+        Tag.objects.create(user=self.user, name='potato', recipe_count=9)
+
+        res = self.client.get(TAG_AUTOCOMPLETE_URL, {'q': ' tom '})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(names(res), ['Tomatillo', 'tomato', 'sauce tomato'])
+        self.assertEqual(set(res.data[0]), {'id', 'name', 'recipe_count'})
+
+    def test_limit(self):
+        """ test the limit param caps the matches """
+        for i in range(5):
+            Ingredient.objects.create(user=self.user, name=f'salt {i}', recipe_count=i)
+
+        res = self.client.get(INGREDIENT_AUTOCOMPLETE_URL, {'q': 'salt', 'limit': 2})
+
+        self.assertEqual(names(res), ['salt 4', 'salt 3'])
+
+    @override_settings(AUTOCOMPLETE_LIMIT=3)
+    def test_default_limit(self):
+        """ test the matches are capped by the default limit without the param """
+        for i in range(5):
+            Ingredient.objects.create(user=self.user, name=f'salt {i}')
+
+        res = self.client.get(INGREDIENT_AUTOCOMPLETE_URL, {'q': 'salt'})
+
+        self.assertEqual(len(res.data), 3)
+
+    def test_invalid_params(self):
+        """ test a missing text or an invalid limit are rejected """
+        for params in ({}, {'q': '  '}, {'q': 'to', 'limit': 0}, {'q': 'to', 'limit': 51}, {'q': 'to', 'limit': 'x'}):
+            res = self.client.get(TAG_AUTOCOMPLETE_URL, params)
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST, params)
+
+    def test_limited_to_user(self):
+        """ test only the names of the user are matched, by each user's own index """
+        other = get_user_model().objects.create_user(email='other@email.com', password='testpass123')
+        Tag.objects.create(user=other, name='tofu')
+        Tag.objects.create(user=self.user, name='toast')
+
+        res = self.client.get(TAG_AUTOCOMPLETE_URL, {'q': 'to'})
+        self.client.force_authenticate(other)
+        res_other = self.client.get(TAG_AUTOCOMPLETE_URL, {'q': 'to'})
+
+        self.assertEqual(names(res), ['toast'])
+        self.assertEqual(names(res_other), ['tofu'])
+
+    def test_tags_and_ingredients_apart(self):
+        """ test tags and ingredients with the same name are matched by their own endpoint """
+        tag = Tag.objects.create(user=self.user, name='lemon')
+        ingredient = Ingredient.objects.create(user=self.user, name='lemon')
+
+        self.assertEqual(self.client.get(TAG_AUTOCOMPLETE_URL, {'q': 'le'}).data[0]['id'], tag.id)
+        self.assertEqual(self.client.get(INGREDIENT_AUTOCOMPLETE_URL, {'q': 'le'}).data[0]['id'], ingredient.id)
+
+    def test_cached_index(self):
+        """ test a repeated search is answered from the index, without querying the names again """
+        Tag.objects.create(user=self.user, name='tomato')
+        self.client.get(TAG_AUTOCOMPLETE_URL, {'q': 'tom'})
+
+        # the authentication and the version of the index are read from the cache
+        with self.assertNumQueries(0):
+            res = self.client.get(TAG_AUTOCOMPLETE_URL, {'q': 'tom', 'limit': 1})
+
+        self.assertEqual(names(res), ['tomato'])
+
+    def test_index_follows_writes(self):
+        """ test a new tag, a rename and a new link are searched right after the write """
+        tag = Tag.objects.create(user=self.user, name='tomato')
+        self.client.get(TAG_AUTOCOMPLETE_URL, {'q': 'to'})
+
+        Tag.objects.create(user=self.user, name='toast')
+        self.assertEqual(names(self.client.get(TAG_AUTOCOMPLETE_URL, {'q': 'to'})), ['toast', 'tomato'])
+
+        self.client.patch(reverse('tag-detail', args=[tag.id]), {'name': 'tofu'})
+        self.assertEqual(names(self.client.get(TAG_AUTOCOMPLETE_URL, {'q': 'to'})), ['toast', 'tofu'])
+
+        recipe = Recipe.objects.create(user=self.user, title='salad', time_minutes=5, price='5.00')
+        recipe.tags.add(tag)
+        self.assertEqual(self.client.get(TAG_AUTOCOMPLETE_URL, {'q': 'to'}).data[0], {'id': tag.id, 'name': 'tofu', 'recipe_count': 1})
+
+    @override_settings(AUTOCOMPLETE_MAX_CACHED_NAMES=2)
+    def test_too_many_names(self):
+        """ test the names of a user with more names than an index holds are searched in the database """
+        for name in ('tomato', 'Tomatillo', 'sauce tomato'):
+            Tag.objects.create(user=self.user, name=name)
+
+        res = self.client.get(TAG_AUTOCOMPLETE_URL, {'q': 'tomat', 'limit': 2})
+
+        self.assertEqual(names(res), ['Tomatillo', 'tomato'])
+
+    def test_contains_fill(self):
+        """ test the prefix matches are filled up with the names containing the text, without pg_trgm """
+        if has_trigrams('default'):
+            self.skipTest('pg_trgm matches similar names')
+        Tag.objects.create(user=self.user, name='tomato', recipe_count=1)
+        Tag.objects.create(user=self.user, name='sweet potato', recipe_count=3)
+        Tag.objects.create(user=self.user, name='potatoes', recipe_count=2)
+
+        res = self.client.get(TAG_AUTOCOMPLETE_URL, {'q': 'tato'})
+
+        self.assertEqual(names(res), ['sweet potato', 'potatoes'])
+
+    def test_similar_fill(self):
+        """ test the prefix matches are filled up with similar names, the most similar first, with pg_trgm """
+        if not has_trigrams('default'):
+            self.skipTest('similar names need pg_trgm')
+        Tag.objects.create(user=self.user, name='tomatoes')
+        Tag.objects.create(user=self.user, name='tomato sauce')
+        Tag.objects.create(user=self.user, name='tomatillo', recipe_count=9)
+        Tag.objects.create(user=self.user, name='banana')
+
+        res = self.client.get(TAG_AUTOCOMPLETE_URL, {'q': 'tomatos'})
+
+        self.assertEqual(names(res)[:2], ['tomatoes', 'tomato sauce'])
+        self.assertNotIn('banana', names(res))
+
+
+class AutocompleteCommitTest(TransactionTestCase):
+    """ test the index built while a write is not committed yet is not searched after it """
+    def setUp(self) -> None:
+        cache.clear()
+        indexes.clear()
+        self.user = get_user_model().objects.create_user(email='test@email.com', password='testpass123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    @skipUnless(connection.vendor == 'postgresql', 'sqlite locks the tables written by an open transaction')
+    def test_tag_found_after_commit(self):
+        """ test a tag created while another connection builds the index is searched once committed """
+        Tag.objects.create(user=self.user, name='tomatillo')
+        responses = []
+
+        def search():
+            try:
+                responses.append(self.client.get(TAG_AUTOCOMPLETE_URL, {'q': 'to', 'limit': 1}))
+            finally:
+                connections.close_all()
+
+        with transaction.atomic():
+            Tag.objects.create(user=self.user, name='tomato', recipe_count=5)
+            searcher = threading.Thread(target=search)
+            searcher.start()
+            searcher.join()
+
+        # a stale index would still answer with the only name it holds
+        self.assertEqual(names(responses[0]), ['tomatillo'])
+        self.assertEqual(names(self.client.get(TAG_AUTOCOMPLETE_URL, {'q': 'to', 'limit': 1})), ['tomato'])
@@ -0,0 +1,189 @@
+from rest_framework.test import APIClient, APITestCase
+from rest_framework import status
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from decimal import Decimal
+
+from core.models import Recipe, Tag, Ingredient
+
+RECIPE_URL = reverse('recipe-list')
+BULK_URL = reverse('recipe-bulk')
+
+
+def create_recipe(user, **params):
+    defaults = {'title': 'test recipe', 'time_minutes': 7, 'price': Decimal('7.9')}
+    defaults.update(params)
+    return Recipe.objects.create(user=user, **defaults)
+
+
+def recipe_payload(index, tags=2, ingredients=2):
+    return {
+        'title': f'recipe {index}',
+        'time_minutes': 10,
+        'price': '5.50',
+        'tags': [{'name': f'tag {index % 3 + i}'} for i in range(tags)],
+        'ingredients': [{'name': f'ingredient {index + i}'} for i in range(ingredients)],
+    }
+
+
+class BulkRecipeApiTest(APITestCase):
+    """ test creating and updating many recipes in one request """
+    def setUp(self) -> None:
+        cache.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(email='test@email.com', password='testpassword')
+        self.client.force_authenticate(user=self.user)
+
+    def test_bulk_create(self):
+        """ test creating recipes with shared tags and ingredients """
+        payload = [recipe_payload(0), recipe_payload(1), {'title': 'plain', 'time_minutes': 1, 'price': '1.00'}]
+
+        res = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([item['title'] for item in res.data], ['recipe 0', 'recipe 1', 'plain'])
+        self.assertEqual(Recipe.objects.filter(user=self.user).count(), 3)
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 3)
+        self.assertEqual(Ingredient.objects.filter(user=self.user).count(), 3)
+        recipe = Recipe.objects.get(id=res.data[1]['id'])
+        self.assertEqual(sorted(tag.name for tag in recipe.tags.all()), ['tag 1', 'tag 2'])
+        self.assertEqual([item['name'] for item in res.data[1]['ingredients']], ['ingredient 1', 'ingredient 2'])
+
+    def test_bulk_create_reuses_existing_tags(self):
+        """ test existing tags are linked instead of duplicated, and repeated names linked once """
+        tag = Tag.objects.create(user=self.user, name='tag 0')
+        payload = [{**recipe_payload(0, tags=0), 'tags': [{'name': 'tag 0'}, {'name': 'tag 0'}]}]
+
+        res = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res.data[0]['tags'], [{'id': tag.id, 'name': 'tag 0'}])
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 1)
+
+    def test_bulk_create_query_count_constant(self):
+        """ test the number of queries does not grow with the number of recipes """
+        counts = []
+        for start, size in ((0, 2), (10, 20)):
+            with CaptureQueriesContext(connection) as ctx:
+                res = self.client.post(BULK_URL, [recipe_payload(start + i) for i in range(size)], format='json')
+            self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+            counts.append(len(ctx))
+
+        self.assertEqual(counts[0], counts[1])
+
+    def test_bulk_create_item_errors(self):
+        """ test invalid items are reported by position and nothing is created """
+        payload = [recipe_payload(0), {'title': 'no price', 'time_minutes': 1}, recipe_payload(2)]
+
+        res = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.data[0], {})
+        self.assertIn('price', res.data[1])
+        self.assertEqual(res.data[2], {})
+        self.assertFalse(Recipe.objects.exists())
+        self.assertFalse(Tag.objects.exists())
+
+    def test_bulk_create_not_a_list(self):
+        """ test a single object is rejected """
+        res = self.client.post(BULK_URL, recipe_payload(0), format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_create_too_many(self):
+        """ test requests above the bulk limit are rejected """
+        with self.settings(API_MAX_BULK_SIZE=2):
+            res = self.client.post(BULK_URL, [recipe_payload(i) for i in range(3)], format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_bulk_create_invalidates_cache(self):
+        """ test the cached list is refreshed after a bulk create """
+        self.client.get(RECIPE_URL)
+        self.client.post(BULK_URL, [recipe_payload(0)], format='json')
+
+        res = self.client.get(RECIPE_URL)
+
+        self.assertEqual(res['X-Cache'], 'MISS')
+        self.assertEqual(len(res.data['results']), 1)
+
+    def test_bulk_update(self):
+        """ test partially updating recipes, replacing only the links that are given """
+        recipe1 = create_recipe(user=self.user, title='first')
+        recipe2 = create_recipe(user=self.user, title='second')
+        recipe2.tags.add(Tag.objects.create(user=self.user, name='old'))
+        updated_at = recipe2.updated_at
+        payload = [
+            {'id': recipe1.id, 'price': '2.00', 'tags': [{'name': 'new'}]},
+            {'id': recipe2.id, 'title': 'renamed'},
+        ]
+
+        res = self.client.patch(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        recipe1.refresh_from_db()
+        recipe2.refresh_from_db()
+        self.assertEqual((recipe1.title, recipe1.price), ('first', Decimal('2.00')))
+        self.assertEqual([tag.name for tag in recipe1.tags.all()], ['new'])
+        self.assertEqual(recipe2.title, 'renamed')
+        self.assertEqual([tag.name for tag in recipe2.tags.all()], ['old'])
+        self.assertGreater(recipe2.updated_at, updated_at)
+        self.assertEqual(res.data[1]['tags'][0]['name'], 'old')
+
+    def test_bulk_update_clears_links(self):
+        """ test an empty list removes the links of a recipe """
+        recipe = create_recipe(user=self.user)
+        recipe.ingredients.add(Ingredient.objects.create(user=self.user, name='salt'))
+
+        res = self.client.patch(BULK_URL, [{'id': recipe.id, 'ingredients': []}], format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(recipe.ingredients.count(), 0)
+
+    def test_bulk_update_query_count_constant(self):
+        """ test the number of queries of a bulk update does not grow with the number of recipes """
+        recipes = [create_recipe(user=self.user, title=f'recipe {i}') for i in range(20)]
+        counts = []
+        for chunk in (recipes[:2], recipes[2:]):
+            payload = [
+                {
+                    'id': recipe.id,
+                    'time_minutes': 3,
+                    'tags': [{'name': f'tag {recipe.id}'}],
+                    'ingredients': [{'name': f'ingredient {recipe.id}'}],
+                }
+                for recipe in chunk
+            ]
+            with CaptureQueriesContext(connection) as ctx:
+                res = self.client.patch(BULK_URL, payload, format='json')
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            counts.append(len(ctx))
+
+        self.assertEqual(counts[0], counts[1])
+
+    def test_bulk_update_item_errors(self):
+        """ test unknown, foreign or repeated ids are reported by position and nothing is updated """
+        recipe = create_recipe(user=self.user, title='mine')
+        other = create_recipe(user=get_user_model().objects.create_user(email='test2@email.com', password='testpassword'))
+        payload = [
+            {'id': recipe.id, 'title': 'changed'},
+            {'id': other.id, 'title': 'stolen'},
+            {'title': 'no id'},
+            {'id': recipe.id, 'time_minutes': 'slow'},
+        ]
+
+        res = self.client.patch(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.data[0], {})
+        self.assertIn('id', res.data[1])
+        self.assertIn('id', res.data[2])
+        self.assertEqual(set(res.data[3]), {'id', 'time_minutes'})
+        recipe.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(recipe.title, 'mine')
+        self.assertEqual(other.title, 'test recipe')
@@ -0,0 +1,204 @@
+import threading
+import time
+from unittest import skipUnless
+
+from rest_framework.test import APIClient, APITestCase
+from rest_framework import status
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection, connections, transaction
+from django.test import TransactionTestCase
+from django.urls import reverse
+from decimal import Decimal
+
+from core.models import Recipe, Tag
+
+RECIPE_URL = reverse('recipe-list')
+
+
+def create_recipe(user, **params):
+    defaults = {'title': 'test recipe', 'time_minutes': 7, 'price': Decimal('7.9')}
+    defaults.update(params)
+    return Recipe.objects.create(user=user, **defaults)
+
+
+def detail_url(recipe_id):
+    return reverse('recipe-detail', args=[recipe_id])
+
+
+class ConditionalRecipeApiTest(APITestCase):
+    """ test conditional requests on recipes """
+    def setUp(self) -> None:
+        cache.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(email='test@email.com', password='testpassword')
+        self.client.force_authenticate(user=self.user)
+        self.recipe = create_recipe(user=self.user)
+
+    def test_list_not_modified(self):
+        """ test listing with a matching ETag returns 304 without queries """
+        etag = self.client.get(RECIPE_URL)['ETag']
+
+        with self.assertNumQueries(0):
+            res = self.client.get(RECIPE_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res['ETag'], etag)
+
+    def test_list_etag_per_representation(self):
+        """ test the ETag of a filtered, sparse or otherwise rendered list does not match the full list """
+        tag = Tag.objects.create(user=self.user, name='vegan')
+        etag = self.client.get(RECIPE_URL)['ETag']
+
+        for params in [{'tags': tag.id}, {'fields': 'id'}, {'format': 'api'}]:
+            res = self.client.get(RECIPE_URL, params, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(res.status_code, status.HTTP_200_OK, params)
+            self.assertNotEqual(res['ETag'], etag)
+
+    def test_list_modified_after_delete(self):
+        """ test deleting a recipe changes the list ETag """
+        etag = self.client.get(RECIPE_URL)['ETag']
+        self.client.delete(detail_url(self.recipe.id))
+
+        res = self.client.get(RECIPE_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['results'], [])
+
+    def test_list_if_modified_since(self):
+        """ test listing with a recent If-Modified-Since returns 304 """
+        last_modified = self.client.get(RECIPE_URL)['Last-Modified']
+
+        res = self.client.get(RECIPE_URL, HTTP_IF_MODIFIED_SINCE=last_modified)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_detail_not_modified(self):
+        """ test retrieving a recipe with a matching ETag returns 304 after a single query """
+        first = self.client.get(detail_url(self.recipe.id))
+
+        with self.assertNumQueries(1):
+            res = self.client.get(detail_url(self.recipe.id), HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        res = self.client.get(detail_url(self.recipe.id), HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_detail_modified_by_tag_link(self):
+        """ test linking a tag changes the ETag of the recipe """
+        etag = self.client.get(detail_url(self.recipe.id))['ETag']
+        self.recipe.tags.add(Tag.objects.create(user=self.user, name='vegan'))
+
+        res = self.client.get(detail_url(self.recipe.id), HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res['ETag'], etag)
+
+    def test_detail_modified_by_tag_rename(self):
+        """ test renaming a linked tag changes the ETag of the recipe """
+        tag = Tag.objects.create(user=self.user, name='vegan')
+        self.recipe.tags.add(tag)
+        etag = self.client.get(detail_url(self.recipe.id))['ETag']
+        tag.name = 'vegetarian'
+        tag.save()
+
+        res = self.client.get(detail_url(self.recipe.id), HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['tags'][0]['name'], 'vegetarian')
+
+    def test_update_if_match(self):
+        """ test updating with the current ETag succeeds and returns the new one """
+        etag = self.client.get(detail_url(self.recipe.id))['ETag']
+
+        res = self.client.patch(detail_url(self.recipe.id), {'title': 'new title'}, HTTP_IF_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res['ETag'], etag)
+        self.assertEqual(self.client.get(detail_url(self.recipe.id))['ETag'], res['ETag'])
+
+    def test_update_if_match_stale(self):
+        """ test updating with an outdated ETag fails without changing the recipe """
+        etag = self.client.get(detail_url(self.recipe.id))['ETag']
+        self.client.patch(detail_url(self.recipe.id), {'title': 'first update'})
+
+        res = self.client.put(
+            detail_url(self.recipe.id),
+            {'title': 'second update', 'time_minutes': 5, 'price': Decimal('1.00')},
+            HTTP_IF_MATCH=etag,
+        )
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(res.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        self.assertEqual(self.recipe.title, 'first update')
+
+    def test_invalid_id_not_found(self):
+        """ test a recipe id that is not a number is not found, also with conditional headers """
+        url = reverse('recipe-detail', args=['abc'])
+
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH='"anything"').status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.patch(url, {'title': 'new'}).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.put(url, {'title': 'new', 'time_minutes': 5, 'price': '1.00'}).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_other_user_recipe_not_found(self):
+        """ test conditional requests do not reveal recipes of other users """
+        user2 = get_user_model().objects.create_user(email='test2@email.com', password='testpassword')
+        recipe = create_recipe(user=user2)
+
+        res = self.client.get(detail_url(recipe.id), HTTP_IF_NONE_MATCH='"anything"')
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class ConditionalCommitTest(TransactionTestCase):
+    """ test conditional requests racing with writes in other transactions """
+    def setUp(self) -> None:
+        cache.clear()
+        self.user = get_user_model().objects.create_user(email='test@email.com', password='testpassword')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.recipe = create_recipe(user=self.user)
+
+    def test_list_etag_before_commit(self):
+        """ test the list ETag given before a write commits does not match the list after it """
+        with transaction.atomic():
+            create_recipe(user=self.user)
+            etag = self.client.get(RECIPE_URL)['ETag']
+
+        res = self.client.get(RECIPE_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data['results']), 2)
+
+    @skipUnless(connection.vendor == 'postgresql', 'sqlite runs one write transaction at a time')
+    def test_concurrent_updates_if_match(self):
+        """ test only one of two updates sent at once with the same ETag is applied """
+        etag = self.client.get(detail_url(self.recipe.id))['ETag']
+        statuses = []
+
+        def update(title):
+            client = APIClient()
+            client.force_authenticate(user=self.user)
+            try:
+                statuses.append(client.patch(detail_url(self.recipe.id), {'title': title}, HTTP_IF_MATCH=etag).status_code)
+            finally:
+                connections.close_all()
+
+        with transaction.atomic():
+            # hold the row until both updates wait for it
+            Recipe.objects.select_for_update().get(id=self.recipe.id)
+            updates = [threading.Thread(target=update, args=[f'update {i}']) for i in range(2)]
+            for thread in updates:
+                thread.start()
+            with connections['default'].cursor() as cursor:
+                for _ in range(500):
+                    cursor.execute("SELECT count(*) FROM pg_stat_activity WHERE wait_event_type = 'Lock'")
+                    if cursor.fetchone()[0] == 2:
+                        break
+                    time.sleep(0.01)
+        for thread in updates:
+            thread.join()
+
+        self.assertEqual(sorted(statuses), [status.HTTP_200_OK, status.HTTP_412_PRECONDITION_FAILED])
+
@@ -0,0 +1,93 @@
+import csv
+import io
+import json
+
+from rest_framework.test import APIClient, APITestCase
+from rest_framework import status
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from decimal import Decimal
+
+from core.models import Recipe, Tag, Ingredient
+
+EXPORT_URL = reverse('recipe-export')
+
+
+def create_recipe(user, **params):
+    defaults = {'title': 'test recipe', 'time_minutes': 7, 'price': Decimal('7.9'), 'description': 'test'}
+    defaults.update(params)
+    return Recipe.objects.create(user=user, **defaults)
+
+
+def read(res):
+    return b''.join(res.streaming_content).decode()
+
+
+class RecipeExportApiTest(APITestCase):
+    """ test the streaming export of the recipes of a user """
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(email='test@email.com', password='testpassword')
+        self.client.force_authenticate(user=self.user)
+        self.recipes = [create_recipe(user=self.user, title=f'recipe {i}') for i in range(5)]
+        self.recipes[0].tags.add(Tag.objects.create(user=self.user, name='vegan'), Tag.objects.create(user=self.user, name='fast'))
+        self.recipes[1].ingredients.add(Ingredient.objects.create(user=self.user, name='salt'))
+
+    def test_export_ndjson(self):
+        """ test exporting one json document per recipe, in id order """
+        res = self.client.get(EXPORT_URL, {'format': 'ndjson'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res.streaming)
+        self.assertEqual(res['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        rows = [json.loads(line) for line in read(res).splitlines()]
+        self.assertEqual([row['id'] for row in rows], [recipe.id for recipe in self.recipes])
+        self.assertEqual(rows[0]['price'], '7.90')
+        self.assertEqual(sorted(tag['name'] for tag in rows[0]['tags']), ['fast', 'vegan'])
+        self.assertEqual(rows[1]['ingredients'][0]['name'], 'salt')
+
+    def test_export_csv(self):
+        """ test exporting a csv with a header and the names of tags and ingredients """
+        res = self.client.get(EXPORT_URL, {'format': 'csv'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['Content-Disposition'], 'attachment; filename="recipes.csv"')
+        rows = list(csv.DictReader(io.StringIO(read(res))))
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(sorted(rows[0]['tags'].split('|')), ['fast', 'vegan'])
+        self.assertEqual(rows[1]['ingredients'], 'salt')
+        self.assertEqual(rows[2]['tags'], '')
+
+    def test_export_limited_to_user(self):
+        """ test the export only holds recipes of the authenticated user """
+        user2 = get_user_model().objects.create_user(email='test2@email.com', password='testpassword')
+        create_recipe(user=user2, title='other')
+
+        lines = read(self.client.get(EXPORT_URL, {'format': 'ndjson'})).splitlines()
+
+        self.assertEqual(len(lines), 5)
+
+    def test_export_prefetches_by_chunk(self):
+        """ test tags and ingredients are fetched once per chunk, not once per recipe """
+        with self.settings(EXPORT_CHUNK_SIZE=2):
+            res = self.client.get(EXPORT_URL, {'format': 'ndjson'})
+            with CaptureQueriesContext(connection) as ctx:
+                lines = read(res).splitlines()
+
+        self.assertEqual(len(lines), 5)
+        # the recipes themselves come from one cursor, fetched chunk by chunk
+        self.assertEqual(len(ctx), 1 + 2 * 3)
+
+    def test_export_unknown_format(self):
+        """ test an unsupported format is not found """
+        res = self.client.get(EXPORT_URL, {'format': 'xml'})
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_export_auth_required(self):
+        """ test the export needs authentication """
+        res = APIClient().get(EXPORT_URL, {'format': 'csv'})
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
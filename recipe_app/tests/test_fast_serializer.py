@@ -0,0 +1,106 @@
+import os
+import random
+import time
+from decimal import Decimal
+from itertools import combinations
+from unittest import skipUnless
+
+from django.contrib.auth import get_user_model
+from django.db.models import Prefetch
+from django.test import TestCase
+from rest_framework.renderers import JSONRenderer
+
+from core.models import Recipe, Tag, Ingredient
+from recipe_app.fast import row_serializer
+from recipe_app.serializers import RecipeSerializer, RecipeDetailSerializer
+
+
+def create_library(user, rng, recipes):
+    """ create recipes of random prices and descriptions linked to random tags and ingredients """
+    tags = Tag.objects.bulk_create(Tag(user=user, name=f'tag {i}') for i in range(20))
+    ingredients = Ingredient.objects.bulk_create(Ingredient(user=user, name=f'ingredient {i}') for i in range(50))
+    for i in range(recipes):
+        recipe = Recipe.objects.create(
+            user=user, title=f'recipe {i}', time_minutes=rng.randint(1, 600),
+            price=Decimal(rng.randint(0, 99999)) / 100, description=rng.choice(['', 'slow cooked']),
+            link=rng.choice(['', 'https://example.com/recipe']),
+        )
+        recipe.tags.set(rng.sample(tags, rng.randint(0, 4)))
+        recipe.ingredients.set(rng.sample(ingredients, rng.randint(0, 8)))
+
+
+def recipe_instances(user):
+    """ the recipes as the model serializers read them, with the relations in the order of the row serializer """
+    return Recipe.objects.filter(user=user).order_by('id').prefetch_related(
+        Prefetch('tags', queryset=Tag.objects.order_by('id')),
+        Prefetch('ingredients', queryset=Ingredient.objects.order_by('id')),
+    )
+
+
+class RecipeRowSerializerTest(TestCase):
+    """ test the row serializer renders the same bytes as the model serializers """
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(email='test@email.com', password='testpassword')
+        create_library(cls.user, random.Random(19), 30)
+
+    def assertSameOutput(self, serializer_class, fields=None, expand=None):
+        expected = serializer_class(recipe_instances(self.user), many=True, fields=fields, expand=expand).data
+        serializer = row_serializer(serializer_class, fields, expand)
+        rows = serializer.serialize(serializer.values(Recipe.objects.filter(user=self.user).order_by('id')))
+
+        self.assertEqual(JSONRenderer().render(rows), JSONRenderer().render(expected))
+
+    def test_full_output(self):
+        """ test the list and detail output without fields or expand """
+        for serializer_class in (RecipeSerializer, RecipeDetailSerializer):
+            with self.subTest(serializer_class=serializer_class.__name__):
+                self.assertSameOutput(serializer_class)
+
+    def test_random_fields_and_expand(self):
+        """ test random combinations of fields and expand """
+        rng = random.Random(42)
+        fields = RecipeDetailSerializer.Meta.fields
+        expands = [list(names) for size in range(3) for names in combinations(RecipeSerializer.expandable, size)]
+        for _ in range(25):
+            serializer_class = rng.choice([RecipeSerializer, RecipeDetailSerializer])
+            chosen = rng.sample(serializer_class.Meta.fields, rng.randint(1, len(serializer_class.Meta.fields)))
+            chosen = [name for name in fields if name in chosen]
+            expand = rng.choice(expands + [None])
+            with self.subTest(serializer_class=serializer_class.__name__, fields=chosen, expand=expand):
+                self.assertSameOutput(serializer_class, chosen, expand)
+
+    def test_no_rows(self):
+        """ test an empty page runs no link queries """
+        serializer = row_serializer(RecipeDetailSerializer)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(serializer.serialize([]), [])
+
+
+@skipUnless(os.environ.get('RUN_BENCHMARKS'), 'set RUN_BENCHMARKS=1 to run the benchmarks')
+class RecipeSerializationBenchmark(TestCase):
+    """ compare the rows per second of the model serializer and the row serializer on a page of recipes """
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(email='bench@email.com', password='testpassword')
+        create_library(cls.user, random.Random(42), int(os.environ.get('BENCHMARK_RECIPES', 500)))
+
+    def best_rate(self, serialize, runs=5):
+        timings = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            count = len(serialize())
+            timings.append(time.perf_counter() - start)
+        return count / min(timings)
+
+    def test_detail_serialization(self):
+        """ benchmark reading and serializing every recipe with its tags and ingredients """
+        serializer = row_serializer(RecipeDetailSerializer)
+        recipes = Recipe.objects.filter(user=self.user).order_by('id')
+
+        model_rate = self.best_rate(lambda: RecipeDetailSerializer(recipe_instances(self.user), many=True).data)
+        row_rate = self.best_rate(lambda: serializer.serialize(serializer.values(recipes)))
+
+        print(f'\ndetail serialization: model serializer {model_rate:.0f} rows/s, row serializer {row_rate:.0f} rows/s')
+        self.assertGreater(row_rate, model_rate)
@@ -0,0 +1,84 @@
+import os
+import random
+import time
+from decimal import Decimal
+from unittest import skipUnless
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+
+from core.models import Recipe, Tag, Ingredient
+from recipe_app.filters import filter_linked
+
+RECIPES = int(os.environ.get('BENCHMARK_RECIPES', 100_000))
+PAGE = 50
+
+
+def best_time(queryset, runs=5):
+    """ return the best time of fetching the first page of the recipe list, and its ids """
+    queryset = queryset.only('id', 'title', 'time_minutes', 'price').order_by('-id')
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        ids = [recipe.id for recipe in queryset[:PAGE]]
+        timings.append(time.perf_counter() - start)
+    return min(timings), ids
+
+
+@skipUnless(os.environ.get('RUN_BENCHMARKS'), 'set RUN_BENCHMARKS=1 to run the benchmarks')
+class RecipeFilterBenchmark(TestCase):
+    """ compare the EXISTS tag/ingredient filters with the JOIN + DISTINCT ones on a large library """
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(42)
+        cls.user = get_user_model().objects.create_user(email='bench@email.com', password='testpassword')
+        tags = Tag.objects.bulk_create(Tag(user=cls.user, name=f'tag {i}') for i in range(100))
+        ingredients = Ingredient.objects.bulk_create(Ingredient(user=cls.user, name=f'ingredient {i}') for i in range(500))
+        Recipe.objects.bulk_create(
+            (Recipe(user=cls.user, title=f'recipe {i}', time_minutes=10, price=Decimal('9.90')) for i in range(RECIPES)),
+            batch_size=5000,
+        )
+        recipe_ids = Recipe.objects.values_list('id', flat=True)
+        Recipe.tags.through.objects.bulk_create(
+            (Recipe.tags.through(recipe_id=pk, tag_id=tag.id) for pk in recipe_ids for tag in rng.sample(tags, 3)),
+            batch_size=5000,
+        )
+        Recipe.ingredients.through.objects.bulk_create(
+            (Recipe.ingredients.through(recipe_id=pk, ingredient_id=ing.id) for pk in recipe_ids for ing in rng.sample(ingredients, 6)),
+            batch_size=5000,
+        )
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+        cls.tag_ids = [tag.id for tag in tags[:3]]
+        cls.ingredient_ids = [ing.id for ing in ingredients[:2]]
+
+    def _report(self, name, join, exists):
+        join_time, join_ids = best_time(join)
+        exists_time, exists_ids = best_time(exists)
+        if os.environ.get('BENCHMARK_EXPLAIN'):
+            print(join.order_by('-id')[:PAGE].explain(), exists.order_by('-id')[:PAGE].explain(), sep='\n\n')
+        print(f'\n{name}: join+distinct {join_time * 1000:.1f}ms, exists {exists_time * 1000:.1f}ms')
+        self.assertEqual(join_ids, exists_ids)
+
+    def test_any_tags(self):
+        """ benchmark recipes having any of the tags """
+        recipes = Recipe.objects.filter(user=self.user)
+        join = recipes.filter(tags__id__in=self.tag_ids).distinct()
+        exists = filter_linked(recipes, 'tags', self.tag_ids)
+
+        self._report('any tags', join, exists)
+
+    def test_all_tags_and_ingredients(self):
+        """ benchmark recipes having all the tags and ingredients """
+        recipes = Recipe.objects.filter(user=self.user)
+        join = recipes
+        for pk in self.tag_ids[:2]:
+            join = join.filter(tags__id=pk)
+        for pk in self.ingredient_ids[:1]:
+            join = join.filter(ingredients__id=pk)
+        exists = filter_linked(recipes, 'tags', self.tag_ids[:2], match_all=True)
+        exists = filter_linked(exists, 'ingredients', self.ingredient_ids[:1], match_all=True)
+
+        self._report('all tags and ingredients', join.distinct(), exists)
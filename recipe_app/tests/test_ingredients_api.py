@@ -4,8 +4,8 @@ from django.contrib.auth import get_user_model
 from django.urls import reverse
 from decimal import Decimal
 
-from core.models import Ingredient
-from recipe_app.serializers import IngredientSerialize
+from core.models import Ingredient, Recipe
+from recipe_app.serializers import IngredientDetailSerializer
 
 INGREDIENT_URL = reverse('ingredient-list')
 
@@ -43,10 +43,10 @@ class PrivateIngredientsApiTest(APITestCase):
 
         res = self.client.get(INGREDIENT_URL)
         ingredients = Ingredient.objects.all()
-        serializer = IngredientSerialize(ingredients, many=True)
+        serializer = IngredientDetailSerializer(ingredients, many=True)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
     
     def test_ingredients_filter_to_user(self):
         """ test list of ingrefients is limited for user """
@@ -56,13 +56,13 @@ class PrivateIngredientsApiTest(APITestCase):
 
         res = self.client.get(INGREDIENT_URL)
         ingredients = Ingredient.objects.filter(user=self.user)
-        serializer = IngredientSerialize(ingredients, many=True)
+        serializer = IngredientDetailSerializer(ingredients, many=True)
         
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(res.data), 1)
-        self.assertEqual(res.data[0]['name'], ingredient.name)
-        self.assertEqual(res.data[0]['id'], ingredient.id)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(len(res.data['results']), 1)
+        self.assertEqual(res.data['results'][0]['name'], ingredient.name)
+        self.assertEqual(res.data['results'][0]['id'], ingredient.id)
+        self.assertEqual(res.data['results'], serializer.data)
     
     def test_update_ingredient(self):
         """ test update a ingredient """
@@ -90,3 +90,14 @@ class PrivateIngredientsApiTest(APITestCase):
 
     
     
+
+    def test_filter_assigned_only(self):
+        """ test listing only the ingredients assigned to a recipe, with their recipe count """
+        salt = Ingredient.objects.create(user=self.user, name='salt')
+        Ingredient.objects.create(user=self.user, name='pepper')
+        recipe = Recipe.objects.create(user=self.user, title='eggs', time_minutes=5, price=Decimal('4.50'))
+        recipe.ingredients.add(salt)
+
+        res = self.client.get(INGREDIENT_URL, {'assigned_only': 1})
+
+        self.assertEqual(res.data['results'], [{'id': salt.id, 'name': 'salt', 'recipe_count': 1}])
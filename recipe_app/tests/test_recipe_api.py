@@ -1,11 +1,16 @@
 from rest_framework.test import APIClient, APITestCase
 from rest_framework import status
 from django.contrib.auth import get_user_model
+from django.db import connection
+from django.db.models.signals import m2m_changed
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from decimal import Decimal
+from unittest.mock import patch
 
 from core.models import Recipe, Tag, Ingredient
-from recipe_app.serializers import RecipeSerializer, RecipeDetailSerializer
+from recipe_app.pagination import RecipeCursorPagination
+from recipe_app.serializers import RecipeSerializer, RecipeDetailSerializer, get_or_create_by_name
 
 
 RECIPE_URL = reverse('recipe-list')
@@ -51,11 +56,11 @@ class PrivateRecipeAPITest(APITestCase):
         create_recipe(user=self.user)
 
         res = self.client.get(RECIPE_URL)
-        recipes = Recipe.objects.all()
+        recipes = Recipe.objects.order_by('-id')
         serializer = RecipeSerializer(recipes, many=True)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
     
     def test_list_recipe_limited_to_user(self):
         """ test list of recipes is limited to authenticated user """
@@ -69,8 +74,8 @@ class PrivateRecipeAPITest(APITestCase):
         serializer = RecipeSerializer(recipes, many=True)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(res.data), 1)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(len(res.data['results']), 1)
+        self.assertEqual(res.data['results'], serializer.data)
     
     def test_recipe_detail(self):
         """ get recipe detail """
@@ -323,15 +328,15 @@ class PrivateRecipeAPITest(APITestCase):
         r2 = create_recipe(user=self.user, title='aubergine with tahini')
         r2.tags.add(tag2)
 
-        params = {'tags': f'{tag1.name}'}
+        params = {'tags': f'{tag1.id}'}
         res = self.client.get(RECIPE_URL, params)
 
         s1 = RecipeSerializer(r1)
         s2 = RecipeSerializer(r2)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertIn(s1.data, res.data)
-        self.assertNotIn(s2.data, res.data)
+        self.assertIn(s1.data, res.data['results'])
+        self.assertNotIn(s2.data, res.data['results'])
     
     def test_recipe_filter_by_ingredients(self):
         """ test filter recipe by tags """
@@ -342,12 +347,412 @@ class PrivateRecipeAPITest(APITestCase):
         r2 = create_recipe(user=self.user, title='chicken cacciatore')
         r2.ingredients.add(ing2)
 
-        params = {'ingredients': f'{ing1.name}'}
+        params = {'ingredients': f'{ing1.id}'}
         res = self.client.get(RECIPE_URL, params)
 
         s1 = RecipeSerializer(r1)
         s2 = RecipeSerializer(r2)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertIn(s1.data, res.data)
-        self.assertNotIn(s2.data, res.data)
+        self.assertIn(s1.data, res.data['results'])
+        self.assertNotIn(s2.data, res.data['results'])
+
+    def test_recipe_filter_by_any_tag(self):
+        """ test filter recipes having any of the tags, without duplicates """
+        tag1 = Tag.objects.create(user=self.user, name='vegan')
+        tag2 = Tag.objects.create(user=self.user, name='dinner')
+        r1 = create_recipe(user=self.user, title='tofu bowl')
+        r1.tags.add(tag1, tag2)
+        r2 = create_recipe(user=self.user, title='bean stew')
+        r2.tags.add(tag2)
+        create_recipe(user=self.user, title='steak')
+
+        res = self.client.get(RECIPE_URL, {'tags': f'{tag1.id},{tag2.id}'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['id'] for item in res.data['results']], [r2.id, r1.id])
+
+    def test_recipe_filter_by_all_tags_and_ingredients(self):
+        """ test filter recipes having all the tags and ingredients """
+        tag1 = Tag.objects.create(user=self.user, name='vegan')
+        tag2 = Tag.objects.create(user=self.user, name='dinner')
+        ing = Ingredient.objects.create(user=self.user, name='tofu')
+        r1 = create_recipe(user=self.user, title='tofu bowl')
+        r1.tags.add(tag1, tag2)
+        r1.ingredients.add(ing)
+        r2 = create_recipe(user=self.user, title='tofu salad')
+        r2.tags.add(tag1)
+        r2.ingredients.add(ing)
+        r3 = create_recipe(user=self.user, title='bean stew')
+        r3.tags.add(tag1, tag2)
+
+        params = {'tags': f'{tag1.id},{tag2.id}', 'ingredients': f'{ing.id}', 'match': 'all'}
+        res = self.client.get(RECIPE_URL, params)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['id'] for item in res.data['results']], [r1.id])
+
+    def test_recipe_filter_invalid_ids(self):
+        """ test filtering with ids that are not numbers """
+        res = self.client.get(RECIPE_URL, {'tags': 'vegan'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_recipe_filter_empty_ids(self):
+        """ test filtering with a list without any id is rejected """
+        res = self.client.get(RECIPE_URL, {'tags': ','})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('tags', res.data)
+
+    def test_recipe_filter_invalid_match(self):
+        """ test a match other than any or all is rejected, not taken for any """
+        tag = Tag.objects.create(user=self.user, name='vegan')
+
+        res = self.client.get(RECIPE_URL, {'tags': f'{tag.id}', 'match': 'al'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('match', res.data)
+        self.assertEqual(self.client.get(RECIPE_URL, {'tags': f'{tag.id}', 'match': 'any'}).status_code, status.HTTP_200_OK)
+
+    def test_recipes_paginated_by_cursor(self):
+        """ test walking the recipe list page by page """
+        recipes = [create_recipe(user=self.user, title=f'recipe {i}') for i in range(5)]
+
+        res = self.client.get(RECIPE_URL, {'page_size': 2})
+        ids = [item['id'] for item in res.data['results']]
+        while res.data['next']:
+            res = self.client.get(res.data['next'])
+            ids += [item['id'] for item in res.data['results']]
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(ids, [recipe.id for recipe in reversed(recipes)])
+
+    def test_recipes_page_size_limited(self):
+        """ test the requested page size is capped to the maximum """
+        for i in range(3):
+            create_recipe(user=self.user, title=f'recipe {i}')
+
+        with patch.object(RecipeCursorPagination, 'max_page_size', 2):
+            res = self.client.get(RECIPE_URL, {'page_size': 100})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data['results']), 2)
+        self.assertIsNotNone(res.data['next'])
+
+    def test_search_recipes(self):
+        """ test searching recipes over title, description, tags and ingredients """
+        r1 = create_recipe(user=self.user, title='thai curry', description='spicy')
+        r2 = create_recipe(user=self.user, title='pasta', description='a creamy curry sauce')
+        r3 = create_recipe(user=self.user, title='soup', description='warm')
+        r3.tags.add(Tag.objects.create(user=self.user, name='curry'))
+        r4 = create_recipe(user=self.user, title='rice', description='plain')
+        r4.ingredients.add(Ingredient.objects.create(user=self.user, name='curry'))
+        create_recipe(user=self.user, title='salad', description='fresh')
+
+        res = self.client.get(RECIPE_URL, {'search': 'curry'})
+        ids = [item['id'] for item in res.data['results']]
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(ids[0], r1.id)
+        self.assertEqual(ids[-1], r2.id)
+        self.assertCountEqual(ids, [r1.id, r2.id, r3.id, r4.id])
+
+    def test_search_recipes_all_words(self):
+        """ test every word of the search must match the recipe """
+        r1 = create_recipe(user=self.user, title='chicken curry')
+        r1.tags.add(Tag.objects.create(user=self.user, name='dinner'))
+        r1.tags.add(Tag.objects.create(user=self.user, name='curry'))
+        create_recipe(user=self.user, title='chicken soup')
+
+        res = self.client.get(RECIPE_URL, {'search': 'chicken curry'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['id'] for item in res.data['results']], [r1.id])
+
+    def test_search_websearch_syntax(self):
+        """ test stop words, plurals, or, -word and "phrases" give the same recipes on every database """
+        tomato = create_recipe(user=self.user, title='tomato pasta', description='with cheese')
+        sauce = create_recipe(user=self.user, title='tomato sauce', description='plain')
+        curry = create_recipe(user=self.user, title='thai curry', description='sauce with tomato')
+
+        for text, recipes in [
+            ('the pasta', [tomato]),
+            ('tomatoes', [tomato, sauce, curry]),
+            ('tomato -cheese', [sauce, curry]),
+            ('pasta or curry', [tomato, curry]),
+            ('"tomato sauce"', [sauce]),
+            ('the', []),
+        ]:
+            with self.subTest(text=text):
+                res = self.client.get(RECIPE_URL, {'search': text})
+                self.assertCountEqual([item['id'] for item in res.data['results']], [recipe.id for recipe in recipes])
+
+    def test_search_recipes_limited_to_user(self):
+        """ test searching does not return recipes of other users """
+        user2 = create_user(email='test2@email.com', password='testpassword2')
+        create_recipe(user=user2, title='lemon pie')
+
+        res = self.client.get(RECIPE_URL, {'search': 'lemon'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['results'], [])
+
+    def test_search_results_paginated(self):
+        """ test walking the pages of a search keeps the relevance order without repeating recipes """
+        recipes = [create_recipe(user=self.user, title=f'cake {i}', description='sweet') for i in range(3)]
+        recipes += [create_recipe(user=self.user, title=f'pie {i}', description='cake batter') for i in range(3)]
+
+        res = self.client.get(RECIPE_URL, {'search': 'cake', 'page_size': 2})
+        ids = [item['id'] for item in res.data['results']]
+        while res.data['next']:
+            res = self.client.get(res.data['next'])
+            ids += [item['id'] for item in res.data['results']]
+
+        self.assertEqual(ids, [recipe.id for recipe in reversed(recipes[:3])] + [recipe.id for recipe in reversed(recipes[3:])])
+
+
+class RecipeQueryBudgetTest(APITestCase):
+    """ test the number of queries of each recipe action does not grow with the data """
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.user = create_user(email='test@email.com', password='testpassword')
+        self.client.force_authenticate(user=self.user)
+
+    def _create_recipes(self, count):
+        """ create recipes with tags and ingredients """
+        for i in range(count):
+            recipe = create_recipe(user=self.user, title=f'recipe {i}')
+            recipe.tags.add(Tag.objects.create(user=self.user, name=f'tag {i}'))
+            recipe.ingredients.add(Ingredient.objects.create(user=self.user, name=f'ingredient {i}'))
+
+    def test_list_query_budget(self):
+        """ test listing recipes uses a fixed number of queries """
+        self._create_recipes(10)
+
+        with self.assertNumQueries(3):
+            res = self.client.get(RECIPE_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data['results']), 10)
+
+    def test_next_page_query_budget(self):
+        """ test a later page costs the same number of queries as the first one """
+        self._create_recipes(10)
+        first = self.client.get(RECIPE_URL, {'page_size': 3})
+
+        with self.assertNumQueries(3):
+            res = self.client.get(first.data['next'])
+
+        self.assertEqual(len(res.data['results']), 3)
+
+    def test_retrieve_query_budget(self):
+        """ test retrieving a recipe uses a fixed number of queries """
+        self._create_recipes(3)
+        recipe = Recipe.objects.filter(user=self.user).first()
+
+        with self.assertNumQueries(4):
+            res = self.client.get(detail_url(recipe_id=recipe.id))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_create_query_budget(self):
+        """ test creating a recipe without tags and ingredients """
+        payload = {'title': 'test recipe', 'price': Decimal('6.99'), 'time_minutes': 9}
+
+        with self.assertNumQueries(5):
+            res = self.client.post(RECIPE_URL, payload)
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+
+    def test_update_query_budget(self):
+        """ test updating the fields of a recipe """
+        self._create_recipes(1)
+        recipe = Recipe.objects.get(user=self.user)
+        payload = {'title': 'new title'}
+
+        # the update runs in its own transaction, a savepoint and its release inside the test's
+        with self.assertNumQueries(9):
+            res = self.client.patch(detail_url(recipe_id=recipe.id), payload)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def _count_create_queries(self, tags, ingredients):
+        """ return the number of queries of a recipe creation with the given tags and ingredients """
+        payload = {
+            'title': 'test recipe', 'price': Decimal('6.99'), 'time_minutes': 9,
+            'tags': [{'name': f'tag {i}'} for i in range(tags)],
+            'ingredients': [{'name': f'ingredient {i}'} for i in range(ingredients)],
+        }
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.post(RECIPE_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        return len(queries)
+
+    def test_create_with_tags_query_budget(self):
+        """ test creating a recipe does not depend on the number of tags and ingredients """
+        Tag.objects.create(user=self.user, name='tag 0')
+        Ingredient.objects.create(user=self.user, name='ingredient 1')
+
+        small = self._count_create_queries(tags=2, ingredients=2)
+        large = self._count_create_queries(tags=20, ingredients=30)
+
+        self.assertEqual(small, large)
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 20)
+        self.assertEqual(Ingredient.objects.filter(user=self.user).count(), 30)
+
+    def test_update_with_tags_query_budget(self):
+        """ test replacing the tags of a recipe does not depend on the number of tags """
+        recipe = create_recipe(user=self.user)
+        url = detail_url(recipe_id=recipe.id)
+
+        with CaptureQueriesContext(connection) as small:
+            self.client.patch(url, {'tags': [{'name': f'tag {i}'} for i in range(2)]}, format='json')
+        with CaptureQueriesContext(connection) as large:
+            res = self.client.patch(url, {'tags': [{'name': f'tag {i}'} for i in range(20)]}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(small), len(large))
+        self.assertEqual(recipe.tags.count(), 20)
+
+    def _swap_one_tag(self, tags):
+        """ return the queries of a patch replacing one of the tags of a recipe with a new one """
+        recipe = create_recipe(user=self.user)
+        names = [f'tag {recipe.id} {i}' for i in range(tags)]
+        recipe.tags.add(*(Tag.objects.create(user=self.user, name=name) for name in names))
+        kept = set(Recipe.tags.through.objects.filter(recipe=recipe).exclude(tag__name=names[0]).values_list('id', flat=True))
+        names.append(f'new tag {recipe.id}')
+        payload = {'tags': [{'name': name} for name in names[1:]]}
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.patch(detail_url(recipe_id=recipe.id), payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(sorted(tag['name'] for tag in res.data['tags']), sorted(names[1:]))
+        # the links of the tags kept are neither deleted nor inserted again
+        links = set(Recipe.tags.through.objects.filter(recipe=recipe).values_list('id', flat=True))
+        self.assertTrue(kept < links)
+        return queries
+
+    def test_update_one_tag_query_budget(self):
+        """ test changing one tag costs the same queries on a recipe with few and with many tags """
+        small = self._swap_one_tag(tags=3)
+        large = self._swap_one_tag(tags=30)
+
+        self.assertEqual(len(small), len(large))
+
+    def test_update_same_tags_writes_no_links(self):
+        """ test a patch with the tags the recipe already has does not touch its links """
+        recipe = create_recipe(user=self.user)
+        recipe.tags.add(*(Tag.objects.create(user=self.user, name=f'tag {i}') for i in range(5)))
+        payload = {'tags': [{'name': f'tag {i}'} for i in range(5)]}
+        table = Recipe.tags.through._meta.db_table
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.patch(detail_url(recipe_id=recipe.id), payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        writes = [query['sql'] for query in queries if table in query['sql'] and not query['sql'].startswith('SELECT')]
+        self.assertEqual(writes, [])
+
+    def test_update_tags_signals_changed_links(self):
+        """ test the m2m signals carry only the links removed and added """
+        recipe = create_recipe(user=self.user)
+        tags = [Tag.objects.create(user=self.user, name=f'tag {i}') for i in range(5)]
+        recipe.tags.add(*tags)
+        changes = []
+
+        def receiver(action, pk_set, **kwargs):
+            if action.startswith('post_'):
+                changes.append((action, pk_set))
+
+        m2m_changed.connect(receiver, sender=Recipe.tags.through)
+        try:
+            self.client.patch(detail_url(recipe_id=recipe.id), {'tags': [{'name': 'tag 1'}, {'name': 'tag 2'}, {'name': 'new'}]}, format='json')
+        finally:
+            m2m_changed.disconnect(receiver, sender=Recipe.tags.through)
+
+        new = Tag.objects.get(user=self.user, name='new')
+        self.assertEqual(changes, [('post_remove', {tags[0].id, tags[3].id, tags[4].id}), ('post_add', {new.id})])
+
+
+class GetOrCreateByNameTest(APITestCase):
+    """ test looking up and creating tags and ingredients by name """
+    def setUp(self) -> None:
+        self.user = create_user(email='test@email.com', password='testpassword')
+
+    def test_existing_and_new_names(self):
+        """ test existing objects are reused and new ones created once, in the order given """
+        tag = Tag.objects.create(user=self.user, name='vegan')
+        Tag.objects.create(user=create_user(email='test2@email.com', password='testpassword'), name='fast')
+
+        tags = get_or_create_by_name(Tag, self.user, [{'name': 'fast'}, {'name': 'vegan'}, {'name': 'fast'}])
+
+        self.assertEqual([t.name for t in tags], ['fast', 'vegan'])
+        self.assertEqual(tags[1].id, tag.id)
+        self.assertEqual(tags[0].user_id, self.user.id)
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 2)
+
+    def test_all_existing_names(self):
+        """ test nothing is created when every name exists """
+        Ingredient.objects.create(user=self.user, name='salt')
+
+        ingredients = get_or_create_by_name(Ingredient, self.user, [{'name': 'salt'}])
+
+        self.assertEqual([i.name for i in ingredients], ['salt'])
+        self.assertEqual(Ingredient.objects.count(), 1)
+
+
+class SparseFieldsTest(APITestCase):
+    """ test the fields and expand query params of the recipe reads """
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.user = create_user(email='test@email.com', password='testpassword')
+        self.client.force_authenticate(user=self.user)
+        self.recipe = create_recipe(user=self.user)
+        self.tag = Tag.objects.create(user=self.user, name='vegan')
+        self.recipe.tags.add(self.tag)
+        self.recipe.ingredients.add(Ingredient.objects.create(user=self.user, name='salt'))
+
+    def test_fields_skip_relations(self):
+        """ test only the fields given are returned, without querying the relations left out """
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(RECIPE_URL, {'fields': 'id,title'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['results'], [{'id': self.recipe.id, 'title': self.recipe.title}])
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('"price"', queries[0]['sql'])
+
+    def test_expand(self):
+        """ test the relations not expanded are lists of ids """
+        res = self.client.get(RECIPE_URL, {'expand': 'ingredients'})
+
+        recipe = res.data['results'][0]
+        self.assertEqual(recipe['tags'], [self.tag.id])
+        self.assertEqual(recipe['ingredients'], [{'id': self.recipe.ingredients.get().id, 'name': 'salt'}])
+
+    def test_defaults_unchanged(self):
+        """ test without the params every field is returned and the relations expanded """
+        res = self.client.get(detail_url(self.recipe.id))
+
+        self.assertEqual(res.data, RecipeDetailSerializer(self.recipe).data)
+
+    def test_retrieve_fields(self):
+        """ test the detail fields can be chosen """
+        res = self.client.get(detail_url(self.recipe.id), {'fields': 'description,tags', 'expand': ''})
+
+        self.assertEqual(res.data, {'description': 'test', 'tags': [self.tag.id]})
+
+    def test_unknown_names(self):
+        """ test unknown fields and relations are rejected """
+        res = self.client.get(RECIPE_URL, {'fields': 'id,secret'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('secret', str(res.data['fields']))
+
+        res = self.client.get(RECIPE_URL, {'expand': 'title'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        # the list only has the fields of the list serializer
+        res = self.client.get(RECIPE_URL, {'fields': 'description'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,258 @@
+import io
+import os
+import shutil
+import tempfile
+import threading
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test import TransactionTestCase
+from django.test.utils import override_settings
+from django.urls import reverse
+from PIL import Image
+from rest_framework import status
+from rest_framework.test import APIClient, APITestCase
+
+from core.imaging import render_variants
+from core.models import DiscardedFile, Recipe
+from recipe_app.images import ImagePool, ImageQueueFull, store_variants, variant_name
+from recipe_app.serializers import RecipeDetailSerializer
+
+
+def upload_url(recipe_id):
+    return reverse('recipe-upload-image', args=[recipe_id])
+
+
+def create_recipe(user, **params):
+    defaults = {'title': 'test recipe', 'time_minutes': 7, 'price': Decimal('7.90')}
+    defaults.update(params)
+    return Recipe.objects.create(user=user, **defaults)
+
+
+def image_file(size=(800, 600), mode='RGB', format='JPEG', name='photo.jpg', color='red'):
+    buffer = io.BytesIO()
+    Image.new(mode, size, color).save(buffer, format)
+    buffer.name = name
+    buffer.seek(0)
+    return buffer
+
+
+def use_media_root(test):
+    """ store the files written by the test in a directory removed after it """
+    media_root = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, media_root, True)
+    media_settings = override_settings(MEDIA_ROOT=media_root)
+    media_settings.enable()
+    test.addCleanup(media_settings.disable)
+
+
+class RenderVariantsTest(APITestCase):
+    """ test rendering the webp variants of an image """
+    def test_variants(self):
+        """ test every variant fits in its box, keeping the aspect ratio """
+        variants = render_variants(image_file((1600, 1200)), {'thumbnail': 320, 'large': 1280}, 80)
+
+        sizes = {name: Image.open(io.BytesIO(data)).size for name, data in variants.items()}
+        self.assertEqual(sizes, {'thumbnail': (320, 240), 'large': (1280, 960)})
+        self.assertEqual({Image.open(io.BytesIO(data)).format for data in variants.values()}, {'WEBP'})
+
+    def test_small_image_not_enlarged(self):
+        """ test an image smaller than a box keeps its size """
+        variants = render_variants(image_file((100, 50)), {'thumbnail': 320}, 80)
+
+        self.assertEqual(Image.open(io.BytesIO(variants['thumbnail'])).size, (100, 50))
+
+    def test_transparency_kept(self):
+        """ test a transparent png stays transparent """
+        source = image_file(mode='RGBA', format='PNG', name='photo.png', color=(255, 0, 0, 128))
+
+        variant = Image.open(io.BytesIO(render_variants(source, {'thumbnail': 320}, 80)['thumbnail']))
+
+        self.assertEqual(variant.mode, 'RGBA')
+
+
+@override_settings(IMAGE_WORKERS=0)
+class RecipeImageUploadTest(APITestCase):
+    """ test uploading recipe images, with the variants rendered in the request """
+    def setUp(self) -> None:
+        use_media_root(self)
+        self.user = get_user_model().objects.create_user(email='test@email.com', password='testpassword')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.recipe = create_recipe(self.user)
+
+    def upload(self, recipe_id=None, image=None):
+        return self.client.post(upload_url(recipe_id or self.recipe.id), {'image': image or image_file()}, format='multipart')
+
+    def test_upload_image(self):
+        """ test the image and its variants are stored and returned as urls """
+        res = self.upload()
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['image'], f'/media/{self.recipe.image.name}')
+        self.assertEqual(set(res.data['image_variants']), {'thumbnail', 'large'})
+        self.assertTrue(default_storage.exists(self.recipe.image.name))
+        for variant, name in self.recipe.image_variants.items():
+            self.assertEqual(name, variant_name(self.recipe.image.name, variant))
+            self.assertEqual(res.data['image_variants'][variant], f'/media/{name}')
+            self.assertTrue(default_storage.exists(name))
+
+    def test_detail_lists_variants(self):
+        """ test the detail of the recipe returns the urls, after invalidating its cached response """
+        url = reverse('recipe-detail', args=[self.recipe.id])
+        self.assertIsNone(self.client.get(url).data['image'])
+
+        self.upload()
+        res = self.client.get(url)
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(res.data, RecipeDetailSerializer(self.recipe).data)
+        self.assertEqual(set(res.data['image_variants']), {'thumbnail', 'large'})
+
+    def test_replace_image(self):
+        """ test uploading another image keeps the files of the previous one until they are purged """
+        self.upload()
+        self.recipe.refresh_from_db()
+        previous = [self.recipe.image.name, *self.recipe.image_variants.values()]
+
+        self.upload(image=image_file(name='other.png', format='PNG'))
+
+        self.recipe.refresh_from_db()
+        current = [self.recipe.image.name, *self.recipe.image_variants.values()]
+        self.assertTrue(self.recipe.image.name.endswith('.png'))
+        self.assertTrue(all(default_storage.exists(name) for name in previous))
+        self.assertEqual(set(DiscardedFile.objects.values_list('name', flat=True)), set(previous))
+
+        call_command('purge_images', grace_seconds=0, stdout=io.StringIO())
+
+        self.assertFalse(any(default_storage.exists(name) for name in previous))
+        self.assertTrue(all(default_storage.exists(name) for name in current))
+        self.assertFalse(DiscardedFile.objects.exists())
+
+    def test_purge_keeps_recent_files(self):
+        """ test the discarded files are kept for the grace period """
+        self.upload()
+        self.upload()
+
+        call_command('purge_images', stdout=io.StringIO())
+
+        self.assertEqual(DiscardedFile.objects.count(), 3)
+        self.assertTrue(all(default_storage.exists(name) for name in DiscardedFile.objects.values_list('name', flat=True)))
+
+    def test_delete_recipe_discards_image(self):
+        """ test deleting a recipe discards its image and variants, purged after the grace period """
+        self.upload()
+        self.recipe.refresh_from_db()
+        names = [self.recipe.image.name, *self.recipe.image_variants.values()]
+
+        self.client.delete(reverse('recipe-detail', args=[self.recipe.id]))
+        call_command('purge_images', grace_seconds=0, stdout=io.StringIO())
+
+        self.assertFalse(any(default_storage.exists(name) for name in names))
+
+    def test_upload_queue_full(self):
+        """ test an upload refused because the pool is full leaves the recipe and its image as they were """
+        self.upload()
+        self.recipe.refresh_from_db()
+        image, variants = self.recipe.image.name, self.recipe.image_variants
+        full = ImagePool(workers=1, max_pending=1)
+        full.slots.acquire()
+
+        with self.settings(IMAGE_WORKERS=1), patch('recipe_app.images.pool', full):
+            res = self.upload(image=image_file(name='other.png', format='PNG'))
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(res.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual((self.recipe.image.name, self.recipe.image_variants), (image, variants))
+        self.assertFalse(DiscardedFile.objects.exists())
+        self.assertEqual(sorted(default_storage.listdir('uploads/recipe')[1]), sorted([os.path.basename(image), *(os.path.basename(name) for name in variants.values())]))
+
+    def test_upload_invalid_image(self):
+        """ test a file that is not an image is rejected """
+        res = self.upload(image=ContentFile(b'not an image', name='photo.jpg'))
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(self.recipe.image)
+
+    @override_settings(IMAGE_MAX_UPLOAD_BYTES=100)
+    def test_upload_too_large(self):
+        """ test an image larger than the limit is rejected """
+        res = self.upload()
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('image', res.data)
+
+    def test_upload_other_user_recipe(self):
+        """ test uploading to the recipe of another user is not found """
+        other = get_user_model().objects.create_user(email='other@email.com', password='testpassword')
+
+        res = self.upload(create_recipe(other).id)
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_serve_media(self):
+        """ test the uploaded files are served with a long cache lifetime """
+        variant_url = self.upload().data['image_variants']['thumbnail']
+
+        res = self.client.get(variant_url)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['Content-Type'], 'image/webp')
+        self.assertEqual(res['Cache-Control'], 'public, max-age=31536000, immutable')
+
+
+class ImagePoolTest(TransactionTestCase):
+    """ test rendering the variants in worker processes, stored by the threads of the pool """
+    def setUp(self) -> None:
+        use_media_root(self)
+        self.user = get_user_model().objects.create_user(email='test@email.com', password='testpassword')
+        self.recipe = create_recipe(self.user)
+        self.recipe.image.save('photo.jpg', image_file())
+        self.path = default_storage.path(self.recipe.image.name)
+        self.pool = ImagePool(workers=1, max_pending=1)
+        self.addCleanup(self.pool.shutdown)
+
+    def test_render_in_worker(self):
+        """ test the variants rendered by a worker process are stored and listed on the recipe """
+        self.pool.submit(store_variants, self.path, self.recipe.id, self.user.id, self.recipe.image.name).result(timeout=60)
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(set(self.recipe.image_variants), {'thumbnail', 'large'})
+        self.assertTrue(all(default_storage.exists(name) for name in self.recipe.image_variants.values()))
+
+    def test_replaced_image_variants_dropped(self):
+        """ test the variants of an image replaced while they were rendered are deleted """
+        name = variant_name('uploads/recipe/replaced.jpg', 'thumbnail')
+
+        store_variants({'thumbnail': b'webp'}, self.recipe.id, self.user.id, 'uploads/recipe/replaced.jpg')
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image_variants, {})
+        self.assertFalse(default_storage.exists(name))
+
+    def test_queue_full(self):
+        """ test images are refused while max_pending are waiting or rendered """
+        release = threading.Event()
+        first = self.pool.submit(lambda variants: release.wait(60), self.path)
+
+        with self.assertRaises(ImageQueueFull):
+            self.pool.submit(lambda variants: None, self.path)
+
+        release.set()
+        first.result(timeout=60)
+        self.pool.submit(lambda variants: None, self.path).result(timeout=60)
+
+    def test_worker_failure(self):
+        """ test an image a worker cannot render is logged, and frees its slot """
+        broken = default_storage.path(default_storage.save('uploads/recipe/broken.jpg', ContentFile(b'not an image')))
+
+        with self.assertLogs('recipe.images', 'ERROR'):
+            self.pool.submit(lambda variants: None, broken).result(timeout=60)
+
+        self.pool.submit(lambda variants: None, self.path).result(timeout=60)
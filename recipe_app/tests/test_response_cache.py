@@ -0,0 +1,174 @@
+import threading
+from unittest import skipUnless
+from unittest.mock import patch
+
+from rest_framework.test import APIClient, APITestCase
+from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.db import connection, connections, transaction
+from django.test import TransactionTestCase
+from django.urls import reverse
+from decimal import Decimal
+
+from core.models import Recipe, Tag
+from recipe_app.cache import cache_stats, get_version
+
+RECIPE_URL = reverse('recipe-list')
+TAG_URL = reverse('tag-list')
+
+
+def create_recipe(user, **params):
+    defaults = {'title': 'test recipe', 'time_minutes': 7, 'price': Decimal('7.9')}
+    defaults.update(params)
+    return Recipe.objects.create(user=user, **defaults)
+
+
+def detail_url(recipe_id):
+    return reverse('recipe-detail', args=[recipe_id])
+
+
+class ResponseCacheTest(APITestCase):
+    """ test the per-user response cache of the read endpoints """
+    def setUp(self) -> None:
+        cache.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(email='test@email.com', password='testpassword')
+        self.client.force_authenticate(user=self.user)
+
+    def test_list_served_from_cache(self):
+        """ test a repeated list is served without queries """
+        create_recipe(user=self.user)
+        first = self.client.get(RECIPE_URL)
+
+        with self.assertNumQueries(0):
+            res = self.client.get(RECIPE_URL)
+
+        self.assertEqual(first['X-Cache'], 'MISS')
+        self.assertEqual(res['X-Cache'], 'HIT')
+        self.assertEqual(res.data, first.data)
+        self.assertEqual(cache_stats(), {'hits': 1, 'misses': 1})
+
+    def test_write_seen_by_other_worker(self):
+        """ test a write handled by another worker sharing the cache invalidates the list, no version is kept in the process """
+        create_recipe(user=self.user)
+        self.client.get(RECIPE_URL)
+
+        with patch('recipe_app.cache.cache', caches.create_connection('default')):
+            create_recipe(user=self.user)
+        res = self.client.get(RECIPE_URL)
+
+        self.assertEqual(res['X-Cache'], 'MISS')
+        self.assertEqual(len(res.data['results']), 2)
+
+    def test_query_string_cached_apart(self):
+        """ test different query strings are cached apart """
+        create_recipe(user=self.user)
+        self.client.get(RECIPE_URL)
+
+        res = self.client.get(RECIPE_URL, {'page_size': 1})
+
+        self.assertEqual(res['X-Cache'], 'MISS')
+
+    def test_write_invalidates_list(self):
+        """ test creating a recipe through the api invalidates the cached list """
+        self.client.get(RECIPE_URL)
+        self.client.post(RECIPE_URL, {'title': 'new recipe', 'price': Decimal('5.00'), 'time_minutes': 5})
+
+        res = self.client.get(RECIPE_URL)
+
+        self.assertEqual(res['X-Cache'], 'MISS')
+        self.assertEqual(len(res.data['results']), 1)
+
+    def test_tag_link_invalidates_detail(self):
+        """ test adding a tag to a recipe invalidates its cached detail """
+        recipe = create_recipe(user=self.user)
+        tag = Tag.objects.create(user=self.user, name='vegan')
+        self.client.get(detail_url(recipe.id))
+        recipe.tags.add(tag)
+
+        res = self.client.get(detail_url(recipe.id))
+
+        self.assertEqual(res['X-Cache'], 'MISS')
+        self.assertEqual(res.data['tags'], [{'id': tag.id, 'name': 'vegan'}])
+
+    def test_tag_rename_invalidates_tags(self):
+        """ test renaming a tag invalidates the cached tag list """
+        tag = Tag.objects.create(user=self.user, name='vegan')
+        self.client.get(TAG_URL)
+        self.client.patch(reverse('tag-detail', args=[tag.id]), {'name': 'vegetarian'})
+
+        res = self.client.get(TAG_URL)
+
+        self.assertEqual(res.data['results'][0]['name'], 'vegetarian')
+
+    def test_cache_limited_to_user(self):
+        """ test a user never gets the cached responses of another one """
+        create_recipe(user=self.user)
+        self.client.get(RECIPE_URL)
+        user2 = get_user_model().objects.create_user(email='test2@email.com', password='testpassword')
+        self.client.force_authenticate(user=user2)
+
+        res = self.client.get(RECIPE_URL)
+
+        self.assertEqual(res['X-Cache'], 'MISS')
+        self.assertEqual(res.data['results'], [])
+
+    def test_other_user_write_keeps_cache(self):
+        """ test writes of another user do not invalidate the cached responses """
+        self.client.get(RECIPE_URL)
+        user2 = get_user_model().objects.create_user(email='test2@email.com', password='testpassword')
+        create_recipe(user=user2)
+
+        res = self.client.get(RECIPE_URL)
+
+        self.assertEqual(res['X-Cache'], 'HIT')
+
+
+class ResponseCacheCommitTest(TransactionTestCase):
+    """ test the responses cached while a write is not committed yet are not served after it """
+    def setUp(self) -> None:
+        cache.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(email='test@email.com', password='testpassword')
+        self.client.force_authenticate(user=self.user)
+
+    def test_version_bumped_on_commit(self):
+        """ test a write bumps the version when it is made and again when it commits """
+        with transaction.atomic():
+            create_recipe(user=self.user)
+            during = get_version(self.user.id)
+
+        self.assertNotEqual(get_version(self.user.id), during)
+
+    def test_rolled_back_write_not_bumped_twice(self):
+        """ test a rolled back write does not bump the version on commit """
+        with transaction.atomic():
+            create_recipe(user=self.user)
+            during = get_version(self.user.id)
+            transaction.set_rollback(True)
+
+        self.assertEqual(get_version(self.user.id), during)
+
+    @skipUnless(connection.vendor == 'postgresql', 'sqlite locks the tables written by an open transaction')
+    def test_read_during_write(self):
+        """ test a list read from another connection while a write is open is not served once it commits """
+        responses = []
+
+        def read():
+            try:
+                responses.append(self.client.get(RECIPE_URL))
+            finally:
+                connections.close_all()
+
+        with transaction.atomic():
+            create_recipe(user=self.user)
+            reader = threading.Thread(target=read)
+            reader.start()
+            reader.join()
+
+        res = self.client.get(RECIPE_URL)
+
+        self.assertEqual(len(responses[0].data['results']), 0)
+        self.assertEqual(res['X-Cache'], 'MISS')
+        self.assertEqual(len(res.data['results']), 1)
+
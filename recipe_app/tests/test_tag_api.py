@@ -2,9 +2,10 @@ from rest_framework.test import APIClient, APITestCase
 from rest_framework import status
 from django.urls import reverse
 from django.contrib.auth import get_user_model
+from decimal import Decimal
 
-from core.models import Tag
-from recipe_app.serializers import TagSerializer
+from core.models import Recipe, Tag
+from recipe_app.serializers import TagDetailSerializer
 
 TAG_URL = reverse('tag-list')
 
@@ -41,10 +42,10 @@ class PrivateTagApiTest(APITestCase):
 
         res = self.client.get(TAG_URL)
         tags = Tag.objects.all()
-        serializer = TagSerializer(tags, many=True)
+        serializer = TagDetailSerializer(tags, many=True)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
     
     def test_tags_limited_user(self):
         """ test list tags limited to authenticated user """
@@ -56,9 +57,9 @@ class PrivateTagApiTest(APITestCase):
         res = self.client.get(TAG_URL)
         
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(res.data), 1)
-        self.assertEqual(res.data[0]['name'], tag.name)
-        self.assertEqual(res.data[0]['id'], tag.id)
+        self.assertEqual(len(res.data['results']), 1)
+        self.assertEqual(res.data['results'][0]['name'], tag.name)
+        self.assertEqual(res.data['results'][0]['id'], tag.id)
     
     def test_update_tag(self):
         """ test update a tag """
@@ -73,6 +74,17 @@ class PrivateTagApiTest(APITestCase):
         self.assertEqual(res.status_code, status.HTTP_200_OK)
         self.assertEqual(tag.name, payload['name'])
 
+    def test_update_tag_existing_name(self):
+        """ test renaming a tag to a name the user already has fails """
+        Tag.objects.create(name='vegan', user=self.user)
+        tag = Tag.objects.create(name='tag3', user=self.user)
+
+        res = self.client.patch(detail_url(tag_id=tag.id), {'name': 'vegan'})
+
+        tag.refresh_from_db()
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(tag.name, 'tag3')
+
     def test_delete_tag(self):
         """ test delete a tag """
         tag = Tag.objects.create(name='tag3', user=self.user)
@@ -81,3 +93,49 @@ class PrivateTagApiTest(APITestCase):
         res = self.client.delete(url)
 
         self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+
+    def _link(self, *counts):
+        """ create tags linked to the given number of recipes """
+        tags = []
+        for i, count in enumerate(counts):
+            tag = Tag.objects.create(user=self.user, name=f'tag {i}')
+            for j in range(count):
+                Recipe.objects.create(user=self.user, title=f'recipe {i} {j}', time_minutes=5, price=Decimal('5.00')).tags.add(tag)
+            tags.append(tag)
+        return tags
+
+    def test_recipe_count(self):
+        """ test the tags list the number of recipes using them, without counting them per request """
+        self._link(2, 0)
+
+        with self.assertNumQueries(1):
+            res = self.client.get(TAG_URL)
+
+        self.assertEqual([tag['recipe_count'] for tag in res.data['results']], [2, 0])
+
+    def test_filter_assigned_only(self):
+        """ test listing only the tags assigned to a recipe """
+        used, unused = self._link(1, 0)
+
+        res = self.client.get(TAG_URL, {'assigned_only': 1})
+
+        self.assertEqual([tag['id'] for tag in res.data['results']], [used.id])
+
+    def test_order_by_popularity(self):
+        """ test the most used tags first, ties in creation order, across pages """
+        tags = self._link(1, 3, 0, 3)
+
+        first = self.client.get(TAG_URL, {'ordering': '-recipe_count', 'page_size': 2})
+        second = self.client.get(first.data['next'])
+
+        ids = [tag['id'] for tag in first.data['results'] + second.data['results']]
+        self.assertEqual(ids, [tags[1].id, tags[3].id, tags[0].id, tags[2].id])
+
+    def test_invalid_params(self):
+        """ test unknown orderings and flags are rejected """
+        for params in ({'ordering': 'name'}, {'assigned_only': 'yes'}):
+            with self.subTest(params=params):
+                res = self.client.get(TAG_URL, params)
+
+                self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+                self.assertIn(next(iter(params)), res.data)
@@ -1,7 +1,7 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 
-from . import views
+from . import async_views, views
 
 router = DefaultRouter(trailing_slash=False)
 router.register('recipes', views.RecipeViewSet)
@@ -10,4 +10,11 @@ router.register('ingredients', views.IngredientViewSet)
 
 urlpatterns = [
     path('', include(router.urls)),
+    # the same reads served by async views, see async_views
+    path('async/recipes', async_views.recipe_list, name='async-recipe-list'),
+    path('async/recipes/<int:pk>', async_views.recipe_detail, name='async-recipe-detail'),
+    path('async/tags', async_views.tag_list, name='async-tag-list'),
+    path('async/tags/<int:pk>', async_views.tag_detail, name='async-tag-detail'),
+    path('async/ingredients', async_views.ingredient_list, name='async-ingredient-list'),
+    path('async/ingredients/<int:pk>', async_views.ingredient_detail, name='async-ingredient-detail'),
 ]
@@ -1,53 +1,166 @@
-from rest_framework import viewsets
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import StreamingHttpResponse
+from rest_framework import status, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.mixins import ListModelMixin, UpdateModelMixin, DestroyModelMixin
-from rest_framework.authentication import TokenAuthentication
+from rest_framework.parsers import MultiPartParser
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
 
+from core.db_router import ReplicaReadMixin
 from core.models import Ingredient, Recipe, Tag
-from .serializers import RecipeSerializer, RecipeDetailSerializer, TagSerializer, IngredientSerialize
+from user.authentication import CachedTokenAuthentication, ClaimsJWTAuthentication
+from .autocomplete import autocomplete
+from .cache import CachedListMixin, CachedResponseMixin
+from .conditional import ConditionalRecipeMixin
+from .export import CSVRenderer, NDJSONRenderer, export_recipes
+from .fast import FastReadMixin, row_serializer
+from .filters import filter_linked, parse_flag, parse_ids, parse_int, parse_match, parse_names
+from .pagination import RecipeCursorPagination, RecipeAttrCursorPagination
+from .search import search_recipes
+from .serializers import (
+    RecipeSerializer, RecipeDetailSerializer, RecipeImageSerializer, TagDetailSerializer, IngredientDetailSerializer,
+)
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(ReplicaReadMixin, ConditionalRecipeMixin, CachedResponseMixin, FastReadMixin, viewsets.ModelViewSet):
     serializer_class = RecipeDetailSerializer
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication, ClaimsJWTAuthentication]
     permission_classes = [IsAuthenticated]
-    queryset = Recipe.objects.all()
+    pagination_class = RecipeCursorPagination
+    queryset = Recipe.objects.defer('search_vector')
 
     def get_queryset(self):
         """ retrieve recipes of authenticated user """
         tags = self.request.query_params.get('tags')
         ingredients = self.request.query_params.get('ingredients')
+        search = self.request.query_params.get('search')
+        match_all = parse_match(self.request.query_params.get('match'), 'match')
         queryset = self.queryset
+        if search:
+            queryset = search_recipes(queryset, search)
         if tags:
-            queryset = queryset.filter(tags__name__icontains=tags)
+            queryset = filter_linked(queryset, 'tags', parse_ids(tags, 'tags'), match_all)
         if ingredients:
-            queryset = queryset.filter(ingredients__name__icontains=ingredients)
-        
+            queryset = filter_linked(queryset, 'ingredients', parse_ids(ingredients, 'ingredients'), match_all)
         return queryset.filter(user=self.request.user)
-    
+
+    def sparse_fields(self):
+        """ the (fields, expand) query params of a read, each None when not given """
+        if not hasattr(self, '_sparse_fields'):
+            params = self.request.query_params
+            fields, expand = params.get('fields') or None, params.get('expand')
+            self._sparse_fields = (
+                None if fields is None else parse_names(fields, 'fields', self.get_serializer_class().Meta.fields),
+                None if expand is None else parse_names(expand, 'expand', RecipeSerializer.expandable),
+            )
+        return self._sparse_fields
+
     def get_serializer_class(self):
         """ return serializer class """
         if self.action == 'list':
             return RecipeSerializer
+        if self.action == 'upload_image':
+            return RecipeImageSerializer
         return self.serializer_class
     
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
+    @action(detail=False, methods=['post', 'patch'], url_path='bulk')
+    def bulk(self, request):
+        """ create, or partially update by id, a list of recipes in one transaction """
+        if isinstance(request.data, list) and len(request.data) > settings.API_MAX_BULK_SIZE:
+            raise ValidationError({'non_field_errors': [f'Send at most {settings.API_MAX_BULK_SIZE} recipes at once.']})
+        if request.method == 'POST':
+            serializer = self.get_serializer(data=request.data, many=True)
+            serializer.is_valid(raise_exception=True)
+            serializer.save(user=request.user)
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+        serializer = self.get_serializer(self._bulk_instances(request.data), data=request.data, many=True, partial=True)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(serializer.data)
+
+    @action(detail=True, methods=['post'], url_path='upload-image', parser_classes=[MultiPartParser])
+    def upload_image(self, request, pk=None):
+        """ upload the image of a recipe as multipart `image`, its variants are rendered off the request """
+        serializer = self.get_serializer(self.get_object(), data=request.data)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(serializer.data)
+
+    @action(detail=False, methods=['get'], renderer_classes=[NDJSONRenderer, CSVRenderer])
+    def export(self, request):
+        """ stream every recipe of the user, with its tags and ingredients, as ndjson or csv """
+        renderer = request.accepted_renderer
+        serializer = row_serializer(RecipeDetailSerializer)
+        response = StreamingHttpResponse(
+            export_recipes(self.get_queryset(), serializer, renderer.format, settings.EXPORT_CHUNK_SIZE),
+            content_type=f'{renderer.media_type}; charset={renderer.charset}',
+        )
+        response['Content-Disposition'] = f'attachment; filename="recipes.{renderer.format}"'
+        return response
 
-class BaseRecipeAttrViewSet(ListModelMixin, UpdateModelMixin, DestroyModelMixin, viewsets.GenericViewSet):
+    def _bulk_instances(self, data):
+        """ the recipe of the user named by the id of each item, in the order of the items """
+        if not isinstance(data, list):
+            return []
+        ids = [item.get('id') if isinstance(item, dict) and type(item.get('id')) is int else None for item in data]
+        recipes = self.get_queryset().in_bulk([pk for pk in ids if pk is not None])
+        return [recipes.get(pk) for pk in ids]
+
+
+class BaseRecipeAttrViewSet(ReplicaReadMixin, CachedListMixin, ListModelMixin, UpdateModelMixin, DestroyModelMixin, viewsets.GenericViewSet):
     permission_classes = [IsAuthenticated]
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication, ClaimsJWTAuthentication]
+    pagination_class = RecipeAttrCursorPagination
+
+    # the orderings of the ?ordering= param, the most used first for the popular one
+    orderings = {'id': ('id',), '-recipe_count': ('-recipe_count', 'id')}
 
     def get_queryset(self):
-        return self.queryset.filter(user=self.request.user)
+        """ the tags or ingredients of the user, only the ones used by a recipe with ?assigned_only=1 """
+        queryset = self.queryset.filter(user=self.request.user)
+        params = self.request.query_params
+        if parse_flag(params.get('assigned_only'), 'assigned_only'):
+            queryset = queryset.filter(recipe_count__gt=0)
+        ordering = params.get('ordering')
+        if ordering is not None:
+            if ordering not in self.orderings:
+                raise ValidationError({'ordering': [f'Choose from {", ".join(self.orderings)}.']})
+            queryset = queryset.order_by(*self.orderings[ordering])
+        return queryset
+
+    def perform_update(self, serializer):
+        """ report a rename to a name the user already has as a validation error """
+        try:
+            with transaction.atomic():
+                serializer.save()
+        except IntegrityError:
+            raise ValidationError({'name': ['You already have one with this name.']})
+
+    @action(detail=False, methods=['get'])
+    def autocomplete(self, request):
+        """ the names of the user starting with ?q=, or with a word starting with it, then the similar ones """
+        text = request.query_params.get('q', '').strip()
+        if not text:
+            raise ValidationError({'q': ['This query param is required.']})
+        limit = request.query_params.get('limit')
+        limit = settings.AUTOCOMPLETE_LIMIT if limit is None else parse_int(limit, 'limit', 1, settings.AUTOCOMPLETE_MAX_LIMIT)
+        queryset = self.queryset.filter(user=request.user)
+        rows = autocomplete(queryset, self.queryset.model, request.user.id, text, limit)
+        return Response([{'id': pk, 'name': name, 'recipe_count': count} for pk, name, count in rows])
 
 
 class TagViewSet(BaseRecipeAttrViewSet):
-    serializer_class = TagSerializer
+    serializer_class = TagDetailSerializer
     queryset = Tag.objects.all()
 
 
 class IngredientViewSet(BaseRecipeAttrViewSet):
-    serializer_class = IngredientSerialize
+    serializer_class = IngredientDetailSerializer
     queryset = Ingredient.objects.all()
 
@@ -0,0 +1,113 @@
+import hashlib
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import router
+from django.utils.translation import gettext_lazy as _
+from rest_framework.authentication import TokenAuthentication, get_authorization_header
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+from core.timing import timed
+from .tokens import check_not_revoked, check_revocation, revocation_keys
+
+
+def token_cache_key(key):
+    """ return the cache key of a token, without storing the token itself in the key """
+    return 'auth-token:' + hashlib.sha256(key.encode()).hexdigest()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """ token authentication that keeps valid tokens and their users in the cache for AUTH_TOKEN_CACHE_TTL seconds """
+    def authenticate(self, request):
+        with timed('auth'):
+            return super().authenticate(request)
+
+    def authenticate_credentials(self, key):
+        cache_key = token_cache_key(key)
+        token = cache.get(cache_key)
+        if token is None:
+            user, token = super().authenticate_credentials(key)
+            cache.set(cache_key, token, settings.AUTH_TOKEN_CACHE_TTL)
+            if not self.still_valid(key).exists():
+                cache.delete(cache_key)
+                raise AuthenticationFailed(_('Invalid token.'))
+
+        return (token.user, token)
+
+    def still_valid(self, key):
+        """
+        the token of an active user, checked again once it is cached: a token deleted, or a user
+        deactivated, after it was read is dropped from the cache on commit, before or after it was
+        cached there, so the check sees the change when the drop came first
+        """
+        return self.get_model().objects.filter(key=key, user__is_active=True)
+
+    async def aauthenticate(self, request):
+        """ authenticate a plain django request for async views, None when it has no token """
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(auth) != 2:
+            raise AuthenticationFailed(_('Invalid token header. Token string should not contain spaces.'))
+        try:
+            key = auth[1].decode()
+        except UnicodeError:
+            raise AuthenticationFailed(_('Invalid token header. Token string should not contain invalid characters.'))
+
+        with timed('auth'):
+            cache_key = token_cache_key(key)
+            token = await cache.aget(cache_key)
+            if token is None:
+                try:
+                    token = await self.get_model().objects.select_related('user').aget(key=key)
+                except self.get_model().DoesNotExist:
+                    raise AuthenticationFailed(_('Invalid token.'))
+                if not token.user.is_active:
+                    raise AuthenticationFailed(_('User inactive or deleted.'))
+                await cache.aset(cache_key, token, settings.AUTH_TOKEN_CACHE_TTL)
+                if not await self.still_valid(key).aexists():
+                    await cache.adelete(cache_key)
+                    raise AuthenticationFailed(_('Invalid token.'))
+
+        return (token.user, token)
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    jwt authentication that builds the user from the claims of the access token, without a query,
+    and rejects the tokens revoked in the cache, see user.tokens
+    """
+    # the fields of the user set from the claims, in the order of the model fields, the others are deferred
+    CLAIM_FIELDS = ['id', 'email', 'name', 'is_active', 'is_staff']
+
+    def authenticate(self, request):
+        with timed('auth'):
+            result = super().authenticate(request)
+            if result is not None:
+                check_not_revoked(result[1])
+            return result
+
+    async def aauthenticate(self, request):
+        """ authenticate a plain django request for async views, None when it has no jwt """
+        header = self.get_header(request)
+        raw_token = header and self.get_raw_token(header)
+        if not raw_token:
+            return None
+        with timed('auth'):
+            token = self.get_validated_token(raw_token)
+            check_revocation(token, await cache.aget_many(revocation_keys(token)))
+            return self.get_user(token), token
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[jwt_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+        # deactivated users have their tokens revoked, so a valid token belongs to an active user
+        User = get_user_model()
+        values = [user_id, validated_token.get('email', ''), validated_token.get('name', ''), True, validated_token.get('is_staff', False)]
+        return User.from_db(router.db_for_read(User), self.CLAIM_FIELDS, values)
@@ -1,9 +1,14 @@
 from rest_framework import serializers
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
 from django.contrib.auth import get_user_model, authenticate
 from django.utils.translation import gettext_lazy as _
 
+from core.timing import TimedSerializerMixin
+from .tokens import RefreshToken, check_refresh_not_revoked
 
-class UserSerializer(serializers.ModelSerializer):
+
+class UserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """ serializer for create user """
     class Meta:
         model = get_user_model()
@@ -29,6 +34,8 @@ class TokenSerializer(serializers.Serializer):
     """ serializer for create user token """
     email = serializers.EmailField()
     password = serializers.CharField(style={'input_type': 'password'}, trim_whitespace=False)
+    # token keeps issuing the stored token of old clients, jwt issues an access and refresh pair
+    mode = serializers.ChoiceField(choices=['token', 'jwt'], default='token', write_only=True)
 
     def validate(self, attrs):
         """ validate authenticate user """
@@ -41,3 +48,25 @@ class TokenSerializer(serializers.Serializer):
         
         attrs['user'] = user
         return attrs
+
+
+class RefreshTokenSerializer(serializers.Serializer):
+    """ serializer for a jwt refresh token """
+    refresh = serializers.CharField()
+
+    def validate_refresh(self, value):
+        """ return the refresh token, rejecting expired and revoked ones """
+        try:
+            token = RefreshToken(value)
+        except TokenError as exc:
+            raise InvalidToken(exc.args[0])
+        return token
+
+    def validate(self, attrs):
+        """ add the user of the refresh token, read again so renamed users get their new name in the access token """
+        user = get_user_model().objects.filter(id=attrs['refresh'][jwt_settings.USER_ID_CLAIM], is_active=True).first()
+        if user is None:
+            raise InvalidToken('User not found or inactive.')
+        check_refresh_not_revoked(attrs['refresh'], user)
+        attrs['user'] = user
+        return attrs
@@ -0,0 +1,55 @@
+from functools import partial
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import token_cache_key
+from .tokens import revoke_user_tokens
+
+
+def forget_tokens(keys):
+    """
+    drop tokens from the authentication cache, and again once the write commits: a lookup running
+    before the commit still finds them and caches them again
+    """
+    cache_keys = [token_cache_key(key) for key in keys]
+    cache.delete_many(cache_keys)
+    transaction.on_commit(partial(cache.delete_many, cache_keys))
+
+
+@receiver(post_delete, sender=Token)
+def forget_deleted_token(sender, instance, **kwargs):
+    """ drop a deleted token from the authentication cache """
+    forget_tokens([instance.key])
+
+
+@receiver(pre_save, sender=get_user_model())
+def check_credentials_change(sender, instance, update_fields=None, **kwargs):
+    """ note whether the password or the active flag of an existing user change, which revokes their jwts """
+    fields = {'password', 'is_active'}
+    if instance._state.adding or (update_fields is not None and not fields & set(update_fields)):
+        return
+    saved = sender.objects.filter(pk=instance.pk).values('password', 'is_active').first()
+    instance._credentials_changed = saved is not None and (
+        saved['password'] != instance.password or saved['is_active'] != instance.is_active
+    )
+
+
+@receiver(post_save, sender=get_user_model())
+def forget_user_tokens(sender, instance, created, **kwargs):
+    """ drop the cached tokens of a changed user, so deactivation and new passwords apply at once """
+    if created:
+        return
+    if getattr(instance, '_credentials_changed', False):
+        revoke_user_tokens(instance.pk)
+        instance._credentials_changed = False
+    forget_tokens(Token.objects.filter(user=instance).values_list('key', flat=True))
+
+
+@receiver(post_delete, sender=get_user_model())
+def revoke_deleted_user_tokens(sender, instance, **kwargs):
+    revoke_user_tokens(instance.pk)
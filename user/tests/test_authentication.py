@@ -0,0 +1,107 @@
+from unittest.mock import patch
+
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.test import APITestCase, APIClient
+from rest_framework.authtoken.models import Token
+from rest_framework import status
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.urls import reverse
+
+from user.authentication import token_cache_key
+
+
+ME_URL = reverse('me')
+RECIPE_URL = reverse('recipe-list')
+
+
+class CachedTokenAuthenticationTest(APITestCase):
+    """ test token authentication backed by the cache """
+    def setUp(self) -> None:
+        cache.clear()
+        self.user = get_user_model().objects.create_user(email='test@email.com', password='testpassword', name='testname')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_token_lookup_cached(self):
+        """ test the token is looked up in the database only on the first request """
+        self.client.get(ME_URL)
+
+        with self.assertNumQueries(0):
+            res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['email'], self.user.email)
+
+    def test_invalid_token(self):
+        """ test an unknown token is rejected """
+        self.client.credentials(HTTP_AUTHORIZATION='Token invalid')
+
+        res = self.client.get(RECIPE_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deleted_token_invalidated(self):
+        """ test a deleted token stops working even when cached """
+        self.client.get(ME_URL)
+        self.token.delete()
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_token_cached_before_delete_commits(self):
+        """ test a token cached by a lookup running before its deletion commits is dropped on commit """
+        key = self.token.key
+        with self.captureOnCommitCallbacks(execute=True):
+            self.token.delete()
+            cache.set(token_cache_key(key), Token(key=key, user=self.user), 300)
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_token_deleted_after_lookup(self):
+        """ test a token deleted between its lookup and its caching is not left in the cache """
+        key = self.token.key
+        self.token.delete()
+
+        # the lookup read the token before the deletion committed
+        with patch.object(TokenAuthentication, 'authenticate_credentials', return_value=(self.user, Token(key=key, user=self.user))):
+            res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertIsNone(cache.get(token_cache_key(key)))
+
+    def test_deactivated_user_invalidated(self):
+        """ test the token of a deactivated user stops working even when cached """
+        self.client.get(ME_URL)
+        self.user.is_active = False
+        self.user.save()
+
+        res = self.client.get(RECIPE_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_password_change_invalidated(self):
+        """ test a password change drops the cached user """
+        self.client.get(ME_URL)
+
+        res = self.client.patch(ME_URL, {'password': 'newpassword123'})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        # the token lookup, and its check once cached
+        with self.assertNumQueries(2):
+            res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_profile_change_visible(self):
+        """ test a profile change is not hidden by the cached user """
+        self.client.get(ME_URL)
+        self.user.name = 'new name'
+        self.user.save()
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.data['name'], 'new name')
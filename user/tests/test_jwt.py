@@ -0,0 +1,178 @@
+from datetime import timedelta
+from unittest.mock import patch
+
+from rest_framework.test import APITestCase, APIClient
+from rest_framework import status
+from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.urls import reverse
+from django.utils import timezone
+
+from core.models import DeniedToken, Recipe, Tag
+
+
+TOKEN_URL = reverse('token')
+REFRESH_URL = reverse('token-refresh')
+REVOKE_URL = reverse('token-revoke')
+ME_URL = reverse('me')
+RECIPE_URL = reverse('recipe-list')
+
+
+class JWTAuthenticationTest(APITestCase):
+    """ test the jwt mode of the token endpoint and the authentication with its access tokens """
+    def setUp(self) -> None:
+        cache.clear()
+        self.user = get_user_model().objects.create_user(email='test@email.com', password='testpassword', name='testname')
+        self.client = APIClient()
+
+    def obtain(self, password='testpassword'):
+        res = self.client.post(TOKEN_URL, {'email': 'test@email.com', 'password': password, 'mode': 'jwt'})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return res.data
+
+    def get(self, url, access):
+        return self.client.get(url, HTTP_AUTHORIZATION=f'Bearer {access}')
+
+    def test_token_mode_default(self):
+        """ test old clients still get the stored token """
+        res = self.client.post(TOKEN_URL, {'email': 'test@email.com', 'password': 'testpassword'})
+
+        self.assertEqual(set(res.data), {'token'})
+
+    def test_jwt_pair(self):
+        """ test the jwt mode issues an access and refresh pair """
+        tokens = self.obtain()
+
+        self.assertEqual(set(tokens), {'access', 'refresh'})
+
+    def test_read_without_user_query(self):
+        """ test the user is built from the claims, so a list runs only its own queries """
+        Tag.objects.create(user=self.user, name='vegan')
+        recipe = Recipe.objects.create(user=self.user, title='test recipe', time_minutes=7, price='7.90')
+        access = self.obtain()['access']
+
+        with self.assertNumQueries(3):
+            res = self.get(RECIPE_URL, access)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['id'] for item in res.data['results']], [recipe.id])
+        with self.assertNumQueries(1):
+            res = self.get(reverse('tag-list'), access)
+        self.assertEqual(res.data['results'][0]['name'], 'vegan')
+
+    def test_async_views_accept_jwt(self):
+        """ test the async read views accept the access token """
+        res = self.get(reverse('async-recipe-list'), self.obtain()['access'])
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_refresh_token_not_access(self):
+        """ test a refresh token is not accepted as an access token """
+        res = self.get(RECIPE_URL, self.obtain()['refresh'])
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_refresh_rotates(self):
+        """ test a refresh returns a new pair and revokes the refresh token used """
+        tokens = self.obtain()
+
+        res = self.client.post(REFRESH_URL, {'refresh': tokens['refresh']})
+        again = self.client.post(REFRESH_URL, {'refresh': tokens['refresh']})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.get(RECIPE_URL, res.data['access']).status_code, status.HTTP_200_OK)
+        self.assertEqual(again.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_revoke(self):
+        """ test revoking denies the refresh token and the access token of the request """
+        tokens = self.obtain()
+
+        res = self.client.post(REVOKE_URL, {'refresh': tokens['refresh']}, HTTP_AUTHORIZATION=f'Bearer {tokens["access"]}')
+
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.get(RECIPE_URL, tokens['access']).status_code, status.HTTP_401_UNAUTHORIZED)
+        res = self.client.post(REFRESH_URL, {'refresh': tokens['refresh']})
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_password_change_revokes(self):
+        """ test changing the password revokes the tokens issued before, not the ones issued after """
+        old = self.obtain()
+        self.client.patch(ME_URL, {'password': 'newpassword'}, HTTP_AUTHORIZATION=f'Bearer {old["access"]}')
+
+        new = self.obtain('newpassword')
+
+        self.assertEqual(self.get(RECIPE_URL, old['access']).status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(self.client.post(REFRESH_URL, {'refresh': old['refresh']}).status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(self.get(RECIPE_URL, new['access']).status_code, status.HTTP_200_OK)
+
+    def test_revocations_not_evicted(self):
+        """ test revoked refresh tokens stay revoked when the cache is cleared """
+        revoked, rotated, old = self.obtain(), self.obtain(), self.obtain()
+        self.client.post(REVOKE_URL, {'refresh': revoked['refresh']})
+        self.client.post(REFRESH_URL, {'refresh': rotated['refresh']})
+        self.client.patch(ME_URL, {'password': 'newpassword'}, HTTP_AUTHORIZATION=f'Bearer {old["access"]}')
+
+        cache.clear()
+
+        for tokens in [revoked, rotated, old]:
+            res = self.client.post(REFRESH_URL, {'refresh': tokens['refresh']})
+            self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_expired_denied_tokens_dropped(self):
+        """ test denying a refresh token drops the denied tokens that expired """
+        DeniedToken.objects.create(jti='expired', expires_at=timezone.now() - timedelta(seconds=1))
+
+        self.client.post(REFRESH_URL, {'refresh': self.obtain()['refresh']})
+
+        self.assertFalse(DeniedToken.objects.filter(jti='expired').exists())
+        self.assertEqual(DeniedToken.objects.count(), 1)
+
+    def test_deactivation_revokes(self):
+        """ test deactivating a user revokes their tokens """
+        access = self.obtain()['access']
+        self.user.is_active = False
+        self.user.save()
+
+        res = self.get(RECIPE_URL, access)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_me_deleted_user(self):
+        """ test the profile of a deleted user is refused when the revocation of their tokens is not seen """
+        access = self.obtain()['access']
+        self.user.delete()
+        cache.clear()
+
+        res = self.get(ME_URL, access)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_revocation_seen_by_other_worker(self):
+        """ test a logout handled by another worker sharing the cache revokes the access token """
+        tokens = self.obtain()
+
+        with patch('user.tokens.cache', caches.create_connection('default')):
+            self.client.post(REVOKE_URL, {'refresh': tokens['refresh']}, HTTP_AUTHORIZATION=f'Bearer {tokens["access"]}')
+
+        self.assertEqual(self.get(RECIPE_URL, tokens['access']).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_me_read_from_database(self):
+        """ test the profile is read from the database, and updates keep the password """
+        access = self.obtain()['access']
+
+        res = self.client.patch(ME_URL, {'name': 'new name'}, HTTP_AUTHORIZATION=f'Bearer {access}')
+        me = self.get(ME_URL, access)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(me.data, {'id': self.user.id, 'email': 'test@email.com', 'name': 'new name'})
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password('testpassword'))
+        self.assertEqual(self.get(RECIPE_URL, access).status_code, status.HTTP_200_OK)
+
+    def test_invalid_token(self):
+        """ test a tampered token is rejected """
+        access = self.obtain()['access']
+
+        res = self.get(RECIPE_URL, access[:-2] + 'xx')
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
@@ -0,0 +1,90 @@
+import time
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.utils import timezone
+from rest_framework_simplejwt import tokens
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from core.models import DeniedToken
+
+
+def _denied_key(jti):
+    return f'jwt-denied:{jti}'
+
+
+def _revoked_key(user_id):
+    return f'jwt-revoked-before:{user_id}'
+
+
+class PreciseIssuedAtMixin:
+    """ issue time in fractional seconds, so a revocation tells apart the tokens issued in the same second """
+    def set_iat(self, claim='iat', at_time=None):
+        self.payload[claim] = (at_time or self.current_time).timestamp()
+
+
+class AccessToken(PreciseIssuedAtMixin, tokens.AccessToken):
+    pass
+
+
+class RefreshToken(PreciseIssuedAtMixin, tokens.RefreshToken):
+    access_token_class = AccessToken
+
+
+def tokens_for(user):
+    """ return an access and refresh pair carrying the fields the api needs to build the user without a query """
+    refresh = RefreshToken.for_user(user)
+    refresh['email'] = user.email
+    refresh['name'] = user.name
+    refresh['is_staff'] = user.is_staff
+    return {'access': str(refresh.access_token), 'refresh': str(refresh)}
+
+
+def deny(token):
+    """
+    revoke a token until it expires, the denylist only holds tokens that are still valid; refresh
+    tokens are denied in the database, access tokens, short-lived and checked on every request, in
+    the cache; return whether the token was not denied already
+    """
+    timeout = token['exp'] - time.time()
+    if timeout <= 0:
+        return False
+    if token.token_type != 'refresh':
+        return cache.add(_denied_key(token['jti']), 1, timeout)
+    now = timezone.now()
+    DeniedToken.objects.filter(expires_at__lte=now).delete()
+    return DeniedToken.objects.get_or_create(jti=token['jti'], defaults={'expires_at': now + timedelta(seconds=timeout)})[1]
+
+
+def revoke_user_tokens(user_id):
+    """ revoke every token issued to a user until now, like after a password change """
+    revoked_at = timezone.now()
+    get_user_model().objects.filter(pk=user_id).update(tokens_revoked_at=revoked_at)
+    cache.set(_revoked_key(user_id), revoked_at.timestamp(), api_settings.ACCESS_TOKEN_LIFETIME.total_seconds())
+
+
+def check_refresh_not_revoked(token, user):
+    """ raise InvalidToken when the refresh token was denied, or issued before the tokens of the user were revoked """
+    if DeniedToken.objects.filter(jti=token['jti']).exists():
+        raise InvalidToken('Token has been revoked.')
+    if user.tokens_revoked_at is not None and token['iat'] < user.tokens_revoked_at.timestamp():
+        raise InvalidToken('Token has been revoked.')
+
+
+def revocation_keys(token):
+    return [_denied_key(token['jti']), _revoked_key(token[api_settings.USER_ID_CLAIM])]
+
+
+def check_revocation(token, found):
+    """ raise InvalidToken when the cache entries of revocation_keys revoke the access token """
+    if _denied_key(token['jti']) in found:
+        raise InvalidToken('Token has been revoked.')
+    revoked_before = found.get(_revoked_key(token[api_settings.USER_ID_CLAIM]))
+    if revoked_before is not None and token['iat'] < revoked_before:
+        raise InvalidToken('Token has been revoked.')
+
+
+def check_not_revoked(token):
+    check_revocation(token, cache.get_many(revocation_keys(token)))
@@ -1,11 +1,16 @@
-from rest_framework.generics import CreateAPIView, RetrieveUpdateAPIView
+from rest_framework import status
+from rest_framework.generics import CreateAPIView, GenericAPIView, RetrieveUpdateAPIView
+from rest_framework.authtoken.models import Token
 from rest_framework.authtoken.views import ObtainAuthToken
+from rest_framework.response import Response
 from rest_framework.settings import api_settings
 from django.contrib.auth import get_user_model
 from rest_framework.permissions import IsAuthenticated
-from rest_framework.authentication import TokenAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
 
-from .serializers import UserSerializer, TokenSerializer
+from .authentication import CachedTokenAuthentication, ClaimsJWTAuthentication
+from .serializers import UserSerializer, TokenSerializer, RefreshTokenSerializer
+from .tokens import deny, tokens_for
 
 
 class CreateUserView(CreateAPIView):
@@ -19,14 +24,63 @@ class CreateTokenView(ObtainAuthToken):
     serializer_class = TokenSerializer
     renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
 
+    def post(self, request, *args, **kwargs):
+        """ issue the stored token, or an access and refresh pair in jwt mode """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        user = serializer.validated_data['user']
+        if serializer.validated_data['mode'] == 'jwt':
+            return Response(tokens_for(user))
+        token, _ = Token.objects.get_or_create(user=user)
+        return Response({'token': token.key})
+
+
+class RefreshTokenView(GenericAPIView):
+    """ exchange a refresh token for a new pair, the old refresh token is revoked """
+    serializer_class = RefreshTokenSerializer
+    authentication_classes = []
+
+    def get_authenticate_header(self, request):
+        # answer invalid refresh tokens with 401, rest framework sends 403 from views without authenticators
+        return ClaimsJWTAuthentication().authenticate_header(request)
+
+    def post(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        # denied once, concurrent refreshes with the same token get a single new pair
+        if not deny(serializer.validated_data['refresh']):
+            raise InvalidToken('Token has been revoked.')
+        return Response(tokens_for(serializer.validated_data['user']))
+
+
+class RevokeTokenView(GenericAPIView):
+    """ revoke a refresh token, and the access token the request is authenticated with, like on logout """
+    serializer_class = RefreshTokenSerializer
+    authentication_classes = [ClaimsJWTAuthentication]
+
+    def post(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        deny(serializer.validated_data['refresh'])
+        if request.auth is not None:
+            deny(request.auth)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
 
 class ManageUserView(RetrieveUpdateAPIView):
     """ manage user autenticated """
     serializer_class = UserSerializer
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication, ClaimsJWTAuthentication]
     permission_classes = [IsAuthenticated]
 
     def get_object(self):
         """ retrieve and return the authenticated user """
+        if isinstance(self.request.successful_authenticator, ClaimsJWTAuthentication):
+            # the user built from the claims may be stale and lacks the fields it did not need, or be
+            # gone when the revocation of their tokens has not reached this worker
+            user = get_user_model().objects.filter(id=self.request.user.id, is_active=True).first()
+            if user is None:
+                raise InvalidToken('User not found or inactive.')
+            return user
         return self.request.user
    
\ No newline at end of file